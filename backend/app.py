@@ -1,10 +1,13 @@
 import logging
 import sys
 from pathlib import Path
+from typing import Any, Dict, Optional
 from flask import Flask, send_from_directory
+from werkzeug.serving import is_running_from_reloader
 from flask_cors import CORS
 from backend.config import Config
 from backend.routes import register_routes
+from backend.services.storage_manager import get_storage_manager
 
 
 def setup_logging():
@@ -35,7 +38,13 @@ def setup_logging():
     return root_logger
 
 
-def create_app():
+def create_app(test_config: Optional[Dict[str, Any]] = None):
+    """
+    创建 Flask 应用
+
+    Args:
+        test_config: 覆盖默认配置的项（如测试时传入 {'TESTING': True}）
+    """
     # 设置日志
     logger = setup_logging()
     logger.info("🚀 正在启动 红墨 AI图文生成器...")
@@ -54,6 +63,8 @@ def create_app():
         app = Flask(__name__)
 
     app.config.from_object(Config)
+    if test_config:
+        app.config.update(test_config)
 
     CORS(app, resources={
         r"/api/*": {
@@ -69,6 +80,15 @@ def create_app():
     # 启动时验证配置
     _validate_config_on_startup(logger)
 
+    # 启动后台存储管理（孤立目录清理、存储配额）
+    # 测试时不启动；调试模式下 reloader 的监控进程不处理请求，只在实际服务的子进程中启动
+    if (
+        app.config['STORAGE_MANAGER_ENABLED']
+        and not app.config['TESTING']
+        and (not app.debug or is_running_from_reloader())
+    ):
+        get_storage_manager().start()
+
     # 根据是否有前端构建产物决定根路由行为
     if frontend_dist.exists():
         @app.route('/')
@@ -12,6 +12,56 @@ class Config:
     CORS_ORIGINS = ['http://localhost:5173', 'http://localhost:3000']
     OUTPUT_DIR = 'output'
 
+    # 图片生成调度：进程内所有任务共享的在途请求上限
+    IMAGE_SCHEDULER_MAX_WORKERS = 30  # 全局最大在途生成调用数
+    IMAGE_PROVIDER_MAX_CONCURRENT = 15  # 单个服务商默认最大在途调用数（可用 max_concurrent 覆盖）
+
+    # 图片生成缓存（服务商配置 enable_cache: true 时启用）
+    IMAGE_CACHE_MAX_MB = 1024  # history/.cache 的总大小上限
+
+    # 图片写盘：原图落盘后即返回，缩略图由后台线程生成
+    IMAGE_WRITER_WORKERS = 2  # 缩略图写盘线程数
+    IMAGE_WRITER_MAX_PENDING = 64  # 最多排队的待写缩略图数
+
+    # 服务商 HTTP 请求：按源站复用 keep-alive 连接，每个源站的连接数与调度器并发上限一致
+    HTTP_CONNECT_TIMEOUT = 10  # 默认连接超时（秒），可用服务商配置 connect_timeout 覆盖
+    HTTP_READ_TIMEOUT = 300  # 默认读取超时（秒），可用服务商配置 read_timeout 覆盖
+
+    # 任务状态（重试所需的大纲、封面参考图等）：超限或过期后写入任务目录的 .task_state
+    TASK_STATE_MAX_ENTRIES = 32  # 内存中最多保留的任务数
+    TASK_STATE_MAX_MB = 64  # 内存中任务状态的总大小上限
+    TASK_STATE_TTL_SECONDS = 3600  # 超过该时间未访问的任务状态移出内存
+
+    # 后台生成任务：进度事件写入环形缓冲区，断线后可通过 Last-Event-ID 续传
+    JOB_MAX_WORKERS = 8  # 同时运行的生成任务数
+    JOB_EVENT_BUFFER_SIZE = 512  # 每个任务保留的事件数
+    JOB_RETENTION_SECONDS = 1800  # 结束的任务保留多久
+    JOB_DISCONNECT_GRACE_SECONDS = 30  # 客户端全部断开后等待重连多久，超时取消任务
+
+    # 历史记录索引存储后端：sqlite（默认，首次启动自动迁移 index.json）或 json
+    HISTORY_STORE_BACKEND = 'sqlite'
+    HISTORY_SCAN_WORKERS = 8  # 扫描所有任务目录时的并行线程数
+    HISTORY_BATCH_MAX_OPS = 500  # 批量修改接口单次最多的操作数
+    HISTORY_PAGE_MAX_SIZE = 100  # 列表/搜索接口每页最多返回的记录数（page_size、limit 超出时按此截断）
+
+    # 历史记录存储管理（后台定期检查 history/ 占用）
+    STORAGE_MANAGER_ENABLED = True  # 是否启动后台检查线程（TESTING 时总是不启动）
+    STORAGE_QUOTA_MB = 0  # history/ 总占用上限，超过时按最近查看时间清理原图（保留缩略图），0 表示不限制
+    STORAGE_EVICT_TARGET_RATIO = 0.9  # 超过配额时清理到配额的多少比例以下
+    STORAGE_ORPHAN_GRACE_SECONDS = 86400  # 孤立任务目录（无关联记录）保留多久后删除
+    STORAGE_CHECK_INTERVAL_SECONDS = 600  # 检查间隔
+
+    # 导出压缩包缓存（history/.exports）：任务完成后在后台预先打包，下载时直接返回文件
+    EXPORT_CACHE_MAX_MB = 1024  # 缓存总大小上限，超过时按最近下载时间淘汰
+    EXPORT_CACHE_WORKERS = 1  # 后台打包线程数
+
+    # 文件发送卸载：图片和导出压缩包由反向代理直接发送，应用只做校验和路径解析
+    # ''：应用自己发送（支持 Range）；'x-accel'：nginx X-Accel-Redirect；'x-sendfile'：Apache/lighttpd X-Sendfile
+    FILE_OFFLOAD_MODE = ''
+    # x-accel 模式下 history/ 对应的 nginx internal location，例如：
+    #   location /_history/ { internal; alias /app/history/; }
+    FILE_OFFLOAD_ACCEL_PREFIX = '/_history/'
+
     _image_providers_config = None
     _text_providers_config = None
 
@@ -16,6 +16,9 @@ class ImageGeneratorBase(ABC):
         self.config = config
         self.api_key = config.get('api_key')
         self.base_url = config.get('base_url')
+        # HTTP 超时（秒），未配置时使用共享连接池的默认值
+        self.connect_timeout = config.get('connect_timeout')
+        self.read_timeout = config.get('read_timeout')
 
     @abstractmethod
     def generate_image(
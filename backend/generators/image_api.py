@@ -4,7 +4,8 @@ import base64
 import requests
 from typing import Dict, Any, Optional, List, Union
 from .base import ImageGeneratorBase
-from ..utils.image_compressor import compress_image
+from ..utils.http_pool import get_http_pool
+from ..utils.image_compressor import PreparedImage, as_prepared_image
 
 logger = logging.getLogger(__name__)
 
@@ -58,8 +59,8 @@ class ImageApiGenerator(ImageGeneratorBase):
         aspect_ratio: str = None,
         temperature: float = 1.0,
         model: str = None,
-        reference_image: Optional[bytes] = None,
-        reference_images: Optional[List[bytes]] = None,
+        reference_image: Optional[Union[bytes, PreparedImage]] = None,
+        reference_images: Optional[List[Union[bytes, PreparedImage]]] = None,
         **kwargs
     ) -> bytes:
         """
@@ -72,6 +73,7 @@ class ImageApiGenerator(ImageGeneratorBase):
             model: 模型名称
             reference_image: 单张参考图片数据（向后兼容）
             reference_images: 多张参考图片数据列表
+                （参考图片可以是二进制数据或任务级预处理好的 PreparedImage）
 
         Returns:
             生成的图片二进制数据
@@ -92,13 +94,37 @@ class ImageApiGenerator(ImageGeneratorBase):
         else:
             return self._generate_via_images_api(prompt, aspect_ratio, model, reference_image, reference_images)
 
+    def _collect_reference_images(
+        self,
+        reference_image: Optional[Union[bytes, PreparedImage]] = None,
+        reference_images: Optional[List[Union[bytes, PreparedImage]]] = None
+    ) -> List[PreparedImage]:
+        """
+        收集并预处理所有参考图片（压缩到 200KB 以内并编码，按内容去重）
+
+        已经是 PreparedImage 的参考图直接复用，不会重复压缩和编码。
+        """
+        candidates = list(reference_images or [])
+        if reference_image:
+            candidates.append(reference_image)
+
+        prepared = []
+        seen = set()
+        for img in candidates:
+            prepared_img = as_prepared_image(img, max_size_kb=200)
+            if prepared_img.digest in seen:
+                continue
+            seen.add(prepared_img.digest)
+            prepared.append(prepared_img)
+        return prepared
+
     def _generate_via_images_api(
         self,
         prompt: str,
         aspect_ratio: str,
         model: str,
-        reference_image: Optional[bytes] = None,
-        reference_images: Optional[List[bytes]] = None
+        reference_image: Optional[Union[bytes, PreparedImage]] = None,
+        reference_images: Optional[List[Union[bytes, PreparedImage]]] = None
     ) -> bytes:
         """通过 /v1/images/generations 端点生成图片"""
         headers = {
@@ -115,24 +141,12 @@ class ImageApiGenerator(ImageGeneratorBase):
         }
 
         # 收集所有参考图片
-        all_reference_images = []
-        if reference_images and len(reference_images) > 0:
-            all_reference_images.extend(reference_images)
-        if reference_image and reference_image not in all_reference_images:
-            all_reference_images.append(reference_image)
+        all_reference_images = self._collect_reference_images(reference_image, reference_images)
 
         # 如果有参考图片，添加到 image 数组
         if all_reference_images:
             logger.debug(f"  添加 {len(all_reference_images)} 张参考图片")
-            image_uris = []
-            for idx, img_data in enumerate(all_reference_images):
-                compressed_img = compress_image(img_data, max_size_kb=200)
-                logger.debug(f"  参考图 {idx}: {len(img_data)} -> {len(compressed_img)} bytes")
-                base64_image = base64.b64encode(compressed_img).decode('utf-8')
-                data_uri = f"data:image/png;base64,{base64_image}"
-                image_uris.append(data_uri)
-
-            payload["image"] = image_uris
+            payload["image"] = [img.data_uri for img in all_reference_images]
 
             ref_count = len(all_reference_images)
             enhanced_prompt = f"""参考提供的 {ref_count} 张图片的风格（色彩、光影、构图、氛围），生成一张新图片。
@@ -148,7 +162,13 @@ class ImageApiGenerator(ImageGeneratorBase):
 
         api_url = f"{self.base_url}{self.endpoint_type}"
         logger.debug(f"  发送请求到: {api_url}")
-        response = requests.post(api_url, headers=headers, json=payload, timeout=300)
+        response = get_http_pool().post(
+            api_url,
+            headers=headers,
+            json=payload,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout
+        )
 
         if response.status_code != 200:
             error_detail = response.text[:500]
@@ -197,8 +217,8 @@ class ImageApiGenerator(ImageGeneratorBase):
         prompt: str,
         aspect_ratio: str,
         model: str,
-        reference_image: Optional[bytes] = None,
-        reference_images: Optional[List[bytes]] = None
+        reference_image: Optional[Union[bytes, PreparedImage]] = None,
+        reference_images: Optional[List[Union[bytes, PreparedImage]]] = None
     ) -> bytes:
         """通过 /v1/chat/completions 端点生成图片（如即梦 API）"""
         import re
@@ -212,24 +232,17 @@ class ImageApiGenerator(ImageGeneratorBase):
         user_content: Any = prompt
 
         # 收集所有参考图片
-        all_reference_images = []
-        if reference_images and len(reference_images) > 0:
-            all_reference_images.extend(reference_images)
-        if reference_image and reference_image not in all_reference_images:
-            all_reference_images.append(reference_image)
+        all_reference_images = self._collect_reference_images(reference_image, reference_images)
 
         # 如果有参考图片，构建多模态消息
         if all_reference_images:
             logger.debug(f"  添加 {len(all_reference_images)} 张参考图片到 chat 消息")
             content_parts = [{"type": "text", "text": prompt}]
 
-            for idx, img_data in enumerate(all_reference_images):
-                compressed_img = compress_image(img_data, max_size_kb=200)
-                logger.debug(f"  参考图 {idx}: {len(img_data)} -> {len(compressed_img)} bytes")
-                base64_image = base64.b64encode(compressed_img).decode('utf-8')
+            for img in all_reference_images:
                 content_parts.append({
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{base64_image}"}
+                    "image_url": {"url": img.data_uri}
                 })
 
             user_content = content_parts
@@ -244,7 +257,13 @@ class ImageApiGenerator(ImageGeneratorBase):
         api_url = f"{self.base_url}{self.endpoint_type}"
         logger.info(f"Chat API 生成图片: {api_url}, model={model}")
 
-        response = requests.post(api_url, headers=headers, json=payload, timeout=300)
+        response = get_http_pool().post(
+            api_url,
+            headers=headers,
+            json=payload,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout
+        )
 
         if response.status_code != 200:
             error_detail = response.text[:500]
@@ -326,7 +345,7 @@ class ImageApiGenerator(ImageGeneratorBase):
         """下载图片并返回二进制数据"""
         logger.info(f"下载图片: {url[:100]}...")
         try:
-            response = requests.get(url, timeout=60)
+            response = get_http_pool().get(url, connect_timeout=self.connect_timeout, read_timeout=60)
             if response.status_code == 200:
                 logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
                 return response.content
@@ -4,6 +4,7 @@ import base64
 from typing import Dict, Any
 import requests
 from .base import ImageGeneratorBase
+from ..utils.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -113,7 +114,13 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         if quality and model.startswith('dall-e'):
             payload["quality"] = quality
 
-        response = requests.post(url, headers=headers, json=payload, timeout=300)
+        response = get_http_pool().post(
+            url,
+            headers=headers,
+            json=payload,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout
+        )
 
         if response.status_code != 200:
             error_detail = response.text[:500]
@@ -158,7 +165,7 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         # 处理URL格式
         elif "url" in image_data:
             logger.debug(f"  下载图片 URL...")
-            img_response = requests.get(image_data["url"], timeout=60)
+            img_response = get_http_pool().get(image_data["url"], connect_timeout=self.connect_timeout, read_timeout=60)
             if img_response.status_code == 200:
                 logger.info(f"✅ OpenAI Images API 图片生成成功: {len(img_response.content)} bytes")
                 return img_response.content
@@ -213,7 +220,13 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
             "temperature": 1.0
         }
 
-        response = requests.post(url, headers=headers, json=payload, timeout=300)
+        response = get_http_pool().post(
+            url,
+            headers=headers,
+            json=payload,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout
+        )
 
         if response.status_code != 200:
             error_detail = response.text[:500]
@@ -301,7 +314,7 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         """下载图片并返回二进制数据"""
         logger.info(f"下载图片: {url[:100]}...")
         try:
-            response = requests.get(url, timeout=60)
+            response = get_http_pool().get(url, connect_timeout=self.connect_timeout, read_timeout=60)
             if response.status_code == 200:
                 logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
                 return response.content
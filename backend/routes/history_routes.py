@@ -3,18 +3,23 @@
 
 包含功能：
 - 创建/获取/更新/删除历史记录 (CRUD)
+- 批量修改历史记录
 - 搜索历史记录
 - 获取统计信息
 - 扫描和同步任务图片
+- 存储占用统计和清理
 - 打包下载图片
 """
 
 import os
-import io
-import zipfile
 import logging
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify
+from backend.config import Config
+from backend.services.export_cache import list_export_entries
 from backend.services.history import get_history_service
+from backend.services.storage_manager import get_storage_manager
+from backend.utils.zip_stream import iter_zip
+from .utils import attachment_header, send_history_file
 
 logger = logging.getLogger(__name__)
 
@@ -90,30 +95,56 @@ def create_history_blueprint():
         """
         获取历史记录列表（分页）
 
+        支持两种分页方式：传入 cursor 或 limit 时使用游标分页，否则使用页码分页。
+        游标分页在翻页期间有新记录插入时不会重复或遗漏，适合滚动加载大量历史记录。
+
         查询参数：
-        - page: 页码（默认 1）
-        - page_size: 每页数量（默认 20）
+        - page: 页码（默认 1，页码分页）
+        - page_size: 每页数量（默认 20，最多 HISTORY_PAGE_MAX_SIZE，页码分页）
+        - cursor: 上一页返回的 next_cursor（游标分页，第一页可留空）
+        - limit: 每页数量（默认 20，最多 HISTORY_PAGE_MAX_SIZE，游标分页）
         - status: 状态过滤（可选：all/completed/draft）
+        - sort: 排序方式（可选：created_at_desc/created_at_asc/updated_at_desc/updated_at_asc）
+        - fields: 返回的字段，逗号分隔（可选，如 id,title,thumbnail）
 
         返回：
         - success: 是否成功
         - records: 记录列表
         - total: 总数
-        - total_pages: 总页数
+        - total_pages: 总页数（页码分页）
+        - next_cursor / has_more: 下一页游标及是否还有更多（游标分页）
         """
         try:
-            page = int(request.args.get('page', 1))
-            page_size = int(request.args.get('page_size', 20))
             status = request.args.get('status')
+            sort = request.args.get('sort')
+            fields_param = request.args.get('fields')
+            fields = [f.strip() for f in fields_param.split(',') if f.strip()] if fields_param else None
 
             history_service = get_history_service()
-            result = history_service.list_records(page, page_size, status)
+            if 'cursor' in request.args or 'limit' in request.args:
+                result = history_service.list_records_by_cursor(
+                    cursor=request.args.get('cursor') or None,
+                    limit=_get_page_size('limit'),
+                    status=status,
+                    sort=sort or 'created_at_desc',
+                    fields=fields
+                )
+            else:
+                page = max(int(request.args.get('page', 1)), 1)
+                page_size = _get_page_size('page_size')
+                result = history_service.list_records(page, page_size, status, sort=sort, fields=fields)
 
             return jsonify({
                 "success": True,
                 **result
             }), 200
 
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": f"参数错误：{str(e)}"
+            }), 400
+
         except Exception as e:
             error_msg = str(e)
             return jsonify({
@@ -129,13 +160,18 @@ def create_history_blueprint():
         路径参数：
         - record_id: 记录 ID
 
+        查询参数：
+        - include_outline: 是否包含大纲（默认 true，只需要图片和状态时传 false）
+
         返回：
         - success: 是否成功
         - record: 完整的记录数据
         """
         try:
+            include_outline = request.args.get('include_outline', 'true').lower() != 'false'
+
             history_service = get_history_service()
-            record = history_service.get_record(record_id)
+            record = history_service.get_record(record_id, include_outline=include_outline)
 
             if not record:
                 return jsonify({
@@ -291,22 +327,120 @@ def create_history_blueprint():
                 "error": f"删除历史记录失败。\n错误详情: {error_msg}"
             }), 500
 
+    @history_bp.route('/history/<record_id>/copy', methods=['POST'])
+    def copy_history(record_id):
+        """
+        复制历史记录（大纲和已生成的图片）
+
+        图片以硬链接方式共享，不复制图片内容。
+
+        路径参数：
+        - record_id: 记录 ID
+
+        返回：
+        - success: 是否成功
+        - record_id: 新记录 ID
+        """
+        try:
+            history_service = get_history_service()
+            new_record_id = history_service.copy_record(record_id)
+
+            if not new_record_id:
+                return jsonify({
+                    "success": False,
+                    "error": f"复制历史记录失败：{record_id}\n可能原因：记录不存在或ID错误"
+                }), 404
+
+            return jsonify({
+                "success": True,
+                "record_id": new_record_id
+            }), 200
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"复制历史记录失败。\n错误详情: {error_msg}"
+            }), 500
+
     # ==================== 搜索和统计 ====================
 
+    @history_bp.route('/history/batch', methods=['POST'])
+    def batch_history():
+        """
+        批量创建/更新/删除历史记录
+
+        所有操作在一个事务中执行，只写一次索引；任务目录在后台删除。
+        单个操作失败不影响其他操作，结果与操作一一对应。
+
+        请求体：
+        - operations: 操作列表（必填），每项包含 op 字段：
+          - {"op": "create", "topic": "...", "outline": {...}, "task_id": "..."}
+          - {"op": "update", "record_id": "...", "status": "...", "images": {...}, ...}
+          - {"op": "delete", "record_id": "..."}
+
+        返回：
+        - success: 请求是否被处理
+        - results: 每个操作的结果（index, op, success, record_id, error）
+        - succeeded: 成功的操作数
+        - failed: 失败的操作数
+        """
+        try:
+            data = request.get_json(silent=True) or {}
+            operations = data.get('operations')
+
+            if not isinstance(operations, list) or not operations:
+                return jsonify({
+                    "success": False,
+                    "error": "参数错误：operations 不能为空。\n请提供要执行的操作列表。"
+                }), 400
+
+            history_service = get_history_service()
+            results = history_service.apply_batch(operations)
+            succeeded = sum(1 for result in results if result["success"])
+
+            return jsonify({
+                "success": True,
+                "results": results,
+                "succeeded": succeeded,
+                "failed": len(results) - succeeded
+            }), 200
+
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": f"参数错误：{str(e)}"
+            }), 400
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"批量修改历史记录失败。\n错误详情: {error_msg}"
+            }), 500
+
     @history_bp.route('/history/search', methods=['GET'])
     def search_history():
         """
         搜索历史记录
 
+        在标题和大纲页面内容中全文检索，结果按相关度排序。
+
         查询参数：
         - keyword: 搜索关键词（必填）
+        - page: 页码（默认 1）
+        - page_size: 每页数量（默认 20，最多 HISTORY_PAGE_MAX_SIZE）
 
         返回：
         - success: 是否成功
-        - records: 匹配的记录列表
+        - records: 当前页的匹配记录（含相关度 score）
+        - total: 匹配总数
+        - total_pages: 总页数
         """
         try:
             keyword = request.args.get('keyword', '')
+            page = max(int(request.args.get('page', 1)), 1)
+            page_size = _get_page_size('page_size')
 
             if not keyword:
                 return jsonify({
@@ -315,11 +449,11 @@ def create_history_blueprint():
                 }), 400
 
             history_service = get_history_service()
-            results = history_service.search_records(keyword)
+            result = history_service.search_records(keyword, page, page_size)
 
             return jsonify({
                 "success": True,
-                "records": results
+                **result
             }), 200
 
         except Exception as e:
@@ -338,6 +472,8 @@ def create_history_blueprint():
         - success: 是否成功
         - total: 总记录数
         - by_status: 按状态分组的统计
+        - total_bytes / usage_by_status.*.bytes: 按记录累计的任务目录大小（近似值，
+          多条记录共享的图片各计一次；去重后的实际占用见 GET /history/storage 的 used_bytes）
         """
         try:
             history_service = get_history_service()
@@ -390,16 +526,26 @@ def create_history_blueprint():
         """
         扫描所有任务并同步图片列表
 
+        增量扫描：自上次扫描后没有变化的任务目录会被跳过。
+
+        请求体（可选）：
+        - force: 是否重新扫描全部目录（默认 false）
+
         返回：
         - success: 是否成功
         - total_tasks: 扫描的任务总数
         - synced: 成功同步的任务数
+        - updated: 记录有变化并已更新的任务数
+        - skipped: 目录未变化而跳过的任务数
         - failed: 失败的任务数
         - orphan_tasks: 孤立任务列表（有图片但无记录）
         """
         try:
+            data = request.get_json(silent=True) or {}
+            force = bool(data.get('force', False))
+
             history_service = get_history_service()
-            result = history_service.scan_all_tasks()
+            result = history_service.scan_all_tasks(force=force)
 
             if not result.get("success"):
                 return jsonify(result), 500
@@ -413,6 +559,62 @@ def create_history_blueprint():
                 "error": f"扫描所有任务失败。\n错误详情: {error_msg}"
             }), 500
 
+    # ==================== 存储管理 ====================
+
+    @history_bp.route('/history/storage', methods=['GET'])
+    def get_storage_stats():
+        """
+        获取历史记录存储占用和清理统计
+
+        返回：
+        - success: 是否成功
+        - quota_bytes: 配额（0 表示不限制）
+        - used_bytes: 上次检查时的总占用
+        - originals_bytes / thumbnails_bytes: 原图和缩略图占用
+        - orphans_removed / originals_evicted / evicted_bytes: 累计清理数量
+        - trash: 后台删除队列状态
+        - blobs: 图片去重存储统计
+        - exports: 导出压缩包缓存统计
+        """
+        try:
+            stats = get_storage_manager().get_stats()
+
+            return jsonify({
+                "success": True,
+                **stats
+            }), 200
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"获取存储统计失败。\n错误详情: {error_msg}"
+            }), 500
+
+    @history_bp.route('/history/storage/cleanup', methods=['POST'])
+    def run_storage_cleanup():
+        """
+        立即执行一次存储检查（孤立目录清理、超过配额时清理原图）
+
+        返回：
+        - success: 是否成功
+        - 其余字段同 GET /history/storage
+        """
+        try:
+            stats = get_storage_manager().run_once()
+
+            return jsonify({
+                "success": True,
+                **stats
+            }), 200
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"存储清理失败。\n错误详情: {error_msg}"
+            }), 500
+
     # ==================== 下载功能 ====================
 
     @history_bp.route('/history/<record_id>/download', methods=['GET'])
@@ -420,6 +622,9 @@ def create_history_blueprint():
         """
         下载历史记录的所有图片为 ZIP 文件
 
+        有当前版本的缓存压缩包时直接发送文件（支持 Range 断点续传）；
+        否则边读取图片边流式返回（图片不再压缩），同时安排后台打包供后续下载使用。
+
         路径参数：
         - record_id: 记录 ID
 
@@ -429,7 +634,7 @@ def create_history_blueprint():
         """
         try:
             history_service = get_history_service()
-            record = history_service.get_record(record_id)
+            record = history_service.get_record(record_id, include_outline=False)
 
             if not record:
                 return jsonify({
@@ -452,19 +657,32 @@ def create_history_blueprint():
                     "error": f"任务目录不存在：{task_id}"
                 }), 404
 
-            # 创建内存中的 ZIP 文件
-            zip_buffer = _create_images_zip(task_dir)
-
             # 生成安全的下载文件名
             title = record.get('title', 'images')
             safe_title = _sanitize_filename(title)
             filename = f"{safe_title}.zip"
 
-            return send_file(
-                zip_buffer,
+            # 命中缓存：直接发送预先打包的文件
+            cached_path = history_service.exports.lookup(record)
+            if cached_path:
+                try:
+                    return send_history_file(cached_path, 'application/zip', download_name=filename)
+                except FileNotFoundError:
+                    # 查找后恰好被淘汰，退回为流式打包
+                    pass
+
+            history_service.exports.schedule_build(record)
+
+            # 先确定要打包的文件，ZIP 数据在响应过程中逐块生成
+            entries = list_export_entries(task_dir)
+
+            return Response(
+                iter_zip(entries),
                 mimetype='application/zip',
-                as_attachment=True,
-                download_name=filename
+                headers={
+                    'Content-Disposition': attachment_header(filename),
+                    'X-Accel-Buffering': 'no',
+                }
             )
 
         except Exception as e:
@@ -477,40 +695,21 @@ def create_history_blueprint():
     return history_bp
 
 
-def _create_images_zip(task_dir: str) -> io.BytesIO:
+def _get_page_size(name: str, default: int = 20) -> int:
     """
-    创建包含所有图片的 ZIP 文件
+    读取每页数量参数，并限制在 1 到 HISTORY_PAGE_MAX_SIZE 之间
 
     Args:
-        task_dir: 任务目录路径
+        name: 查询参数名（page_size 或 limit）
+        default: 未传入时的默认值
 
     Returns:
-        io.BytesIO: 内存中的 ZIP 文件
-    """
-    memory_file = io.BytesIO()
-
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # 遍历任务目录中的所有图片（排除缩略图）
-        for filename in os.listdir(task_dir):
-            # 跳过缩略图文件
-            if filename.startswith('thumb_'):
-                continue
+        int: 每页数量
 
-            if filename.endswith(('.png', '.jpg', '.jpeg')):
-                file_path = os.path.join(task_dir, filename)
-
-                # 生成归档文件名（page_N.png 格式）
-                try:
-                    index = int(filename.split('.')[0])
-                    archive_name = f"page_{index + 1}.png"
-                except ValueError:
-                    archive_name = filename
-
-                zf.write(file_path, archive_name)
-
-    # 将指针移到开始位置
-    memory_file.seek(0)
-    return memory_file
+    Raises:
+        ValueError: 参数不是整数
+    """
+    return min(max(int(request.args.get(name, default)), 1), Config.HISTORY_PAGE_MAX_SIZE)
 
 
 def _sanitize_filename(title: str) -> str:
@@ -2,23 +2,48 @@
 图片生成相关 API 路由
 
 包含功能：
-- 批量生成图片（SSE 流式返回）
+- 批量生成图片（后台任务，SSE 流式返回）
 - 获取图片
 - 重试/重新生成单张图片
 - 批量重试失败图片
-- 获取任务状态
+- 获取任务状态、取消任务
+- 获取生成调度状态
 """
 
 import os
-import json
+import uuid
 import base64
 import logging
-from flask import Blueprint, request, jsonify, Response, send_file
+from flask import Blueprint, Response, request, jsonify
+from backend.services.blob_store import get_blob_store
+from backend.services.history import get_history_service
 from backend.services.image import get_image_service
-from .utils import log_request, log_error
+from backend.services.jobs import get_job_manager
+from backend.services.scheduler import get_image_scheduler
+from backend.services.generation_cache import get_generation_cache
+from backend.services.image_writer import get_image_writer
+from backend.services.storage_manager import get_storage_manager
+from backend.services.task_state import get_task_state_store
+from backend.utils.http_pool import get_http_pool
+from .utils import (
+    HISTORY_ROOT, is_safe_path_component, log_request, log_error, send_history_file, stream_job_events
+)
 
 logger = logging.getLogger(__name__)
 
+# 带有当前版本号（?v=）的图片 URL 内容不会再变化，允许浏览器长期缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 不带版本号的图片 URL 每次使用前向服务端验证，未变化时返回 304
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# 文件头签名 -> MIME 类型（缩略图是 JPEG，服务商返回的原图也不一定是 PNG）
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
 
 def create_image_blueprint():
     """创建图片路由蓝图（工厂函数，支持多次调用）"""
@@ -29,7 +54,10 @@ def create_image_blueprint():
     @image_bp.route('/generate', methods=['POST'])
     def generate_images():
         """
-        批量生成图片（SSE 流式返回）
+        批量生成图片（后台任务，SSE 流式返回）
+
+        生成在后台任务中执行，连接断开不会丢失进度：
+        可通过 /api/jobs/<job_id>/events 携带 Last-Event-ID 重新订阅。
 
         请求体：
         - pages: 页面列表（必填）
@@ -37,12 +65,18 @@ def create_image_blueprint():
         - full_outline: 完整大纲文本
         - user_topic: 用户原始输入主题
         - user_images: base64 编码的用户参考图片列表
+        - background: 为 true 时立即返回任务 ID，不返回事件流
 
         返回：
-        SSE 事件流，包含以下事件类型：
+        SSE 事件流（响应头 X-Job-Id 为后台任务 ID，每个事件带 id 序号），包含以下事件类型：
         - image: 单张图片生成完成
         - error: 生成错误
         - complete: 全部完成
+
+        background 为 true 时返回：
+        - success: 是否成功
+        - job_id: 后台任务 ID
+        - task_id: 图片生成任务 ID
         """
         try:
             data = request.get_json()
@@ -68,32 +102,30 @@ def create_image_blueprint():
                     "error": "参数错误：pages 不能为空。\n请提供要生成的页面列表数据。"
                 }), 400
 
+            # 在提交前确定任务 ID，便于后台任务与任务状态关联
+            if not task_id:
+                task_id = f"task_{uuid.uuid4().hex[:8]}"
+
             logger.info(f"🖼️  开始图片生成任务: {task_id}, 共 {len(pages)} 页")
             image_service = get_image_service()
 
-            def generate():
-                """SSE 事件生成器"""
-                for event in image_service.generate_images(
-                    pages, task_id, full_outline,
-                    user_images=user_images if user_images else None,
-                    user_topic=user_topic
-                ):
-                    event_type = event["event"]
-                    event_data = event["data"]
-
-                    # 格式化为 SSE 格式
-                    yield f"event: {event_type}\n"
-                    yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
-
-            return Response(
-                generate(),
-                mimetype='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'X-Accel-Buffering': 'no',
-                }
+            job = get_job_manager().submit(
+                'generate', task_id,
+                image_service.generate_images,
+                pages, task_id, full_outline,
+                user_images=user_images if user_images else None,
+                user_topic=user_topic
             )
 
+            if data.get('background'):
+                return jsonify({
+                    "success": True,
+                    "job_id": job.job_id,
+                    "task_id": task_id
+                }), 202
+
+            return stream_job_events(job)
+
         except Exception as e:
             log_error('/generate', e)
             error_msg = str(e)
@@ -115,33 +147,53 @@ def create_image_blueprint():
 
         查询参数：
         - thumbnail: 是否返回缩略图（默认 true）
+        - v: 图片版本号（生成接口返回的 image_url 中带有），与当前版本一致时允许长期缓存
 
         返回：
-        - 成功：图片文件
+        - 成功：图片文件，带 ETag / Last-Modified，条件请求未变化时返回 304；
+          配置了 FILE_OFFLOAD_MODE 时由反向代理发送文件内容
+        - 原图已因存储配额被清理：返回缩略图，响应头 X-Original-Evicted: true
+          （缩略图也不存在时返回 410）
         - 失败：JSON 错误信息
         """
         try:
             logger.debug(f"获取图片: {task_id}/{filename}")
 
+            # 只允许访问任务目录中的普通文件（不允许 ..、内部文件和目录）
+            if not is_safe_path_component(task_id) or not is_safe_path_component(filename):
+                return jsonify({
+                    "success": False,
+                    "error": f"图片不存在：{task_id}/{filename}"
+                }), 404
+
             # 检查是否请求缩略图
             thumbnail = request.args.get('thumbnail', 'true').lower() == 'true'
 
-            # 构建 history 目录路径
-            history_root = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-                "history"
-            )
-
             if thumbnail:
                 # 尝试返回缩略图
                 thumb_filename = f"thumb_{filename}"
-                thumb_filepath = os.path.join(history_root, task_id, thumb_filename)
+                thumb_filepath = os.path.join(HISTORY_ROOT, task_id, thumb_filename)
+
+                # 缩略图可能还在后台生成（重新生成时磁盘上还是旧缩略图），先等待写完
+                get_image_writer().wait_for(thumb_filepath, timeout=10)
 
                 if os.path.exists(thumb_filepath):
-                    return send_file(thumb_filepath, mimetype='image/png')
+                    return _send_image(thumb_filepath, os.path.join(HISTORY_ROOT, task_id, filename))
 
             # 返回原图
-            filepath = os.path.join(history_root, task_id, filename)
+            filepath = os.path.join(HISTORY_ROOT, task_id, filename)
+
+            if not os.path.exists(filepath) and get_history_service().is_original_evicted(task_id, filename):
+                thumb_filepath = os.path.join(HISTORY_ROOT, task_id, f"thumb_{filename}")
+                if os.path.exists(thumb_filepath):
+                    response = _send_image(thumb_filepath, filepath)
+                    response.headers['X-Original-Evicted'] = 'true'
+                    return response
+                return jsonify({
+                    "success": False,
+                    "evicted": True,
+                    "error": f"原图已因存储空间配额被清理：{task_id}/{filename}"
+                }), 410
 
             if not os.path.exists(filepath):
                 return jsonify({
@@ -149,7 +201,7 @@ def create_image_blueprint():
                     "error": f"图片不存在：{task_id}/{filename}"
                 }), 404
 
-            return send_file(filepath, mimetype='image/png')
+            return _send_image(filepath, filepath)
 
         except Exception as e:
             log_error('/images', e)
@@ -215,14 +267,14 @@ def create_image_blueprint():
     @image_bp.route('/retry-failed', methods=['POST'])
     def retry_failed_images():
         """
-        批量重试失败的图片（SSE 流式返回）
+        批量重试失败的图片（后台任务，SSE 流式返回）
 
         请求体：
         - task_id: 任务 ID（必填）
         - pages: 要重试的页面列表（必填）
 
         返回：
-        SSE 事件流
+        SSE 事件流（响应头 X-Job-Id 为后台任务 ID，可通过 /api/jobs/<job_id>/events 重新订阅）
         """
         try:
             data = request.get_json()
@@ -244,24 +296,14 @@ def create_image_blueprint():
             logger.info(f"🔄 批量重试失败图片: task={task_id}, 共 {len(pages)} 页")
             image_service = get_image_service()
 
-            def generate():
-                """SSE 事件生成器"""
-                for event in image_service.retry_failed_images(task_id, pages):
-                    event_type = event["event"]
-                    event_data = event["data"]
-
-                    yield f"event: {event_type}\n"
-                    yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
-
-            return Response(
-                generate(),
-                mimetype='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'X-Accel-Buffering': 'no',
-                }
+            job = get_job_manager().submit(
+                'retry_failed', task_id,
+                image_service.retry_failed_images,
+                task_id, pages
             )
 
+            return stream_job_events(job)
+
         except Exception as e:
             log_error('/retry-failed', e)
             error_msg = str(e)
@@ -281,6 +323,7 @@ def create_image_blueprint():
         - use_reference: 是否使用参考图（默认 true）
         - full_outline: 完整大纲文本（用于上下文）
         - user_topic: 用户原始输入主题
+        - bypass_cache: 是否跳过生成缓存，强制重新调用服务商（默认 false）
 
         返回：
         - success: 是否成功
@@ -293,10 +336,12 @@ def create_image_blueprint():
             use_reference = data.get('use_reference', True)
             full_outline = data.get('full_outline', '')
             user_topic = data.get('user_topic', '')
+            bypass_cache = data.get('bypass_cache', False)
 
             log_request('/regenerate', {
                 'task_id': task_id,
-                'page_index': page.get('index') if page else None
+                'page_index': page.get('index') if page else None,
+                'bypass_cache': bypass_cache
             })
 
             if not task_id or not page:
@@ -311,7 +356,8 @@ def create_image_blueprint():
             result = image_service.regenerate_image(
                 task_id, page, use_reference,
                 full_outline=full_outline,
-                user_topic=user_topic
+                user_topic=user_topic,
+                bypass_cache=bypass_cache
             )
 
             if result["success"]:
@@ -345,6 +391,7 @@ def create_image_blueprint():
           - generated: 已生成的图片
           - failed: 失败的图片
           - has_cover: 是否有封面图
+          - cancelled: 是否已被取消
         """
         try:
             image_service = get_image_service()
@@ -360,7 +407,8 @@ def create_image_blueprint():
             safe_state = {
                 "generated": state.get("generated", {}),
                 "failed": state.get("failed", {}),
-                "has_cover": state.get("cover_image") is not None
+                "has_cover": state.get("cover_image") is not None,
+                "cancelled": state.get("cancelled", False)
             }
 
             return jsonify({
@@ -375,6 +423,76 @@ def create_image_blueprint():
                 "error": f"获取任务状态失败。\n错误详情: {error_msg}"
             }), 500
 
+    @image_bp.route('/task/<task_id>/cancel', methods=['POST'])
+    def cancel_task(task_id):
+        """
+        取消正在进行的生成任务
+
+        排队中的页面不再调用服务商；已经发出的请求无法中断，
+        其结果只写入生成缓存（如启用），不再写入任务目录。
+
+        路径参数：
+        - task_id: 任务 ID
+
+        返回：
+        - success: 是否成功
+        - cancelled_jobs: 被取消的后台任务数（0 表示该任务没有正在运行的生成）
+        """
+        try:
+            log_request(f'/task/{task_id}/cancel')
+            cancelled_jobs = get_job_manager().cancel_task(task_id)
+            logger.info(f"⏹️  取消任务: {task_id}, 后台任务 {cancelled_jobs} 个")
+
+            return jsonify({
+                "success": True,
+                "cancelled_jobs": cancelled_jobs
+            }), 200
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"取消任务失败。\n错误详情: {error_msg}"
+            }), 500
+
+    # ==================== 调度状态 ====================
+
+    @image_bp.route('/generation/stats', methods=['GET'])
+    def get_generation_stats():
+        """
+        获取图片生成调度状态
+
+        返回：
+        - success: 是否成功
+        - scheduler: 调度器状态
+          - max_workers: 全局最大在途调用数
+          - in_flight: 当前在途调用数
+          - providers: 各服务商的并发窗口（limit/window/min/max）、
+            延迟统计、成功/过载次数、在途数和排队数
+        - cache: 生成缓存统计（条目数、占用字节、命中/未命中/淘汰次数）
+        - writer: 写盘统计（待写缩略图数、已写原图/缩略图数）
+        - task_store: 任务状态存储的内存占用（条目数、估算字节数、落盘/恢复/淘汰次数）
+        - jobs: 后台任务队列统计（任务数、排队/运行中数量）
+        - http_pool: 服务商连接池统计（会话命中/未命中，各源站请求数、新建连接数、复用次数）
+        """
+        try:
+            return jsonify({
+                "success": True,
+                "scheduler": get_image_scheduler().get_stats(),
+                "cache": get_generation_cache().get_stats(),
+                "writer": get_image_writer().get_stats(),
+                "task_store": get_task_state_store().get_stats(),
+                "jobs": get_job_manager().get_stats(),
+                "http_pool": get_http_pool().get_stats()
+            }), 200
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"获取生成调度状态失败。\n错误详情: {error_msg}"
+            }), 500
+
     # ==================== 健康检查 ====================
 
     @image_bp.route('/health', methods=['GET'])
@@ -417,3 +535,60 @@ def _parse_base64_images(images_base64: list) -> list:
         images.append(base64.b64decode(img_b64))
 
     return images
+
+def _sniff_mimetype(filepath: str) -> str:
+    """
+    根据文件头判断图片类型（文件扩展名不可靠：缩略图是 JPEG 但以 .png 结尾）
+
+    Args:
+        filepath: 图片路径
+
+    Returns:
+        str: MIME 类型，无法识别时为 image/png
+    """
+    with open(filepath, 'rb') as f:
+        header = f.read(12)
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mimetype
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
+def _send_image(filepath: str, original_path: str) -> Response:
+    """
+    发送图片，支持条件请求和长期缓存
+
+    ETag 为文件的内容版本（内容哈希或修改时间+大小），客户端缓存仍有效时直接返回 304，
+    不再打开文件。请求的 v 参数与该页原图的当前版本一致、且该文件没有待写的新版本时
+    使用 immutable 长期缓存，否则要求客户端每次重新验证。
+
+    Args:
+        filepath: 要发送的文件（原图或缩略图）
+        original_path: 该页原图路径（URL 中的版本号以原图为准）
+
+    Returns:
+        Response: 图片响应或 304
+    """
+    blob_store = get_blob_store()
+    etag = blob_store.get_version(filepath)
+
+    cache_control = REVALIDATE_CACHE_CONTROL
+    requested_version = request.args.get('v')
+    # 缩略图仍在后台写入时，磁盘上可能是重新生成前的旧图，不能让浏览器长期缓存
+    if requested_version and os.path.exists(original_path) and not get_image_writer().is_pending(filepath):
+        if requested_version == blob_store.get_version(original_path):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+
+    if request.if_none_match.contains(etag):
+        # 条件请求命中时不记录查看时间（首次加载时已记录），避免每次轮询都加锁
+        response = Response(status=304)
+        response.set_etag(etag)
+    else:
+        # 记录查看时间，存储超过配额时最久未查看的原图先被清理
+        get_storage_manager().touch(os.path.basename(os.path.dirname(original_path)))
+        # 配置了反向代理卸载时只返回 X-Accel-Redirect / X-Sendfile，否则由 send_file 发送（支持 Range）
+        response = send_history_file(filepath, _sniff_mimetype(filepath), etag=etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,73 @@
+"""
+后台任务相关 API 路由
+
+包含功能：
+- 查询后台任务状态
+- 订阅后台任务事件（SSE，支持 Last-Event-ID 断线续传）
+"""
+
+import logging
+from flask import Blueprint, request, jsonify
+from backend.services.jobs import get_job_manager
+from .utils import stream_job_events, parse_last_event_id
+
+logger = logging.getLogger(__name__)
+
+
+def create_job_blueprint():
+    """创建后台任务路由蓝图（工厂函数，支持多次调用）"""
+    job_bp = Blueprint('jobs', __name__)
+
+    @job_bp.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        """
+        获取后台任务状态
+
+        路径参数：
+        - job_id: 后台任务 ID
+
+        返回：
+        - success: 是否成功
+        - job: 任务概要（kind、task_id、status、error、last_event_id 等）
+        """
+        job = get_job_manager().get(job_id)
+        if job is None:
+            return jsonify({
+                "success": False,
+                "error": f"后台任务不存在：{job_id}\n可能原因：\n1. 任务ID错误\n2. 任务已结束并被清理\n3. 服务重启导致任务丢失"
+            }), 404
+
+        return jsonify({
+            "success": True,
+            "job": job.to_dict()
+        }), 200
+
+    @job_bp.route('/jobs/<job_id>/events', methods=['GET'])
+    def get_job_events(job_id):
+        """
+        订阅后台任务事件（SSE）
+
+        路径参数：
+        - job_id: 后台任务 ID
+
+        请求头/查询参数：
+        - Last-Event-ID: 已收到的最后一个事件 id（EventSource 重连时自动携带），
+          也可以用查询参数 last_event_id 传入
+
+        返回：
+        SSE 事件流，先补发缓冲区中错过的事件，任务结束后关闭连接
+        """
+        job = get_job_manager().get(job_id)
+        if job is None:
+            return jsonify({
+                "success": False,
+                "error": f"后台任务不存在：{job_id}\n可能原因：\n1. 任务ID错误\n2. 任务已结束并被清理\n3. 服务重启导致任务丢失"
+            }), 404
+
+        last_event_id = parse_last_event_id(
+            request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+        )
+        logger.debug(f"订阅后台任务事件: job={job_id}, last_event_id={last_event_id}")
+        return stream_job_events(job, last_event_id)
+
+    return job_bp
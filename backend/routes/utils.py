@@ -4,11 +4,23 @@ API 路由工具函数
 包含通用的日志记录、错误处理等辅助函数
 """
 
+import os
+import json
 import logging
 import traceback
+from typing import Optional
+from urllib.parse import quote
+from flask import Response, send_file
+from backend.config import Config
 
 logger = logging.getLogger(__name__)
 
+# 历史记录根目录（X-Accel-Redirect 路径相对于此目录）
+HISTORY_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    "history"
+)
+
 
 def log_request(endpoint: str, data: dict = None):
     """
@@ -95,3 +107,187 @@ def prepare_providers_for_response(providers: dict) -> dict:
         result[name] = provider_copy
 
     return result
+
+
+def format_sse(event: str, data: dict, event_id: int = None) -> str:
+    """
+    格式化一个 SSE 事件
+
+    Args:
+        event: 事件类型
+        data: 事件数据
+        event_id: 事件序号（客户端重连时通过 Last-Event-ID 回传）
+
+    Returns:
+        str: SSE 文本
+    """
+    message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + "\n"
+
+
+def sse_response(events) -> Response:
+    """
+    把 SSE 文本迭代器包装成流式响应
+
+    Args:
+        events: 产出 SSE 文本的迭代器
+
+    Returns:
+        Response: text/event-stream 响应
+    """
+    return Response(
+        events,
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        }
+    )
+
+
+def stream_job_events(job, last_event_id: int = 0, heartbeat: float = 15) -> Response:
+    """
+    以 SSE 流返回后台任务的事件
+
+    先补发缓冲区中 last_event_id 之后的事件，再持续推送新事件，任务结束后关闭。
+    缓冲区已丢弃部分事件时先发送 gap 事件，客户端可通过 /api/task/<task_id> 重新同步。
+    连接期间登记为任务的订阅者，所有订阅者断开超过宽限期后任务会被取消。
+
+    Args:
+        job: 后台任务（backend.services.jobs.Job）
+        last_event_id: 客户端已收到的最后一个事件序号
+        heartbeat: 无新事件时发送保活注释的间隔（秒）
+
+    Returns:
+        Response: text/event-stream 响应，响应头 X-Job-Id 为任务 ID
+    """
+    def generate():
+        last_seq = last_event_id
+        job.subscribe()
+        try:
+            while True:
+                events, first_seq, done = job.events_after(last_seq, timeout=heartbeat)
+                if events and first_seq > last_seq + 1:
+                    yield format_sse("gap", {
+                        "job_id": job.job_id,
+                        "task_id": job.task_id,
+                        "missed_from": last_seq + 1,
+                        "missed_to": first_seq - 1
+                    })
+                for seq, event, data in events:
+                    yield format_sse(event, data, seq)
+                    last_seq = seq
+                if done:
+                    return
+                if not events:
+                    # 保活注释：客户端断开时写入失败，服务端由此感知断线
+                    yield ": keep-alive\n\n"
+        finally:
+            job.unsubscribe()
+
+    response = sse_response(generate())
+    response.headers['X-Job-Id'] = job.job_id
+    return response
+
+
+def parse_last_event_id(value) -> int:
+    """
+    解析 Last-Event-ID（无效值视为从头开始）
+
+    Args:
+        value: 请求头或查询参数中的值
+
+    Returns:
+        int: 事件序号
+    """
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def attachment_header(filename: str) -> str:
+    """
+    生成下载用的 Content-Disposition（非 ASCII 文件名按 RFC 5987 编码）
+
+    Args:
+        filename: 下载文件名
+
+    Returns:
+        str: 响应头的值
+    """
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii').strip()
+    if not ascii_name.rsplit('.', 1)[0].strip():
+        ascii_name = 'images.zip'
+    if ascii_name == filename:
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def is_safe_path_component(name: str) -> bool:
+    """
+    路径参数是否可以安全地拼接到 history/ 下
+
+    拒绝空值、路径分隔符以及以点开头的名称（.. 和 .blobs、.exports 等内部文件）。
+
+    Args:
+        name: 路径参数（task_id、filename）
+
+    Returns:
+        bool: 是否安全
+    """
+    return bool(name) and not name.startswith('.') and '/' not in name and '\\' not in name
+
+
+def send_history_file(
+    filepath: str,
+    mimetype: str,
+    etag: Optional[str] = None,
+    download_name: Optional[str] = None
+) -> Response:
+    """
+    发送 history/ 下的文件
+
+    配置了 FILE_OFFLOAD_MODE 时只返回 X-Accel-Redirect / X-Sendfile 响应头，
+    由反向代理发送文件内容（包括 Range 请求），应用线程不再逐块读写文件；
+    否则由 send_file 发送，支持 Range 和条件请求。
+
+    Args:
+        filepath: 文件路径（必须位于 history/ 下）
+        mimetype: MIME 类型
+        etag: ETag，为空时由 send_file 根据文件生成
+        download_name: 下载文件名，为空时内联显示
+
+    Returns:
+        Response: 响应
+    """
+    mode = Config.FILE_OFFLOAD_MODE
+    if not mode:
+        return send_file(
+            filepath,
+            mimetype=mimetype,
+            etag=etag or True,
+            conditional=True,
+            as_attachment=download_name is not None,
+            download_name=download_name
+        )
+
+    stat = os.stat(filepath)
+    response = Response(mimetype=mimetype)
+    if mode == 'x-accel':
+        relpath = os.path.relpath(filepath, HISTORY_ROOT).replace(os.sep, '/')
+        prefix = Config.FILE_OFFLOAD_ACCEL_PREFIX.rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(relpath)}"
+    elif mode == 'x-sendfile':
+        response.headers['X-Sendfile'] = os.path.abspath(filepath)
+    else:
+        raise ValueError(f"不支持的 FILE_OFFLOAD_MODE: {mode}，可选: x-accel、x-sendfile")
+
+    response.last_modified = stat.st_mtime
+    if etag:
+        response.set_etag(etag)
+    if download_name is not None:
+        response.headers['Content-Disposition'] = attachment_header(download_name)
+    return response
@@ -0,0 +1,322 @@
+"""
+内容寻址的图片存储
+
+图片按内容哈希（SHA-256）保存在 history/.blobs/ 下，任务目录中的文件是指向 blob 的硬链接：
+- 缓存命中、重试得到相同字节、复制记录等情况下，相同内容只占一份磁盘空间
+- 任务目录中的文件仍是普通文件，读取（/api/images、ZIP 下载、扫描）无需任何改动
+- 引用计数即 blob 的硬链接数：任务目录中的链接全部删除后（链接数降为 1），blob 被回收
+- 每个任务目录的 .manifest.json 记录 文件名 -> blob 名，删除任务目录时据此释放 blob
+
+所有写入都通过“临时文件/临时链接 + 原子替换”完成，不会原地修改共享的 blob。
+清单的读-改-写按任务目录加锁；全局锁只用于让“创建链接”和“回收 blob”互斥。
+文件系统不支持硬链接时退回为普通写入（不去重）。
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.services.image_writer import write_file_durable
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """基于硬链接的内容寻址存储"""
+
+    BLOB_DIRNAME = ".blobs"
+    MANIFEST_FILENAME = ".manifest.json"
+    # get_version 缓存的清单数量上限
+    MANIFEST_CACHE_SIZE = 256
+    # 清单锁的分段数（任务目录按路径哈希映射到固定数量的锁上）
+    MANIFEST_LOCK_STRIPES = 64
+
+    def __init__(self, root_dir: str):
+        """
+        Args:
+            root_dir: 历史记录根目录（blob 目录 .blobs 位于其下）
+        """
+        self.root_dir = root_dir
+        self.blob_dir = os.path.join(root_dir, self.BLOB_DIRNAME)
+        # 链接和回收互斥，避免回收掉正要被链接的 blob
+        self._lock = threading.Lock()
+        # 分段清单锁：同一目录的清单读-改-写串行，不同目录大多互不阻塞，锁的数量不随任务数增长
+        self._dir_locks = [threading.Lock() for _ in range(self.MANIFEST_LOCK_STRIPES)]
+        # 任务目录 -> (清单文件版本, 清单)，按最近使用排列
+        self._manifest_cache: "OrderedDict[str, Tuple[Tuple[int, int, int], Dict[str, str]]]" = OrderedDict()
+        self._manifest_cache_lock = threading.Lock()
+
+        self.blobs_written = 0
+        self.dedup_hits = 0
+        self.link_fallbacks = 0
+        self.blobs_released = 0
+
+    # ==================== 写入 ====================
+
+    def _get_dir_lock(self, task_dir: str) -> threading.Lock:
+        """任务目录的清单锁（同一时间只持有一把，不会死锁）"""
+        return self._dir_locks[hash(os.path.normpath(task_dir)) % len(self._dir_locks)]
+
+    def _get_blob_path(self, blob_name: str) -> str:
+        """blob 路径（按哈希前两位分目录）"""
+        return os.path.join(self.blob_dir, blob_name[:2], blob_name)
+
+    @staticmethod
+    def _link(src: str, dst: str) -> None:
+        """原子地把 dst 替换为指向 src 的硬链接"""
+        # 已经链接到同一文件时 rename 不做任何事，会留下临时链接
+        try:
+            if os.path.samefile(src, dst):
+                return
+        except FileNotFoundError:
+            if not os.path.exists(src):
+                raise
+        directory, name = os.path.split(dst)
+        tmp_path = os.path.join(directory, f".{name}.{threading.get_ident()}.lnk")
+        os.link(src, tmp_path)
+        os.replace(tmp_path, dst)
+
+    def save(self, path: str, data: bytes) -> Optional[str]:
+        """
+        保存文件：写入（或复用）内容相同的 blob，并在 path 处创建硬链接
+
+        Args:
+            path: 任务目录中的目标路径
+            data: 文件内容
+
+        Returns:
+            Optional[str]: blob 名，退回为普通写入时为 None
+        """
+        blob_name = hashlib.sha256(data).hexdigest() + os.path.splitext(path)[1].lower()
+        blob_path = self._get_blob_path(blob_name)
+        task_dir, filename = os.path.split(path)
+
+        # 持有目录锁直到清单写完，保证同一文件的并发写入中清单与最终链接一致
+        with self._get_dir_lock(task_dir):
+            for _ in range(2):
+                # 写 blob 不持锁：同一内容被并发写入时结果相同，原子替换即可
+                existed = os.path.exists(blob_path)
+                if not existed:
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    write_file_durable(blob_path, data)
+
+                with self._lock:
+                    try:
+                        self._link(blob_path, path)
+                    except FileNotFoundError:
+                        # 写入后、链接前 blob 恰好被回收，重新写入
+                        continue
+                    except OSError as e:
+                        logger.debug(f"无法创建硬链接，退回为普通写入: {path}, {e}")
+                        self.link_fallbacks += 1
+                        break
+                    if existed:
+                        self.dedup_hits += 1
+                    else:
+                        self.blobs_written += 1
+                # 链接建立后 blob 的链接数大于 1，不会被回收，清单在全局锁外写入
+                self._update_manifest(task_dir, {filename: blob_name})
+                return blob_name
+
+            write_file_durable(path, data)
+            self._update_manifest(task_dir, {filename: None})
+        return None
+
+    # ==================== 清单 ====================
+
+    def read_manifest(self, task_dir: str) -> Dict[str, str]:
+        """读取任务目录的清单（文件名 -> blob 名）"""
+        try:
+            with open(os.path.join(task_dir, self.MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _update_manifest(self, task_dir: str, changes: Dict[str, Optional[str]]) -> None:
+        """修改清单（值为 None 表示删除该项，调用方持有该目录的清单锁）"""
+        manifest = self.read_manifest(task_dir)
+        for filename, blob_name in changes.items():
+            if blob_name is None:
+                manifest.pop(filename, None)
+            else:
+                manifest[filename] = blob_name
+        data = json.dumps(manifest, separators=(',', ':')).encode("utf-8")
+        write_file_durable(os.path.join(task_dir, self.MANIFEST_FILENAME), data)
+
+    def get_version(self, path: str) -> str:
+        """
+        文件的内容版本（用作图片的 ETag 和 URL 中的 v 参数）
+
+        通过 blob 存储写入的文件使用内容哈希，其他文件使用修改时间和大小。
+
+        Args:
+            path: 任务目录中的文件路径
+
+        Returns:
+            str: 版本号，内容变化时随之变化
+        """
+        task_dir, filename = os.path.split(path)
+        blob_name = self._read_manifest_cached(task_dir).get(filename)
+        if blob_name:
+            return blob_name[:16]
+        stat = os.stat(path)
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def _read_manifest_cached(self, task_dir: str) -> Dict[str, str]:
+        """
+        读取清单，文件版本（inode、mtime、大小）未变化时复用上次解析的结果
+
+        清单总是通过原子替换写入，内容变化时 inode 随之变化。
+        返回的字典由缓存共享，调用方不能修改。
+        """
+        try:
+            stat = os.stat(os.path.join(task_dir, self.MANIFEST_FILENAME))
+        except OSError:
+            return {}
+        token = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with self._manifest_cache_lock:
+            cached = self._manifest_cache.get(task_dir)
+            if cached is not None and cached[0] == token:
+                self._manifest_cache.move_to_end(task_dir)
+                return cached[1]
+
+        manifest = self.read_manifest(task_dir)
+        with self._manifest_cache_lock:
+            self._manifest_cache[task_dir] = (token, manifest)
+            self._manifest_cache.move_to_end(task_dir)
+            while len(self._manifest_cache) > self.MANIFEST_CACHE_SIZE:
+                self._manifest_cache.popitem(last=False)
+        return manifest
+
+    # ==================== 引用释放 ====================
+
+    def _release_locked(self, blob_name: str) -> int:
+        """blob 不再被任何任务目录引用时删除，返回释放的字节数（调用方持有锁）"""
+        blob_path = self._get_blob_path(blob_name)
+        try:
+            stat = os.stat(blob_path)
+            if stat.st_nlink > 1:
+                return 0
+            os.remove(blob_path)
+        except FileNotFoundError:
+            return 0
+        self.blobs_released += 1
+        return stat.st_size
+
+    def release(self, blob_names: Iterable[str]) -> int:
+        """
+        释放一组 blob 的引用（任务目录删除后调用）
+
+        Returns:
+            int: 释放的字节数
+        """
+        with self._lock:
+            return sum(self._release_locked(name) for name in set(blob_names))
+
+    def unlink(self, path: str) -> int:
+        """
+        删除任务目录中的一个文件，并在没有其他引用时回收对应的 blob
+
+        Args:
+            path: 任务目录中的文件路径
+
+        Returns:
+            int: 实际释放的磁盘字节数（内容仍被其他任务引用时为 0）
+        """
+        task_dir, filename = os.path.split(path)
+        with self._get_dir_lock(task_dir):
+            stat = os.lstat(path)
+            os.remove(path)
+            blob_name = self.read_manifest(task_dir).get(filename)
+            self._update_manifest(task_dir, {filename: None})
+        if blob_name is not None:
+            with self._lock:
+                if os.path.exists(self._get_blob_path(blob_name)):
+                    return self._release_locked(blob_name)
+        return stat.st_size if stat.st_nlink <= 1 else 0
+
+    def collect_garbage(self) -> int:
+        """
+        回收所有未被引用的 blob（链接数为 1）
+
+        Returns:
+            int: 释放的字节数
+        """
+        freed = 0
+        if not os.path.isdir(self.blob_dir):
+            return 0
+        for prefix in os.listdir(self.blob_dir):
+            prefix_dir = os.path.join(self.blob_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for blob_name in os.listdir(prefix_dir):
+                if blob_name.startswith('.'):
+                    continue
+                with self._lock:
+                    freed += self._release_locked(blob_name)
+        return freed
+
+    # ==================== 复制 ====================
+
+    def copy_dir(self, src_dir: str, dst_dir: str) -> List[str]:
+        """
+        复制任务目录：只创建硬链接，不复制图片内容
+
+        Args:
+            src_dir: 源任务目录
+            dst_dir: 新任务目录（不能已存在）
+
+        Returns:
+            List[str]: 复制的文件名
+        """
+        os.makedirs(dst_dir)
+        copied = []
+        # 从任务目录中的文件创建链接，blob 的链接数不会降到 1，无需全局锁
+        with self._get_dir_lock(dst_dir):
+            for entry in os.scandir(src_dir):
+                # .task_state 等内部文件属于原任务，不复制
+                if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                    continue
+                dst_path = os.path.join(dst_dir, entry.name)
+                try:
+                    os.link(entry.path, dst_path)
+                except OSError:
+                    shutil.copy2(entry.path, dst_path)
+                copied.append(entry.name)
+            manifest = self.read_manifest(src_dir)
+            self._update_manifest(dst_dir, {name: manifest[name] for name in copied if name in manifest})
+        return copied
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取去重统计信息"""
+        with self._lock:
+            return {
+                "blobs_written": self.blobs_written,
+                "dedup_hits": self.dedup_hits,
+                "link_fallbacks": self.link_fallbacks,
+                "blobs_released": self.blobs_released,
+            }
+
+
+_store_instance = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """获取全局 blob 存储实例"""
+    global _store_instance
+    if _store_instance is None:
+        with _store_lock:
+            if _store_instance is None:
+                root_dir = os.path.join(
+                    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                    "history"
+                )
+                _store_instance = BlobStore(root_dir)
+    return _store_instance
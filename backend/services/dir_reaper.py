@@ -0,0 +1,119 @@
+"""
+任务目录后台清理
+
+删除历史记录时，关联的任务目录不再在请求线程中 shutil.rmtree：
+- 先把目录重命名到 history/.trash/ 下（同一文件系统内的原子操作，立即从扫描和访问中消失）
+- 再由后台线程逐个删除
+- 进程重启后，.trash 中残留的目录会在首次使用时重新排队删除
+- 可以传入删除完成后的回调（如释放目录中文件引用的 blob）
+"""
+
+import os
+import uuid
+import queue
+import shutil
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryReaper:
+    """后台删除目录的清理线程"""
+
+    TRASH_DIRNAME = ".trash"
+
+    def __init__(self, root_dir: str):
+        """
+        Args:
+            root_dir: 历史记录根目录（回收目录 .trash 位于其下）
+        """
+        self.root_dir = root_dir
+        self.trash_dir = os.path.join(root_dir, self.TRASH_DIRNAME)
+
+        # (目录, 删除完成后的回调)
+        self._queue: "queue.Queue[Tuple[str, Optional[Callable[[], None]]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.scheduled = 0
+        self.removed = 0
+        self.failed = 0
+
+    def _ensure_started(self) -> None:
+        """启动清理线程，并把上次运行残留的目录重新排队"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="dir-reaper", daemon=True)
+            self._thread.start()
+
+        if os.path.isdir(self.trash_dir):
+            for name in os.listdir(self.trash_dir):
+                self._queue.put((os.path.join(self.trash_dir, name), None))
+
+    def schedule(self, path: str, on_removed: Optional[Callable[[], None]] = None) -> bool:
+        """
+        安排删除目录（立即移入回收目录，后台删除）
+
+        Args:
+            path: 要删除的目录
+            on_removed: 目录删除完成后在清理线程中调用的回调
+
+        Returns:
+            bool: 目录是否存在并已安排删除
+        """
+        if not os.path.isdir(path):
+            return False
+
+        self._ensure_started()
+        os.makedirs(self.trash_dir, exist_ok=True)
+        target = os.path.join(self.trash_dir, f"{os.path.basename(path)}.{uuid.uuid4().hex[:8]}")
+        try:
+            os.rename(path, target)
+        except OSError as e:
+            # 无法移动（如跨文件系统）时退回为直接删除
+            logger.warning(f"移动目录到回收目录失败，直接删除: {path}, {e}")
+            target = path
+
+        with self._lock:
+            self.scheduled += 1
+        self._queue.put((target, on_removed))
+        return True
+
+    def _run(self) -> None:
+        """逐个删除排队的目录"""
+        while True:
+            path, on_removed = self._queue.get()
+            try:
+                try:
+                    shutil.rmtree(path)
+                    with self._lock:
+                        self.removed += 1
+                    logger.debug(f"已删除目录: {path}")
+                except FileNotFoundError:
+                    pass
+                if on_removed is not None:
+                    on_removed()
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.warning(f"删除目录失败: {path}, {e}")
+            finally:
+                self._queue.task_done()
+
+    def wait_idle(self) -> None:
+        """等待所有已排队的目录删除完成"""
+        self._queue.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取清理统计信息"""
+        with self._lock:
+            return {
+                "scheduled": self.scheduled,
+                "removed": self.removed,
+                "failed": self.failed,
+                "pending": self._queue.qsize(),
+            }
+
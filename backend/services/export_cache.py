@@ -0,0 +1,341 @@
+"""
+导出压缩包缓存
+
+热门记录会被反复下载，每次都重新打包没有必要：
+- 压缩包按记录保存在 history/.exports/{record_id}.{指纹}.zip
+- 指纹由记录的 updated_at、图片列表以及各图片文件的大小和修改时间计算，
+  任何一项变化后旧压缩包不再命中
+- 记录变为 completed 时在后台预先打包；未命中的下载先流式返回，同时安排后台打包
+- 记录被更新或删除时立即删除其压缩包
+- 总大小受上限约束，按最近下载时间（LRU）淘汰
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.config import Config
+from backend.utils.zip_stream import iter_zip
+
+logger = logging.getLogger(__name__)
+
+
+def list_export_entries(task_dir: str) -> List[Tuple[str, str]]:
+    """
+    列出要打包的图片（按页码排序）
+
+    Args:
+        task_dir: 任务目录路径
+
+    Returns:
+        List[Tuple[str, str]]: (文件路径, 压缩包内文件名) 列表
+    """
+    entries = []
+    # 遍历任务目录中的所有图片（排除缩略图）
+    for filename in os.listdir(task_dir):
+        # 跳过缩略图文件
+        if filename.startswith('thumb_'):
+            continue
+
+        if filename.endswith(('.png', '.jpg', '.jpeg')):
+            file_path = os.path.join(task_dir, filename)
+
+            # 生成归档文件名（page_N.png 格式）
+            try:
+                index = int(filename.split('.')[0])
+                archive_name = f"page_{index + 1}.png"
+            except ValueError:
+                index = None
+                archive_name = filename
+
+            entries.append(((index is None, index or 0, filename), file_path, archive_name))
+
+    entries.sort()
+    return [(file_path, archive_name) for _, file_path, archive_name in entries]
+
+
+class ExportCache:
+    """按记录缓存的导出压缩包"""
+
+    EXPORT_DIRNAME = ".exports"
+
+    def __init__(self, root_dir: str, max_bytes: int, max_workers: int):
+        """
+        Args:
+            root_dir: 历史记录根目录（缓存目录 .exports 位于其下）
+            max_bytes: 缓存总大小上限（字节）
+            max_workers: 后台打包线程数
+        """
+        self.root_dir = root_dir
+        self.export_dir = os.path.join(root_dir, self.EXPORT_DIRNAME)
+        self.max_bytes = max_bytes
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export")
+        self._lock = threading.Lock()
+        # 文件名 -> 大小，按最近下载时间从旧到新排列（首次使用时从目录加载）
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._total_bytes = 0
+        # (record_id, updated_at) -> 打包开始时该记录的失效次数
+        self._pending: Dict[Tuple[str, str], int] = {}
+        # 有打包任务进行中的记录被失效的次数，打包完成时据此丢弃过期结果
+        self._invalidations: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.build_failures = 0
+        self.evictions = 0
+
+    # ==================== 指纹 ====================
+
+    def _get_task_dir(self, record: Dict) -> Optional[str]:
+        """记录关联的任务目录，不存在时返回 None"""
+        task_id = (record.get("images") or {}).get("task_id")
+        if not task_id:
+            return None
+        task_dir = os.path.join(self.root_dir, task_id)
+        return task_dir if os.path.isdir(task_dir) else None
+
+    def _fingerprint(self, record: Dict, entries: List[Tuple[str, str]]) -> str:
+        """根据记录的更新时间、图片列表和图片文件状态计算指纹"""
+        files = []
+        for path, archive_name in entries:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append([archive_name, stat.st_size, stat.st_mtime_ns])
+        payload = [
+            record.get("updated_at"),
+            (record.get("images") or {}).get("task_id"),
+            (record.get("images") or {}).get("generated") or [],
+            files,
+        ]
+        data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+        return hashlib.sha1(data).hexdigest()[:20]
+
+    @staticmethod
+    def _get_filename(record_id: str, fingerprint: str) -> str:
+        """缓存文件名"""
+        return f"{record_id}.{fingerprint}.zip"
+
+    # ==================== 对外接口 ====================
+
+    def lookup(self, record: Dict) -> Optional[str]:
+        """
+        查找记录当前内容对应的压缩包
+
+        Args:
+            record: 历史记录（无需大纲）
+
+        Returns:
+            Optional[str]: 压缩包路径，未命中时返回 None
+        """
+        task_dir = self._get_task_dir(record)
+        if task_dir is None:
+            return None
+        filename = self._get_filename(record["id"], self._fingerprint(record, list_export_entries(task_dir)))
+
+        with self._lock:
+            self._load_locked()
+            if filename in self._entries:
+                self._entries.move_to_end(filename)
+                self.hits += 1
+                return os.path.join(self.export_dir, filename)
+            self.misses += 1
+        return None
+
+    def schedule_build(self, record: Dict) -> bool:
+        """
+        安排在后台打包记录的图片
+
+        Args:
+            record: 历史记录（无需大纲）
+
+        Returns:
+            bool: 是否新安排了打包（同一版本已在打包时返回 False）
+        """
+        key = (record["id"], record.get("updated_at") or "")
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending[key] = self._invalidations.get(record["id"], 0)
+        self._executor.submit(self._build, dict(record), key)
+        return True
+
+    def invalidate(self, record_id: str) -> int:
+        """
+        删除记录的所有压缩包（记录被更新或删除时调用）
+
+        Args:
+            record_id: 记录 ID
+
+        Returns:
+            int: 删除的压缩包数量
+        """
+        prefix = f"{record_id}."
+        with self._lock:
+            self._load_locked()
+            names = [name for name in self._entries if name.startswith(prefix)]
+            for name in names:
+                self._total_bytes -= self._entries.pop(name)
+            if any(pending_id == record_id for pending_id, _ in self._pending):
+                self._invalidations[record_id] = self._invalidations.get(record_id, 0) + 1
+        self._remove_files(names)
+        return len(names)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._entries) if self._entries is not None else None,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "pending_builds": len(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "build_failures": self.build_failures,
+                "evictions": self.evictions,
+            }
+
+    # ==================== 打包 ====================
+
+    def _build(self, record: Dict, key: Tuple[str, str]) -> None:
+        """打包记录的图片（在后台线程中执行）"""
+        record_id = record["id"]
+        tmp_path = None
+        try:
+            task_dir = self._get_task_dir(record)
+            if task_dir is None:
+                return
+            entries = list_export_entries(task_dir)
+            fingerprint = self._fingerprint(record, entries)
+            filename = self._get_filename(record_id, fingerprint)
+            with self._lock:
+                self._load_locked()
+                if filename in self._entries:
+                    return
+
+            os.makedirs(self.export_dir, exist_ok=True)
+            tmp_path = os.path.join(self.export_dir, f".{filename}.tmp")
+            size = 0
+            with open(tmp_path, "wb") as f:
+                for chunk in iter_zip(entries):
+                    f.write(chunk)
+                    size += len(chunk)
+
+            # 打包期间图片被修改：结果已过期，丢弃
+            if self._fingerprint(record, entries) != fingerprint:
+                return
+
+            with self._lock:
+                if self._invalidations.get(record_id, 0) != self._pending[key]:
+                    return
+                os.replace(tmp_path, os.path.join(self.export_dir, filename))
+                tmp_path = None
+                # 同一记录的旧版本压缩包不会再命中
+                prefix = f"{record_id}."
+                stale = [name for name in self._entries if name.startswith(prefix)]
+                for name in stale:
+                    self._total_bytes -= self._entries.pop(name)
+                self._entries[filename] = size
+                self._total_bytes += size
+                self.builds += 1
+                stale.extend(self._evict_locked())
+            self._remove_files(stale)
+            logger.debug(f"导出压缩包已生成: {filename} ({size} 字节)")
+        except Exception as e:
+            logger.warning(f"导出压缩包生成失败: {record_id}, {e}")
+            with self._lock:
+                self.build_failures += 1
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            with self._lock:
+                del self._pending[key]
+                if not any(pending_id == record_id for pending_id, _ in self._pending):
+                    self._invalidations.pop(record_id, None)
+
+    # ==================== 容量管理 ====================
+
+    def _load_locked(self) -> None:
+        """从缓存目录加载已有压缩包，按修改时间近似最近下载顺序（调用方持有锁）"""
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        if not os.path.isdir(self.export_dir):
+            return
+
+        files = []
+        for entry in os.scandir(self.export_dir):
+            try:
+                if entry.name.startswith('.'):
+                    # 上次运行中断留下的临时文件
+                    os.remove(entry.path)
+                elif entry.name.endswith('.zip'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name, stat.st_size))
+            except OSError:
+                continue
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    def _evict_locked(self) -> List[str]:
+        """
+        淘汰最久未下载的压缩包直到总大小不超过上限（调用方持有锁）
+
+        最新的压缩包总会保留，即使它本身超过上限。
+
+        Returns:
+            List[str]: 被淘汰的文件名，由调用方在锁外删除
+        """
+        evicted = []
+        while len(self._entries) > 1 and self._total_bytes > self.max_bytes:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            evicted.append(name)
+        return evicted
+
+    def _remove_files(self, names: List[str]) -> None:
+        """删除缓存文件（正在发送的文件已被打开，删除不影响本次下载）"""
+        for name in names:
+            try:
+                os.remove(os.path.join(self.export_dir, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"删除导出压缩包失败: {name}, {e}")
+
+
+_cache_instance = None
+_cache_lock = threading.Lock()
+
+
+def get_export_cache() -> ExportCache:
+    """获取全局导出压缩包缓存实例"""
+    global _cache_instance
+    if _cache_instance is None:
+        with _cache_lock:
+            if _cache_instance is None:
+                root_dir = os.path.join(
+                    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                    "history"
+                )
+                _cache_instance = ExportCache(
+                    root_dir,
+                    max_bytes=Config.EXPORT_CACHE_MAX_MB * 1024 * 1024,
+                    max_workers=Config.EXPORT_CACHE_WORKERS
+                )
+    return _cache_instance
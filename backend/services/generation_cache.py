@@ -0,0 +1,203 @@
+"""
+图片生成缓存
+
+按内容寻址的本地缓存：以渲染后的提示词、服务商类型、模型、宽高比/尺寸
+以及参考图摘要计算哈希作为键，命中时直接复用之前生成的图片，
+避免重复调用付费服务商。
+
+缓存文件位于 history/.cache 下，按总大小做 LRU 淘汰（以文件修改时间记录最近使用）。
+是否启用由服务商配置中的 enable_cache 决定。
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCache:
+    """大小受限的 LRU 图片生成缓存"""
+
+    FILE_SUFFIX = ".img"
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # key -> 文件大小，按最近使用时间从旧到新排列
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._load_entries()
+
+    @staticmethod
+    def make_key(**parts: Any) -> str:
+        """
+        根据生成参数计算缓存键
+
+        Args:
+            **parts: 影响生成结果的所有参数（提示词、模型、尺寸、参考图摘要等）
+
+        Returns:
+            str: SHA-256 十六进制摘要
+        """
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        """获取缓存文件路径（按键前两位分目录，避免单目录文件过多）"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}{self.FILE_SUFFIX}")
+
+    def _load_entries(self) -> None:
+        """启动时扫描缓存目录，按修改时间恢复 LRU 顺序"""
+        found = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and entry.name.endswith(self.FILE_SUFFIX):
+                    stat = entry.stat()
+                    key = entry.name[:-len(self.FILE_SUFFIX)]
+                    found.append((stat.st_mtime, key, stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+        logger.debug(f"生成缓存加载完成: {len(self._entries)} 项, {self._total_bytes} bytes")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            Optional[bytes]: 命中时返回图片数据，否则返回 None
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # 刷新修改时间，重启后仍能恢复 LRU 顺序
+            os.utime(path, None)
+        except OSError:
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        写入缓存（超出大小上限时淘汰最久未使用的条目）
+
+        Args:
+            key: 缓存键
+            data: 图片数据
+        """
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # 先写临时文件再替换，避免并发读到半个文件
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            # 写入失败（如磁盘已满）时不留下临时文件
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            old_size = self._entries.pop(key, None)
+            if old_size is not None:
+                self._total_bytes -= old_size
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+
+            evicted = []
+            while self._total_bytes > self.max_bytes and self._entries:
+                old_key, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                evicted.append(old_key)
+            self.evictions += len(evicted)
+
+        for old_key in evicted:
+            try:
+                os.remove(self._get_path(old_key))
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_cache_instance = None
+_cache_lock = threading.Lock()
+
+
+def get_generation_cache() -> GenerationCache:
+    """获取全局图片生成缓存实例"""
+    global _cache_instance
+    if _cache_instance is None:
+        with _cache_lock:
+            if _cache_instance is None:
+                cache_dir = os.path.join(
+                    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                    "history",
+                    ".cache"
+                )
+                _cache_instance = GenerationCache(
+                    cache_dir,
+                    max_bytes=Config.IMAGE_CACHE_MAX_MB * 1024 * 1024
+                )
+    return _cache_instance
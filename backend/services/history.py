@@ -8,11 +8,29 @@
 import os
 import json
 import uuid
+import base64
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from pathlib import Path
 from enum import Enum
 
+from backend.config import Config
+from backend.services import history_search
+from backend.services.blob_store import BlobStore, get_blob_store
+from backend.services.dir_reaper import DirectoryReaper
+from backend.services.export_cache import ExportCache, get_export_cache
+from backend.services.history_snapshot import DEFAULT_SORT, SORT_OPTIONS, HistoryIndexSnapshot
+from backend.services.history_store import INDEX_FIELDS, HistoryStore, create_history_store
+from backend.services.image_writer import get_image_writer
+from backend.services.task_state import get_task_state_store
+
+logger = logging.getLogger(__name__)
+
 
 class RecordStatus:
     """历史记录状态常量"""
@@ -24,11 +42,13 @@ class RecordStatus:
 
 
 class HistoryService:
+    OUTLINE_SUFFIX = ".outline.json"
+
     def __init__(self):
         """
         初始化历史记录服务
 
-        创建历史记录存储目录和索引文件
+        创建历史记录存储目录和索引存储（默认 SQLite，首次启动时自动迁移 index.json）
         """
         # 历史记录存储目录（项目根目录/history）
         self.history_dir = os.path.join(
@@ -37,54 +57,189 @@ class HistoryService:
         )
         os.makedirs(self.history_dir, exist_ok=True)
 
-        # 索引文件路径
-        self.index_file = os.path.join(self.history_dir, "index.json")
-        self._init_index()
+        # 索引存储（列表查询所需的摘要字段）
+        self.store: HistoryStore = create_history_store(self.history_dir, Config.HISTORY_STORE_BACKEND)
+
+        # 记录文件的读-改-写需要串行化，避免并发更新互相覆盖
+        self._lock = threading.RLock()
+
+        # 删除记录时，任务目录移入 .trash 后由后台线程删除
+        self.reaper = DirectoryReaper(self.history_dir)
+
+        # 图片按内容去重存储，任务目录中的文件是 blob 的硬链接
+        self.blobs: BlobStore = get_blob_store()
+
+        # 导出压缩包缓存：记录完成时预先打包，记录变化时失效
+        self.exports: ExportCache = get_export_cache()
+
+        # 索引快照：自身每次写入递增代数，快照在代数或存储文件版本变化时重建
+        self._generation = 0
+        self._snapshot: Optional[HistoryIndexSnapshot] = None
 
-    def _init_index(self) -> None:
+    def _get_record_path(self, record_id: str) -> str:
         """
-        初始化索引文件
+        获取历史记录文件路径
+
+        Args:
+            record_id: 记录 ID
 
-        如果索引文件不存在，则创建一个空索引
+        Returns:
+            str: 记录文件的完整路径
         """
-        if not os.path.exists(self.index_file):
-            with open(self.index_file, "w", encoding="utf-8") as f:
-                json.dump({"records": []}, f, ensure_ascii=False, indent=2)
+        return os.path.join(self.history_dir, f"{record_id}.json")
 
-    def _load_index(self) -> Dict:
+    def _get_outline_path(self, record_id: str) -> str:
+        """获取大纲文件路径（大纲与记录分开保存，按需加载）"""
+        return os.path.join(self.history_dir, f"{record_id}{self.OUTLINE_SUFFIX}")
+
+    def _get_snapshot(self) -> HistoryIndexSnapshot:
         """
-        加载索引文件
+        获取当前索引快照（过期时从存储重建）
 
         Returns:
-            Dict: 索引数据，包含 records 列表
+            HistoryIndexSnapshot: 只读快照
+        """
+        # 先读取版本再加载数据：加载期间若有写入，下次调用会再次重建
+        generation = self._generation
+        token = self.store.get_version()
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot.is_current(generation, token):
+            snapshot = HistoryIndexSnapshot(self.store.query(), generation, token)
+            self._snapshot = snapshot
+        return snapshot
+
+    def _invalidate_snapshot(self) -> None:
+        """自身写入后使索引快照失效"""
+        with self._lock:
+            self._generation += 1
+
+    def _ensure_search_index(self) -> None:
+        """全文检索倒排表尚未建立时，从全部记录文件重建（一次性）"""
+        if self.store.search_index_ready():
+            return
+        with self._lock, self.store.transaction():
+            if self.store.search_index_ready():
+                return
+            self.store.reset_search_index()
+            count = 0
+            for entry in self.store.query():
+                record = self.get_record(entry["id"])
+                if record is None:
+                    continue
+                terms = history_search.extract_terms(record.get("title", ""), record.get("outline"))
+                self.store.set_search_terms(entry["id"], terms)
+                count += 1
+            self.store.mark_search_index_ready()
+        logger.info(f"全文检索索引已重建: {count} 条记录")
+
+    def _get_task_disk_usage(self, task_id: Optional[str]) -> int:
         """
+        任务目录中文件的总大小（目录不存在时为 0）
+
+        这是按记录统计的近似值：与其他任务共享同一 blob 的图片在每条记录中各计一次，
+        去重后的实际磁盘占用由 StorageManager 统计。
+        """
+        if not task_id:
+            return 0
+        total = 0
         try:
-            with open(self.index_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {"records": []}
+            with os.scandir(os.path.join(self.history_dir, task_id)) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            return 0
+        return total
+
+    def _ensure_stats(self) -> None:
+        """统计计数器尚未建立时，补全每条记录的图片数和磁盘占用后重建（一次性）"""
+        if self.store.stats_ready():
+            return
+        with self._lock, self.store.transaction():
+            if self.store.stats_ready():
+                return
+            for entry in self.store.query():
+                record = self.get_record(entry["id"], include_outline=False)
+                if record is None:
+                    continue
+                images = record.get("images") or {}
+                self.store.update(entry["id"], {
+                    "image_count": len(images.get("generated") or []),
+                    "disk_bytes": self._get_task_disk_usage(images.get("task_id"))
+                })
+            self.store.rebuild_stats()
+        self._invalidate_snapshot()
+        logger.info("历史记录统计计数器已重建")
+
+    @staticmethod
+    def _write_json(path: str, data: Any) -> None:
+        """紧凑格式写入 JSON 文件（先写临时文件再替换，避免读到写了一半的文件）"""
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def _write_record(self, record: Dict) -> None:
+        """
+        保存记录到独立文件
+
+        记录中带有 outline 时，大纲写入单独的 {record_id}.outline.json，
+        记录文件本身只保存较小的元数据和图片列表。
+        不带 outline 时只重写记录文件，大纲文件保持不变。
+
+        Args:
+            record: 记录（outline 可选）
+        """
+        record = dict(record)
+        if "outline" in record:
+            # 先写大纲再写记录，记录文件中出现新版本时大纲一定已就绪
+            self._write_json(self._get_outline_path(record["id"]), record.pop("outline"))
+        self._write_json(self._get_record_path(record["id"]), record)
 
-    def _save_index(self, index: Dict) -> None:
+    def _read_record(self, record_id: str, include_outline: bool = True) -> Optional[Dict]:
         """
-        保存索引文件
+        读取记录文件
 
         Args:
-            index: 索引数据
+            record_id: 记录 ID
+            include_outline: 是否加载大纲文件；为 False 时不读取、不解析大纲
+                （旧格式记录的大纲内嵌在记录文件中，仍会保留在返回值里，下次写入时拆分）
+
+        Returns:
+            Optional[Dict]: 记录，不存在或损坏时返回 None
         """
-        with open(self.index_file, "w", encoding="utf-8") as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
+        try:
+            with open(self._get_record_path(record_id), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except Exception:
+            return None
 
-    def _get_record_path(self, record_id: str) -> str:
+        if include_outline and "outline" not in record:
+            record["outline"] = self.get_outline(record_id)
+        return record
+
+    def get_outline(self, record_id: str) -> Dict:
         """
-        获取历史记录文件路径
+        单独读取记录的大纲
 
         Args:
             record_id: 记录 ID
 
         Returns:
-            str: 记录文件的完整路径
+            Dict: 大纲内容，不存在时返回空字典
         """
-        return os.path.join(self.history_dir, f"{record_id}.json")
+        try:
+            with open(self._get_outline_path(record_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # 旧格式：大纲内嵌在记录文件中
+            try:
+                with open(self._get_record_path(record_id), "r", encoding="utf-8") as f:
+                    return json.load(f).get("outline") or {}
+            except Exception:
+                return {}
+        except Exception:
+            return {}
 
     def create_record(
         self,
@@ -108,6 +263,14 @@ class HistoryService:
         状态流转：
             新建 -> draft（草稿状态）
         """
+        with self._lock, self.store.transaction():
+            record_id = self._create_record_locked(topic, outline, task_id)
+        self._invalidate_snapshot()
+
+        return record_id
+
+    def _create_record_locked(self, topic: str, outline: Dict, task_id: Optional[str] = None) -> str:
+        """创建新的历史记录（调用方持有锁并已开启索引事务）"""
         # 生成唯一记录 ID
         record_id = str(uuid.uuid4())
         now = datetime.now().isoformat()
@@ -127,14 +290,9 @@ class HistoryService:
             "thumbnail": None  # 初始无缩略图
         }
 
-        # 保存完整记录到独立文件
-        record_path = self._get_record_path(record_id)
-        with open(record_path, "w", encoding="utf-8") as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
-
-        # 更新索引（用于快速列表查询）
-        index = self._load_index()
-        index["records"].insert(0, {
+        # 保存完整记录到独立文件，并更新索引（用于快速列表查询）
+        self._write_record(record)
+        self.store.insert({
             "id": record_id,
             "title": topic,
             "created_at": now,
@@ -142,18 +300,21 @@ class HistoryService:
             "status": RecordStatus.DRAFT,  # 索引中也记录状态
             "thumbnail": None,
             "page_count": len(outline.get("pages", [])),  # 预期页数
-            "task_id": task_id
+            "task_id": task_id,
+            "image_count": 0,
+            "disk_bytes": self._get_task_disk_usage(task_id)
         })
-        self._save_index(index)
+        self.store.set_search_terms(record_id, history_search.extract_terms(topic, outline))
 
         return record_id
 
-    def get_record(self, record_id: str) -> Optional[Dict]:
+    def get_record(self, record_id: str, include_outline: bool = True) -> Optional[Dict]:
         """
         获取历史记录详情
 
         Args:
             record_id: 记录 ID
+            include_outline: 是否包含大纲（只需要图片列表或状态时传 False，不读取大纲文件）
 
         Returns:
             Optional[Dict]: 记录详情，如果不存在则返回 None
@@ -163,21 +324,15 @@ class HistoryService:
             - title: 标题
             - created_at: 创建时间
             - updated_at: 更新时间
-            - outline: 大纲内容
+            - outline: 大纲内容（include_outline 为 False 时不包含）
             - images: 图片信息（task_id 和 generated 列表）
             - status: 当前状态
             - thumbnail: 缩略图文件名
         """
-        record_path = self._get_record_path(record_id)
-
-        if not os.path.exists(record_path):
-            return None
-
-        try:
-            with open(record_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return None
+        record = self._read_record(record_id, include_outline)
+        if record is not None and not include_outline:
+            record.pop("outline", None)
+        return record
 
     def record_exists(self, record_id: str) -> bool:
         """
@@ -192,6 +347,30 @@ class HistoryService:
         record_path = self._get_record_path(record_id)
         return os.path.exists(record_path)
 
+    THUMBNAIL_FLUSH_TIMEOUT = 10  # 更新记录前等待后台缩略图写完的最长秒数（整批共享）
+
+    def _flush_thumbnails(self, images_list: List[Optional[Dict]]) -> None:
+        """
+        等待相关任务还在后台写入的缩略图写完
+
+        磁盘占用在更新记录时统计，缩略图未写完时统计值会缺少缩略图。
+        在获取锁之前调用，等待期间不阻塞其他历史记录操作。
+
+        Args:
+            images_list: 各更新操作的 images 参数（None 或不含 task_id 的项被忽略）
+        """
+        task_ids = {
+            images["task_id"] for images in images_list
+            if isinstance(images, dict) and images.get("task_id")
+        }
+        deadline = time.monotonic() + self.THUMBNAIL_FLUSH_TIMEOUT
+        writer = get_image_writer()
+        for task_id in task_ids:
+            writer.flush(
+                os.path.join(self.history_dir, task_id),
+                timeout=max(deadline - time.monotonic(), 0)
+            )
+
     def update_record(
         self,
         record_id: str,
@@ -224,8 +403,25 @@ class HistoryService:
             partial -> generating: 继续生成剩余图片
             partial -> completed: 剩余图片生成完成
         """
-        # 获取现有记录
-        record = self.get_record(record_id)
+        self._flush_thumbnails([images])
+
+        with self._lock, self.store.transaction():
+            updated = self._update_record_locked(record_id, outline, images, status, thumbnail)
+        if updated:
+            self._invalidate_snapshot()
+        return updated
+
+    def _update_record_locked(
+        self,
+        record_id: str,
+        outline: Optional[Dict] = None,
+        images: Optional[Dict] = None,
+        status: Optional[str] = None,
+        thumbnail: Optional[str] = None
+    ) -> bool:
+        """更新历史记录（调用方持有锁并已开启索引事务）"""
+        # 获取现有记录（不加载大纲；只有传入新大纲时才重写大纲文件）
+        record = self._read_record(record_id, include_outline=False)
         if not record:
             return False
 
@@ -242,6 +438,7 @@ class HistoryService:
             record["images"] = images
 
         # 更新状态（状态流转）
+        previous_status = record.get("status")
         if status is not None:
             record["status"] = status
 
@@ -250,35 +447,39 @@ class HistoryService:
             record["thumbnail"] = thumbnail
 
         # 保存完整记录
-        record_path = self._get_record_path(record_id)
-        with open(record_path, "w", encoding="utf-8") as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
+        self._write_record(record)
 
-        # 同步更新索引
-        index = self._load_index()
-        for idx_record in index["records"]:
-            if idx_record["id"] == record_id:
-                idx_record["updated_at"] = now
+        # 同步更新索引（只写入变化的字段）
+        fields: Dict[str, Any] = {"updated_at": now}
 
-                # 更新状态
-                if status:
-                    idx_record["status"] = status
+        # 更新状态
+        if status:
+            fields["status"] = status
 
-                # 更新缩略图
-                if thumbnail:
-                    idx_record["thumbnail"] = thumbnail
+        # 更新缩略图
+        if thumbnail:
+            fields["thumbnail"] = thumbnail
 
-                # 更新页数（如果大纲被修改）
-                if outline:
-                    idx_record["page_count"] = len(outline.get("pages", []))
+        # 更新页数和检索词项（如果大纲被修改）
+        if outline:
+            fields["page_count"] = len(outline.get("pages", []))
+            self.store.set_search_terms(
+                record_id, history_search.extract_terms(record.get("title", ""), outline)
+            )
 
-                # 更新任务 ID
-                if images is not None and images.get("task_id"):
-                    idx_record["task_id"] = images.get("task_id")
+        # 更新任务 ID（images 中的 task_id 是权威值，保持 task_id -> record_id 反向索引准确）
+        if images is not None:
+            fields["task_id"] = images.get("task_id")
+            # 同时刷新统计计数器所需的图片数和磁盘占用
+            fields["image_count"] = len(images.get("generated") or [])
+            fields["disk_bytes"] = self._get_task_disk_usage(images.get("task_id"))
 
-                break
+        self.store.update(record_id, fields)
 
-        self._save_index(index)
+        # 旧的导出压缩包不再对应记录内容；刚完成的记录在后台预先打包
+        self.exports.invalidate(record_id)
+        if status == RecordStatus.COMPLETED and previous_status != RecordStatus.COMPLETED:
+            self.exports.schedule_build(record)
         return True
 
     def delete_record(self, record_id: str) -> bool:
@@ -287,8 +488,9 @@ class HistoryService:
 
         会同时删除：
         1. 记录 JSON 文件
-        2. 关联的任务图片目录
+        2. 关联的任务图片目录（移入 .trash 后在后台删除）
         3. 索引中的记录
+        4. 关联任务的生成状态（内存和落盘文件）
 
         Args:
             record_id: 记录 ID
@@ -296,41 +498,257 @@ class HistoryService:
         Returns:
             bool: 删除是否成功，记录不存在时返回 False
         """
-        record = self.get_record(record_id)
+        with self._lock, self.store.transaction():
+            deleted = self._delete_record_locked(record_id)
+        if deleted:
+            self._invalidate_snapshot()
+        return deleted
+
+    def _delete_record_locked(self, record_id: str) -> bool:
+        """删除历史记录（调用方持有锁并已开启索引事务）"""
+        record = self.get_record(record_id, include_outline=False)
         if not record:
             return False
 
-        # 删除关联的任务图片目录
+        # 删除记录 JSON 文件和大纲文件，并从索引中移除
+        try:
+            os.remove(self._get_record_path(record_id))
+        except Exception:
+            return False
+        try:
+            os.remove(self._get_outline_path(record_id))
+        except FileNotFoundError:
+            pass
+        self.store.delete(record_id)
+        self.exports.invalidate(record_id)
+
+        # 关联的任务图片目录移入回收目录，由后台线程删除
         if record.get("images") and record["images"].get("task_id"):
-            task_id = record["images"]["task_id"]
-            task_dir = os.path.join(self.history_dir, task_id)
-            if os.path.exists(task_dir) and os.path.isdir(task_dir):
-                try:
-                    import shutil
-                    shutil.rmtree(task_dir)
-                    print(f"已删除任务目录: {task_dir}")
-                except Exception as e:
-                    print(f"删除任务目录失败: {task_dir}, {e}")
+            task_dir = os.path.join(self.history_dir, record["images"]["task_id"])
+            # 目录删除后释放其中文件引用的 blob（其他任务仍在使用的内容会保留）
+            blob_names = list(self.blobs.read_manifest(task_dir).values())
+            try:
+                self.reaper.schedule(task_dir, on_removed=lambda: self.blobs.release(blob_names))
+            except Exception as e:
+                logger.warning(f"删除任务目录失败: {task_dir}, {e}")
+            # 任务状态（内存中的封面/参考图）随任务目录一起释放
+            get_task_state_store().discard(record["images"]["task_id"])
 
-        # 删除记录 JSON 文件
-        record_path = self._get_record_path(record_id)
+        return True
+
+    @staticmethod
+    def _parse_fields(fields: Optional[List[str]]) -> Optional[List[str]]:
+        """校验字段投影（id 总是返回），None 表示返回全部字段"""
+        if not fields:
+            return None
+        unknown = [field for field in fields if field not in INDEX_FIELDS]
+        if unknown:
+            raise ValueError(f"不支持的字段: {', '.join(unknown)}，可选字段: {', '.join(INDEX_FIELDS)}")
+        return ["id"] + [field for field in dict.fromkeys(fields) if field != "id"]
+
+    @staticmethod
+    def _check_sort(sort: str) -> None:
+        """校验排序选项"""
+        if sort not in SORT_OPTIONS:
+            raise ValueError(f"不支持的排序方式: {sort}，可选: {', '.join(SORT_OPTIONS)}")
+
+    @staticmethod
+    def _encode_cursor(sort: str, status: Optional[str], key: Tuple[str, str]) -> str:
+        """把排序方式、状态过滤和排序键编码为不透明游标"""
+        payload = json.dumps([sort, status, key[0], key[1]], ensure_ascii=False, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor: str, sort: str, status: Optional[str]) -> Tuple[str, str]:
+        """解析游标，游标与当前排序方式或状态过滤不一致时抛出 ValueError"""
         try:
-            os.remove(record_path)
+            padded = cursor + "=" * (-len(cursor) % 4)
+            cursor_sort, cursor_status, value, record_id = json.loads(base64.urlsafe_b64decode(padded))
         except Exception:
-            return False
+            raise ValueError("无效的分页游标")
+        if cursor_sort != sort or cursor_status != status:
+            raise ValueError("分页游标与当前的排序方式或状态过滤不一致，请从第一页重新开始")
+        return (value, record_id)
+
+    def copy_record(self, record_id: str) -> Optional[str]:
+        """
+        复制历史记录（包括大纲和已生成的图片）
 
-        # 从索引中移除
-        index = self._load_index()
-        index["records"] = [r for r in index["records"] if r["id"] != record_id]
-        self._save_index(index)
+        新记录使用新的任务目录，其中的图片是原任务图片的硬链接，
+        不复制图片内容，耗时与图片大小无关。
 
+        Args:
+            record_id: 要复制的记录 ID
+
+        Returns:
+            Optional[str]: 新记录 ID，原记录不存在时返回 None
+        """
+        with self._lock, self.store.transaction():
+            record = self._read_record(record_id, include_outline=True)
+            if not record:
+                return None
+
+            images = dict(record.get("images") or {})
+            new_task_id = None
+            if images.get("task_id"):
+                new_task_id = f"task_{uuid.uuid4().hex[:8]}"
+                src_dir = os.path.join(self.history_dir, images["task_id"])
+                if os.path.isdir(src_dir):
+                    self.blobs.copy_dir(src_dir, os.path.join(self.history_dir, new_task_id))
+
+            new_id = self._create_record_locked(
+                f"{record.get('title', '')}（副本）", record.get("outline") or {}, new_task_id
+            )
+            images["task_id"] = new_task_id
+            images["generated"] = list(images.get("generated") or [])
+            self._update_record_locked(
+                new_id,
+                images=images,
+                status=record.get("status"),
+                thumbnail=record.get("thumbnail")
+            )
+
+            # 原记录中已被清理的原图在副本中同样不存在
+            if record.get("storage"):
+                copied = self._read_record(new_id, include_outline=False)
+                copied["storage"] = record["storage"]
+                self._write_record(copied)
+        self._invalidate_snapshot()
+
+        logger.info(f"已复制历史记录: {record_id} -> {new_id}")
+        return new_id
+
+    def mark_originals_evicted(self, record_id: str, filenames: List[str]) -> bool:
+        """
+        记录某些原图已因存储配额被清理（只保留缩略图）
+
+        不刷新 updated_at：这不是用户对记录的修改。
+
+        Args:
+            record_id: 记录 ID
+            filenames: 被清理的原图文件名
+
+        Returns:
+            bool: 记录是否存在
+        """
+        with self._lock, self.store.transaction():
+            record = self._read_record(record_id, include_outline=False)
+            if not record:
+                return False
+
+            storage = record.setdefault("storage", {})
+            evicted = list(storage.get("evicted_originals") or [])
+            evicted.extend(name for name in filenames if name not in evicted)
+            storage["evicted_originals"] = evicted
+            storage["evicted_at"] = datetime.now().isoformat()
+            self._write_record(record)
+
+            task_id = (record.get("images") or {}).get("task_id")
+            self.store.update(record_id, {"disk_bytes": self._get_task_disk_usage(task_id)})
+            self.exports.invalidate(record_id)
+        self._invalidate_snapshot()
         return True
 
+    def is_original_evicted(self, task_id: str, filename: str) -> bool:
+        """
+        某张原图是否已因存储配额被清理
+
+        Args:
+            task_id: 任务 ID
+            filename: 原图文件名
+
+        Returns:
+            bool: 是否已被清理（重新生成后文件再次存在时为 False）
+        """
+        if os.path.exists(os.path.join(self.history_dir, task_id, filename)):
+            return False
+        record_id = self.store.find_by_task_id(task_id)
+        record = self.get_record(record_id, include_outline=False) if record_id else None
+        if not record:
+            return False
+        return filename in ((record.get("storage") or {}).get("evicted_originals") or [])
+
+    BATCH_OPERATIONS = ("create", "update", "delete")
+
+    def apply_batch(self, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量创建/更新/删除历史记录
+
+        所有操作在一个索引事务中执行，只写一次索引；任务目录的删除交给后台线程。
+        单个操作失败不影响其他操作。
+
+        Args:
+            operations: 操作列表，每项包含 op 字段：
+                - create: topic, outline, task_id（可选）
+                - update: record_id, outline/images/status/thumbnail（均可选）
+                - delete: record_id
+
+        Returns:
+            List[Dict]: 与 operations 一一对应的结果
+                - index: 操作序号
+                - op: 操作类型
+                - success: 是否成功
+                - record_id: 记录 ID
+                - error: 错误信息（失败时）
+
+        Raises:
+            ValueError: 操作数量超过上限
+        """
+        if len(operations) > Config.HISTORY_BATCH_MAX_OPS:
+            raise ValueError(f"单次最多 {Config.HISTORY_BATCH_MAX_OPS} 个操作，当前 {len(operations)} 个")
+
+        # 与 update_record 一致：统计磁盘占用前先等待缩略图写完
+        self._flush_thumbnails([
+            operation.get("images") for operation in operations
+            if isinstance(operation, dict) and operation.get("op") == "update"
+        ])
+
+        results = []
+        with self._lock, self.store.transaction():
+            for index, operation in enumerate(operations):
+                op = operation.get("op") if isinstance(operation, dict) else None
+                result: Dict[str, Any] = {"index": index, "op": op, "success": False}
+                try:
+                    if op == "create":
+                        if not operation.get("topic") or not operation.get("outline"):
+                            raise ValueError("topic 和 outline 不能为空")
+                        result["record_id"] = self._create_record_locked(
+                            operation["topic"], operation["outline"], operation.get("task_id")
+                        )
+                        result["success"] = True
+                    elif op in ("update", "delete") and not operation.get("record_id"):
+                        raise ValueError("record_id 不能为空")
+                    elif op == "update":
+                        result["record_id"] = operation.get("record_id")
+                        result["success"] = self._update_record_locked(
+                            operation.get("record_id"),
+                            outline=operation.get("outline"),
+                            images=operation.get("images"),
+                            status=operation.get("status"),
+                            thumbnail=operation.get("thumbnail")
+                        )
+                    elif op == "delete":
+                        result["record_id"] = operation.get("record_id")
+                        result["success"] = self._delete_record_locked(operation.get("record_id"))
+                    else:
+                        raise ValueError(f"不支持的操作: {op}，可选: {', '.join(self.BATCH_OPERATIONS)}")
+
+                    if not result["success"]:
+                        result["error"] = f"历史记录不存在: {result['record_id']}"
+                except Exception as e:
+                    result["error"] = str(e)
+                results.append(result)
+
+        self._invalidate_snapshot()
+        return results
+
     def list_records(
         self,
         page: int = 1,
         page_size: int = 20,
-        status: Optional[str] = None
+        status: Optional[str] = None,
+        sort: Optional[str] = None,
+        fields: Optional[List[str]] = None
     ) -> Dict:
         """
         分页获取历史记录列表
@@ -339,6 +757,8 @@ class HistoryService:
             page: 页码，从 1 开始
             page_size: 每页记录数
             status: 状态过滤（可选），支持：draft/generating/partial/completed/error
+            sort: 排序方式（可选，见 SORT_OPTIONS），默认按创建时间倒序
+            fields: 返回的字段（可选，默认全部索引字段）
 
         Returns:
             Dict: 分页结果
@@ -348,18 +768,20 @@ class HistoryService:
                 - page_size: 每页大小
                 - total_pages: 总页数
         """
-        index = self._load_index()
-        records = index.get("records", [])
-
-        # 按状态过滤
-        if status:
-            records = [r for r in records if r.get("status") == status]
+        fields = self._parse_fields(fields)
+        if sort is not None:
+            self._check_sort(sort)
 
-        # 分页计算
-        total = len(records)
+        # 快照中已按状态分桶并排好序，分页只需切片
+        snapshot = self._get_snapshot()
+        total = snapshot.count(status)
         start = (page - 1) * page_size
-        end = start + page_size
-        page_records = records[start:end]
+        if sort is None and fields is None:
+            page_records = snapshot.page(status, offset=start, limit=page_size)
+        else:
+            page_records = snapshot.page_sorted(
+                sort or DEFAULT_SORT, status, offset=start, limit=page_size, fields=fields
+            )
 
         return {
             "records": page_records,
@@ -369,27 +791,113 @@ class HistoryService:
             "total_pages": (total + page_size - 1) // page_size
         }
 
-    def search_records(self, keyword: str) -> List[Dict]:
+    def list_records_by_cursor(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        status: Optional[str] = None,
+        sort: str = DEFAULT_SORT,
+        fields: Optional[List[str]] = None
+    ) -> Dict:
         """
-        根据关键词搜索历史记录
+        游标分页获取历史记录列表
+
+        按 (排序时间, 记录 ID) 定位，翻页期间新建的记录不会导致后续页面重复或遗漏，
+        深分页也不需要从头扫描。
 
         Args:
-            keyword: 搜索关键词（不区分大小写）
+            cursor: 上一页返回的 next_cursor（为空表示第一页）
+            limit: 每页记录数
+            status: 状态过滤（可选）
+            sort: 排序方式（见 SORT_OPTIONS），默认按创建时间倒序
+            fields: 返回的字段（可选，默认全部索引字段）
 
         Returns:
-            List[Dict]: 匹配的记录列表（按创建时间倒序）
+            Dict: 分页结果
+                - records: 当前页的记录列表
+                - next_cursor: 下一页游标（没有更多记录时为 None）
+                - has_more: 是否还有更多记录
+                - total: 总记录数
+                - limit: 每页大小
+                - sort: 排序方式
+
+        Raises:
+            ValueError: 排序方式、字段或游标无效
         """
-        index = self._load_index()
-        records = index.get("records", [])
+        self._check_sort(sort)
+        fields = self._parse_fields(fields)
+        after = self._decode_cursor(cursor, sort, status) if cursor else None
 
-        # 不区分大小写的标题搜索
-        keyword_lower = keyword.lower()
-        results = [
-            r for r in records
-            if keyword_lower in r.get("title", "").lower()
-        ]
+        snapshot = self._get_snapshot()
+        page_records, next_key = snapshot.page_after(sort, after, status, limit=limit, fields=fields)
 
-        return results
+        return {
+            "records": page_records,
+            "next_cursor": self._encode_cursor(sort, status, next_key) if next_key else None,
+            "has_more": next_key is not None,
+            "total": snapshot.count(status),
+            "limit": limit,
+            "sort": sort
+        }
+
+    def search_records(self, keyword: str, page: int = 1, page_size: int = 20) -> Dict:
+        """
+        根据关键词全文搜索历史记录（标题和大纲页面内容）
+
+        Args:
+            keyword: 搜索关键词（不区分大小写，支持中文）
+            page: 页码，从 1 开始
+            page_size: 每页记录数
+
+        Returns:
+            Dict: 分页结果
+                - records: 当前页的记录列表（按相关度排序，含 score）
+                - total: 匹配的记录总数
+                - page: 当前页码
+                - page_size: 每页大小
+                - total_pages: 总页数
+        """
+        snapshot = self._get_snapshot()
+        self._ensure_search_index()
+        terms = history_search.query_terms(keyword)
+        literals = history_search.literal_terms(keyword)
+        scores = history_search.rank(self.store, terms, snapshot.count()) if terms else {}
+
+        if literals:
+            # 单个 ASCII 字符没有索引：在倒排结果（或全部记录）的标题中做子串匹配
+            if terms:
+                candidates = (
+                    (record_id, snapshot.records[snapshot.positions[record_id]].get("title"))
+                    for record_id in scores if record_id in snapshot.positions
+                )
+            else:
+                candidates = ((record["id"], record.get("title")) for record in snapshot.records)
+            scores = {
+                record_id: scores.get(record_id, 0.0) + score
+                for record_id, score in history_search.match_titles(candidates, literals).items()
+            }
+
+        # 相关度从高到低，同分时新记录在前；只对当前页之前的结果排序
+        matched = [(score, record_id) for record_id, score in scores.items() if record_id in snapshot.positions]
+        start = (page - 1) * page_size
+        top = heapq.nsmallest(
+            start + page_size, matched, key=lambda item: (-item[0], snapshot.positions[item[1]])
+        )
+
+        page_records = []
+        for score, record_id in top[start:]:
+            entry = snapshot.get(record_id)
+            entry["score"] = round(score, 4)
+            page_records.append(entry)
+
+        total = len(matched)
+        return {
+            "records": page_records,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (total + page_size - 1) // page_size
+        }
 
     def get_statistics(self) -> Dict:
         """
@@ -404,22 +912,141 @@ class HistoryService:
                     - partial: 部分完成数
                     - completed: 已完成数
                     - error: 错误数
+                - total_pages: 大纲总页数
+                - total_images: 已生成的图片总数
+                - total_bytes: 各记录任务目录的文件大小之和（字节，近似值：
+                  共享的图片在每条记录中各计一次，实际占用见 StorageManager）
+                - usage_by_status: 各状态的页数、图片数和磁盘占用
         """
-        index = self._load_index()
-        records = index.get("records", [])
+        # 计数器随记录创建、状态变化和删除增量维护，这里只读取
+        self._ensure_stats()
+        stats = self.store.get_stats()
+
+        return {
+            "total": sum(bucket["records"] for bucket in stats.values()),
+            "by_status": {status: bucket["records"] for status, bucket in stats.items()},
+            "total_pages": sum(bucket["pages"] for bucket in stats.values()),
+            "total_images": sum(bucket["images"] for bucket in stats.values()),
+            "total_bytes": sum(bucket["bytes"] for bucket in stats.values()),
+            "usage_by_status": {
+                status: {"pages": bucket["pages"], "images": bucket["images"], "bytes": bucket["bytes"]}
+                for status, bucket in stats.items()
+            }
+        }
 
-        total = len(records)
-        status_count = {}
+    SCAN_STATE_FILENAME = ".scan_state.json"
 
-        # 统计各状态的记录数
-        for record in records:
-            status = record.get("status", RecordStatus.DRAFT)
-            status_count[status] = status_count.get(status, 0) + 1
+    @staticmethod
+    def _get_image_index(filename: str) -> int:
+        """图片文件名对应的页码（用于数字排序）"""
+        try:
+            return int(filename.split('.')[0])
+        except ValueError:
+            return 999
 
-        return {
-            "total": total,
-            "by_status": status_count
+    def _scan_task(
+        self,
+        task_id: str,
+        known: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], List[int]]:
+        """
+        扫描单个任务目录，计算需要同步到记录的内容（不写入）
+
+        Args:
+            task_id: 任务 ID
+            known: 上次扫描保存的状态（指纹、结果和记录的 updated_at），
+                目录指纹和记录都未变化时直接复用
+
+        Returns:
+            (扫描结果, 记录更新参数（无需更新时为 None）, 目录指纹 [mtime_ns, 条目数])
+        """
+        task_dir = os.path.join(self.history_dir, task_id)
+
+        # 先取目录 mtime 再列目录：列目录期间的新文件会在下次扫描时被发现
+        dir_mtime = os.stat(task_dir).st_mtime_ns
+
+        # 扫描目录下所有图片文件（排除缩略图）
+        image_files = []
+        entry_count = 0
+        disk_bytes = 0
+        with os.scandir(task_dir) as entries:
+            for entry in entries:
+                entry_count += 1
+                if entry.is_file(follow_symlinks=False):
+                    disk_bytes += entry.stat(follow_symlinks=False).st_size
+                filename = entry.name
+                # 跳过缩略图文件（以 thumb_ 开头）
+                if filename.startswith('thumb_'):
+                    continue
+                if filename.endswith('.png') or filename.endswith('.jpg') or filename.endswith('.jpeg'):
+                    image_files.append(filename)
+
+        fingerprint = [dir_mtime, entry_count]
+
+        # 通过 task_id -> record_id 反向索引查找关联的历史记录
+        record_id = self.store.find_by_task_id(task_id)
+        entry = (self.store.get(record_id) if record_id else None) or {}
+
+        if (
+            known is not None
+            and known.get("fingerprint") == fingerprint
+            and known["result"].get("record_id") == record_id
+            and known.get("updated_at") == entry.get("updated_at")
+            and known["result"].get("status") == entry.get("status")
+        ):
+            # 目录和记录自上次扫描后都没有变化
+            return dict(known["result"], skipped=True), None, fingerprint
+
+        # 按文件名排序（数字排序）
+        image_files.sort(key=self._get_image_index)
+
+        record = self.get_record(record_id, include_outline=False) if record_id else None
+
+        if not record:
+            # 没有关联的记录，返回扫描结果
+            return {
+                "success": True,
+                "task_id": task_id,
+                "images_count": len(image_files),
+                "images": image_files,
+                "no_record": True
+            }, None, fingerprint
+
+        # 根据生成图片数量判断状态（预期页数取自索引，无需解析大纲）
+        expected_count = entry.get("page_count") or 0
+        actual_count = len(image_files)
+
+        if actual_count == 0:
+            status = RecordStatus.DRAFT  # 无图片：草稿
+        elif actual_count >= expected_count:
+            status = RecordStatus.COMPLETED  # 全部完成
+        else:
+            status = RecordStatus.PARTIAL  # 部分完成
+
+        images = {
+            "task_id": task_id,
+            "generated": image_files
         }
+        thumbnail = image_files[0] if image_files else None
+
+        # 记录（及索引中的磁盘占用）已与目录一致时不再重写
+        update = None
+        if (
+            record.get("images") != images
+            or record.get("status") != status
+            or (thumbnail is not None and record.get("thumbnail") != thumbnail)
+            or entry.get("disk_bytes") != disk_bytes
+        ):
+            update = {"images": images, "status": status, "thumbnail": thumbnail}
+
+        return {
+            "success": True,
+            "record_id": record_id,
+            "task_id": task_id,
+            "images_count": len(image_files),
+            "images": image_files,
+            "status": status
+        }, update, fingerprint
 
     def scan_and_sync_task_images(self, task_id: str) -> Dict[str, Any]:
         """
@@ -452,77 +1079,11 @@ class HistoryService:
             }
 
         try:
-            # 扫描目录下所有图片文件（排除缩略图）
-            image_files = []
-            for filename in os.listdir(task_dir):
-                # 跳过缩略图文件（以 thumb_ 开头）
-                if filename.startswith('thumb_'):
-                    continue
-                if filename.endswith('.png') or filename.endswith('.jpg') or filename.endswith('.jpeg'):
-                    image_files.append(filename)
-
-            # 按文件名排序（数字排序）
-            def get_index(filename):
-                try:
-                    return int(filename.split('.')[0])
-                except:
-                    return 999
-
-            image_files.sort(key=get_index)
-
-            # 查找关联的历史记录
-            index = self._load_index()
-            record_id = None
-            for rec in index.get("records", []):
-                # 通过遍历所有记录，找到 task_id 匹配的记录
-                record_detail = self.get_record(rec["id"])
-                if record_detail and record_detail.get("images", {}).get("task_id") == task_id:
-                    record_id = rec["id"]
-                    break
-
-            if record_id:
-                # 更新历史记录
-                record = self.get_record(record_id)
-                if record:
-                    # 根据生成图片数量判断状态
-                    expected_count = len(record.get("outline", {}).get("pages", []))
-                    actual_count = len(image_files)
-
-                    if actual_count == 0:
-                        status = RecordStatus.DRAFT  # 无图片：草稿
-                    elif actual_count >= expected_count:
-                        status = RecordStatus.COMPLETED  # 全部完成
-                    else:
-                        status = RecordStatus.PARTIAL  # 部分完成
-
-                    # 更新图片列表和状态
-                    self.update_record(
-                        record_id,
-                        images={
-                            "task_id": task_id,
-                            "generated": image_files
-                        },
-                        status=status,
-                        thumbnail=image_files[0] if image_files else None
-                    )
-
-                    return {
-                        "success": True,
-                        "record_id": record_id,
-                        "task_id": task_id,
-                        "images_count": len(image_files),
-                        "images": image_files,
-                        "status": status
-                    }
-
-            # 没有关联的记录，返回扫描结果
-            return {
-                "success": True,
-                "task_id": task_id,
-                "images_count": len(image_files),
-                "images": image_files,
-                "no_record": True
-            }
+            result, update, _ = self._scan_task(task_id)
+            if update is not None:
+                # 更新图片列表和状态
+                self.update_record(result["record_id"], **update)
+            return result
 
         except Exception as e:
             return {
@@ -530,18 +1091,41 @@ class HistoryService:
                 "error": f"扫描任务失败: {str(e)}"
             }
 
-    def scan_all_tasks(self) -> Dict[str, Any]:
+    def _load_scan_state(self) -> Dict[str, Any]:
+        """读取上次扫描保存的各任务目录指纹"""
+        try:
+            with open(os.path.join(self.history_dir, self.SCAN_STATE_FILENAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save_scan_state(self, state: Dict[str, Any]) -> None:
+        """保存各任务目录指纹（先写临时文件再替换）"""
+        path = os.path.join(self.history_dir, self.SCAN_STATE_FILENAME)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def scan_all_tasks(self, force: bool = False) -> Dict[str, Any]:
         """
         扫描所有任务文件夹，同步图片列表
 
-        批量扫描 history 目录下的所有任务文件夹，
-        同步图片列表并更新记录状态。
+        增量扫描 history 目录下的所有任务文件夹：
+        - 每个任务目录记录指纹（目录 mtime + 条目数），目录和关联记录（updated_at、状态）都未变化时直接跳过
+        - 变化的目录在线程池中并行扫描
+        - 所有记录更新在一个索引事务中完成，只写一次索引
+
+        Args:
+            force: 是否忽略指纹，重新扫描全部目录
 
         Returns:
             Dict[str, Any]: 扫描结果统计
                 - success: 是否成功
                 - total_tasks: 扫描的任务总数
                 - synced: 成功同步的任务数
+                - updated: 记录有变化并已更新的任务数
+                - skipped: 目录未变化而跳过的任务数
                 - failed: 失败的任务数
                 - orphan_tasks: 孤立任务列表（有图片但无记录）
                 - results: 详细结果列表
@@ -554,38 +1138,71 @@ class HistoryService:
             }
 
         try:
+            known_state = {} if force else self._load_scan_state()
+
+            # 只处理目录（任务文件夹），跳过 .cache 等内部目录；假设任务文件夹名就是 task_id
+            with os.scandir(self.history_dir) as entries:
+                task_ids = sorted(
+                    entry.name for entry in entries
+                    if not entry.name.startswith('.') and entry.is_dir()
+                )
+
+            def scan_one(task_id: str):
+                try:
+                    return self._scan_task(task_id, known_state.get(task_id))
+                except Exception as e:
+                    return {"success": False, "error": f"扫描任务失败: {str(e)}"}, None, None
+
+            with ThreadPoolExecutor(
+                max_workers=Config.HISTORY_SCAN_WORKERS,
+                thread_name_prefix="history-scan"
+            ) as executor:
+                scanned = list(executor.map(scan_one, task_ids))
+
+            # 所有记录更新一次提交
+            updates = [(result, update) for result, update, _ in scanned if update is not None]
+            if updates:
+                with self._lock, self.store.transaction():
+                    for result, update in updates:
+                        self._update_record_locked(result["record_id"], **update)
+                self._invalidate_snapshot()
+
             synced_count = 0
+            skipped_count = 0
             failed_count = 0
             orphan_tasks = []  # 没有关联记录的任务
             results = []
+            new_state = {}
+            # 保存的是更新后的 updated_at，下次扫描据此判断记录是否被其他途径修改
+            updated_at = {entry["id"]: entry.get("updated_at") for entry in self.store.query()}
 
-            # 遍历 history 目录
-            for item in os.listdir(self.history_dir):
-                item_path = os.path.join(self.history_dir, item)
-
-                # 只处理目录（任务文件夹）
-                if not os.path.isdir(item_path):
-                    continue
-
-                # 假设任务文件夹名就是 task_id
-                task_id = item
-
-                # 扫描并同步
-                result = self.scan_and_sync_task_images(task_id)
+            for task_id, (result, _, fingerprint) in zip(task_ids, scanned):
                 results.append(result)
-
-                if result.get("success"):
-                    if result.get("no_record"):
-                        orphan_tasks.append(task_id)
-                    else:
-                        synced_count += 1
-                else:
+                if not result.get("success"):
                     failed_count += 1
+                elif result.get("no_record"):
+                    # 孤立任务每次都重新检查，记录可能稍后才创建
+                    orphan_tasks.append(task_id)
+                else:
+                    synced_count += 1
+                    if result.get("skipped"):
+                        skipped_count += 1
+                    saved = {k: v for k, v in result.items() if k != "skipped"}
+                    new_state[task_id] = {
+                        "fingerprint": fingerprint,
+                        "result": saved,
+                        "updated_at": updated_at.get(result["record_id"]),
+                    }
+
+            # 已删除的任务目录不再保留指纹
+            self._save_scan_state(new_state)
 
             return {
                 "success": True,
                 "total_tasks": len(results),
                 "synced": synced_count,
+                "updated": len(updates),
+                "skipped": skipped_count,
                 "failed": failed_count,
                 "orphan_tasks": orphan_tasks,
                 "results": results
@@ -0,0 +1,158 @@
+"""
+历史记录全文检索
+
+基于倒排索引搜索记录标题和大纲页面内容（outline.pages[*].content）：
+- 文本按非文字字符切分成片段，每个片段取相邻两字（bigram）作为词项，
+  中文无需分词即可检索；非 ASCII 单字也作为词项，支持单字搜索
+- 查询词同样切分，记录必须包含全部词项
+- 单个 ASCII 字符（如 "5"、"a"）不建索引，回退为标题子串匹配
+- 按 TF-IDF 排序，标题命中的权重高于正文
+
+倒排表由历史记录索引存储保存（见 HistoryStore.set_search_terms），
+创建、修改大纲、删除记录时增量更新，搜索时只读取查询词项的倒排列表。
+"""
+
+import re
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.services.history_store import HistoryStore
+
+# 标题中的词项权重（相对正文）
+TITLE_WEIGHT = 3.0
+
+# 词频饱和参数：同一词项重复出现时得分增长逐渐放缓
+TF_SATURATION = 1.2
+
+_SEGMENT_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    把文本切分为检索词项
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        List[str]: 词项列表（可重复，用于统计词频）
+    """
+    terms: List[str] = []
+    for segment in _SEGMENT_RE.findall((text or "").lower()):
+        terms.extend(ch for ch in segment if not ch.isascii())
+        terms.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return terms
+
+
+def extract_terms(title: str, outline: Optional[Dict]) -> Dict[str, Tuple[int, int]]:
+    """
+    提取一条记录的词项
+
+    Args:
+        title: 记录标题
+        outline: 大纲（取 pages[*].content）
+
+    Returns:
+        Dict[str, Tuple[int, int]]: 词项 -> (标题词频, 正文词频)
+    """
+    title_tf = Counter(tokenize(title))
+    content_tf: Counter = Counter()
+    for page in (outline or {}).get("pages", []) or []:
+        if isinstance(page, dict):
+            content_tf.update(tokenize(page.get("content") or ""))
+
+    return {
+        term: (title_tf.get(term, 0), content_tf.get(term, 0))
+        for term in set(title_tf) | set(content_tf)
+    }
+
+
+def query_terms(keyword: str) -> List[str]:
+    """
+    把搜索关键词切分为词项（去重）
+
+    两个字以上的片段只用 bigram 匹配；单字片段用单字匹配（仅非 ASCII 字符被索引，
+    单个 ASCII 字符见 literal_terms）。
+    """
+    terms: List[str] = []
+    for segment in _SEGMENT_RE.findall((keyword or "").lower()):
+        if len(segment) == 1:
+            if not segment.isascii():
+                terms.append(segment)
+        else:
+            terms.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def literal_terms(keyword: str) -> List[str]:
+    """
+    搜索关键词中未被索引的单字片段（单个 ASCII 字母或数字，去重）
+
+    这些片段无法通过倒排表查找，由 match_titles 对标题做子串匹配。
+    """
+    return list(dict.fromkeys(
+        segment for segment in _SEGMENT_RE.findall((keyword or "").lower())
+        if len(segment) == 1 and segment.isascii()
+    ))
+
+
+def match_titles(titles: Iterable[Tuple[str, Optional[str]]], literals: List[str]) -> Dict[str, float]:
+    """
+    标题子串匹配：标题必须包含全部单字片段
+
+    Args:
+        titles: (记录 ID, 标题) 列表
+        literals: literal_terms 返回的单字片段
+
+    Returns:
+        Dict[str, float]: 记录 ID -> 得分（按标题权重和词频计算，不含 IDF）
+    """
+    scores: Dict[str, float] = {}
+    for record_id, title in titles:
+        title = (title or "").lower()
+        counts = [title.count(literal) for literal in literals]
+        if all(counts):
+            scores[record_id] = sum(TITLE_WEIGHT * tf / (tf + TF_SATURATION) for tf in counts)
+    return scores
+
+
+def rank(store: HistoryStore, terms: List[str], total_docs: int) -> Dict[str, float]:
+    """
+    计算包含全部词项的记录及其得分
+
+    Args:
+        store: 保存倒排表的索引存储
+        terms: 查询词项
+        total_docs: 记录总数（用于计算 IDF）
+
+    Returns:
+        Dict[str, float]: 记录 ID -> 得分
+    """
+    if not terms:
+        return {}
+
+    postings = [store.get_postings(term) for term in terms]
+    # 从最短的倒排列表开始求交集
+    postings.sort(key=len)
+    if not postings[0]:
+        return {}
+
+    scores: Dict[str, float] = dict.fromkeys(postings[0], 0.0)
+    for plist in postings:
+        idf = math.log(1 + total_docs / len(plist))
+        matched: Dict[str, float] = {}
+        for record_id, score in scores.items():
+            tf = plist.get(record_id)
+            if tf is None:
+                continue
+            title_tf, content_tf = tf
+            weight = (
+                TITLE_WEIGHT * title_tf / (title_tf + TF_SATURATION)
+                + content_tf / (content_tf + TF_SATURATION)
+            )
+            matched[record_id] = score + idf * weight
+        scores = matched
+        if not scores:
+            break
+    return scores
@@ -0,0 +1,193 @@
+"""
+历史记录索引快照
+
+列表页会频繁轮询 /api/history 和 /history/search。
+HistoryService 在内存中保存一份解析好的、不可变的索引快照：
+- 预先按创建时间倒序排好（同一时间按记录 ID，与游标分页的排序键一致），
+  并按状态分桶，分页只需切片 O(page_size)
+- 记录 ID 到位置的映射，供全文检索取回结果条目
+- 按创建/更新时间排序的视图在首次使用时构建，之后游标翻页只需二分查找 O(log n + page_size)
+- 自身写入时递增代数（generation）使快照失效
+- 其他进程修改存储文件时，通过文件 mtime/size 变化发现并重建
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# 排序选项 -> (排序字段, 是否倒序)；同一时间的条目再按记录 ID 排序，保证顺序唯一
+SORT_OPTIONS = {
+    "created_at_desc": ("created_at", True),
+    "created_at_asc": ("created_at", False),
+    "updated_at_desc": ("updated_at", True),
+    "updated_at_asc": ("updated_at", False),
+}
+
+DEFAULT_SORT = "created_at_desc"
+
+# 游标：排序键（排序字段的值, 记录 ID）
+SortKey = Tuple[str, str]
+
+
+class HistoryIndexSnapshot:
+    """某一时刻的历史记录索引（只读）"""
+
+    def __init__(self, records: List[Dict[str, Any]], generation: int, token: Tuple):
+        """
+        Args:
+            records: 索引条目（任意顺序）
+            generation: 构建快照时 HistoryService 的写入代数
+            token: 构建快照时存储文件的版本（mtime/size）
+        """
+        self.generation = generation
+        self.token = token
+
+        # 条目本身也只读，返回给调用方时再复制当前页
+        # 默认顺序与 created_at_desc 的游标分页使用同一排序键，页码分页和游标分页的同时间条目顺序一致
+        self.records: Tuple[Mapping[str, Any], ...] = tuple(sorted(
+            (MappingProxyType(dict(r)) for r in records),
+            key=lambda r: self.sort_key(r, "created_at"),
+            reverse=True
+        ))
+        # 记录 ID -> 在排序视图中的位置（搜索结果同分时按创建时间倒序）
+        self.positions: Dict[str, int] = {r["id"]: i for i, r in enumerate(self.records)}
+
+        buckets: Dict[str, List[Mapping[str, Any]]] = {}
+        for record in self.records:
+            buckets.setdefault(record.get("status") or "draft", []).append(record)
+        self.by_status: Dict[str, Tuple[Mapping[str, Any], ...]] = {
+            status: tuple(items) for status, items in buckets.items()
+        }
+
+        # (排序字段, 状态) -> (升序排序键, 升序条目)，按需构建
+        self._sorted_views: Dict[Tuple[str, Optional[str]], Tuple[List[SortKey], Tuple[Mapping[str, Any], ...]]] = {}
+        self._views_lock = threading.Lock()
+
+    def is_current(self, generation: int, token: Tuple) -> bool:
+        """快照是否仍然有效"""
+        return self.generation == generation and self.token == token
+
+    def _view(self, status: Optional[str]) -> Tuple[Mapping[str, Any], ...]:
+        """全部条目或某个状态桶"""
+        if status:
+            return self.by_status.get(status, ())
+        return self.records
+
+    def count(self, status: Optional[str] = None) -> int:
+        """统计条目数（可按状态过滤）"""
+        return len(self._view(status))
+
+    def page(
+        self,
+        status: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        取一页条目（返回副本）
+
+        Args:
+            status: 状态过滤（可选）
+            offset: 跳过的条目数
+            limit: 最多返回的条目数（None 表示不限）
+        """
+        end = None if limit is None else offset + limit
+        return [dict(r) for r in self._view(status)[offset:end]]
+
+    @staticmethod
+    def sort_key(record: Mapping[str, Any], field: str) -> SortKey:
+        """条目在某个排序字段下的排序键"""
+        return (record.get(field) or "", record["id"])
+
+    def _sorted_view(
+        self,
+        field: str,
+        status: Optional[str]
+    ) -> Tuple[List[SortKey], Tuple[Mapping[str, Any], ...]]:
+        """按字段升序排列的条目及其排序键（首次使用时构建并缓存）"""
+        cache_key = (field, status or None)
+        with self._views_lock:
+            view = self._sorted_views.get(cache_key)
+            if view is None:
+                items = tuple(sorted(self._view(status), key=lambda r: self.sort_key(r, field)))
+                view = ([self.sort_key(r, field) for r in items], items)
+                self._sorted_views[cache_key] = view
+        return view
+
+    @staticmethod
+    def _project(records: Iterable[Mapping[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """复制条目，只保留指定字段（None 表示全部字段）"""
+        if fields is None:
+            return [dict(r) for r in records]
+        return [{field: r.get(field) for field in fields} for r in records]
+
+    def page_sorted(
+        self,
+        sort: str,
+        status: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 20,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        按排序选项取一页条目（偏移量分页）
+
+        Args:
+            sort: 排序选项（见 SORT_OPTIONS）
+            status: 状态过滤（可选）
+            offset: 跳过的条目数
+            limit: 最多返回的条目数
+            fields: 返回的字段（None 表示全部字段）
+        """
+        field, descending = SORT_OPTIONS[sort]
+        _, items = self._sorted_view(field, status)
+        if descending:
+            end = max(len(items) - offset, 0)
+            selected = reversed(items[max(end - limit, 0):end])
+        else:
+            selected = items[offset:offset + limit]
+        return self._project(selected, fields)
+
+    def page_after(
+        self,
+        sort: str,
+        after: Optional[SortKey] = None,
+        status: Optional[str] = None,
+        limit: int = 20,
+        fields: Optional[List[str]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[SortKey]]:
+        """
+        取排在某个排序键之后的一页条目（游标分页）
+
+        翻页期间插入的新记录不会使后续页面的条目重复或错位。
+
+        Args:
+            sort: 排序选项（见 SORT_OPTIONS）
+            after: 上一页最后一条的排序键（None 表示第一页）
+            status: 状态过滤（可选）
+            limit: 最多返回的条目数
+            fields: 返回的字段（None 表示全部字段）
+
+        Returns:
+            (当前页条目, 下一页的游标键；没有更多条目时为 None)
+        """
+        field, descending = SORT_OPTIONS[sort]
+        keys, items = self._sorted_view(field, status)
+        if descending:
+            end = len(items) if after is None else bisect_left(keys, after)
+            start = max(end - limit, 0)
+            selected = items[start:end][::-1]
+            has_more = start > 0
+        else:
+            start = 0 if after is None else bisect_right(keys, after)
+            selected = items[start:start + limit]
+            has_more = start + limit < len(items)
+
+        next_key = self.sort_key(selected[-1], field) if selected and has_more else None
+        return self._project(selected, fields), next_key
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """按 ID 获取条目（返回副本）"""
+        position = self.positions.get(record_id)
+        return dict(self.records[position]) if position is not None else None
@@ -0,0 +1,711 @@
+"""
+历史记录索引存储
+
+HistoryService 的索引（列表页所需的摘要字段）通过可插拔的存储后端读写：
+- SqliteHistoryStore：嵌入式 SQLite（WAL 模式），status/created_at/updated_at/task_id 建有索引，
+  每次修改只写入受影响的行，并在事务中完成
+- JsonHistoryStore：原有的 index.json 布局（每次修改重写整个文件），用于兼容
+
+完整记录（含大纲）仍保存在 history/{record_id}.json 中。
+存储同时保存全文检索的倒排表（词项 -> 记录及词频，见 history_search），
+以及按状态汇总的统计计数器（记录数、页数、图片数、磁盘占用），随索引修改增量维护。
+首次启用 SQLite 后端时，会把已有的 index.json 一次性迁移到数据库中。
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 索引条目包含的字段
+INDEX_FIELDS = (
+    "id", "title", "created_at", "updated_at", "status", "thumbnail", "page_count", "task_id",
+    "image_count", "disk_bytes"
+)
+
+# 统计计数器：按状态汇总的指标 -> 索引条目中对应的字段（None 表示按条数计）
+STAT_FIELDS = {
+    "records": None,
+    "pages": "page_count",
+    "images": "image_count",
+    "bytes": "disk_bytes",
+}
+
+
+def _stat_values(entry: Dict[str, Any]) -> Dict[str, int]:
+    """一条索引条目对统计计数器的贡献"""
+    return {
+        stat: 1 if field is None else int(entry.get(field) or 0)
+        for stat, field in STAT_FIELDS.items()
+    }
+
+
+def file_token(path: str) -> Optional[Tuple[int, int]]:
+    """文件版本（mtime, size），文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class HistoryStore(ABC):
+    """历史记录索引存储接口"""
+
+    @abstractmethod
+    def get_version(self) -> Tuple:
+        """
+        存储文件的版本（mtime/size）
+
+        其他进程修改存储后该值会变化，用于使内存中的快照失效。
+        """
+        pass
+
+    @abstractmethod
+    def transaction(self) -> ContextManager[None]:
+        """
+        事务：块内的所有修改一起提交（异常时全部回滚）
+
+        可以嵌套，只有最外层负责提交。
+        """
+        pass
+
+    @abstractmethod
+    def insert(self, entry: Dict[str, Any]) -> None:
+        """插入索引条目（新记录排在最前）"""
+        pass
+
+    @abstractmethod
+    def update(self, record_id: str, fields: Dict[str, Any]) -> bool:
+        """
+        更新索引条目的部分字段
+
+        Returns:
+            bool: 条目是否存在
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, record_id: str) -> bool:
+        """
+        删除索引条目
+
+        Returns:
+            bool: 条目是否存在
+        """
+        pass
+
+    @abstractmethod
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """获取单个索引条目"""
+        pass
+
+    @abstractmethod
+    def query(self) -> List[Dict[str, Any]]:
+        """全部索引条目（按创建时间倒序），用于构建内存快照"""
+        pass
+
+    @abstractmethod
+    def find_by_task_id(self, task_id: str) -> Optional[str]:
+        """
+        通过任务 ID 查找记录 ID（反向索引）
+
+        多条记录关联同一任务时返回最新创建的一条。
+
+        Returns:
+            Optional[str]: 记录 ID，没有关联记录时返回 None
+        """
+        pass
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        获取按状态汇总的统计计数器（O(状态数)）
+
+        Returns:
+            Dict: 状态 -> {records, pages, images, bytes}
+        """
+        pass
+
+    @abstractmethod
+    def stats_ready(self) -> bool:
+        """统计计数器是否已建立（未建立时需要先补全 image_count/disk_bytes 再重建）"""
+        pass
+
+    @abstractmethod
+    def rebuild_stats(self) -> None:
+        """根据全部索引条目重新计算统计计数器，并标记为已建立"""
+        pass
+
+    @abstractmethod
+    def search_index_ready(self) -> bool:
+        """全文检索倒排表是否已建立（未建立时需要从记录文件重建）"""
+        pass
+
+    @abstractmethod
+    def reset_search_index(self) -> None:
+        """清空倒排表，准备重建"""
+        pass
+
+    @abstractmethod
+    def mark_search_index_ready(self) -> None:
+        """标记倒排表已重建完成"""
+        pass
+
+    @abstractmethod
+    def set_search_terms(self, record_id: str, terms: Dict[str, Tuple[int, int]]) -> None:
+        """
+        写入（替换）一条记录的检索词项
+
+        Args:
+            record_id: 记录 ID
+            terms: 词项 -> (标题词频, 正文词频)
+        """
+        pass
+
+    @abstractmethod
+    def get_postings(self, term: str) -> Dict[str, Tuple[int, int]]:
+        """
+        获取词项的倒排列表
+
+        Returns:
+            Dict[str, Tuple[int, int]]: 记录 ID -> (标题词频, 正文词频)
+        """
+        pass
+
+
+class JsonHistoryStore(HistoryStore):
+    """基于 index.json 的索引存储（每次修改重写整个文件）"""
+
+    def __init__(self, index_file: str):
+        """
+        Args:
+            index_file: index.json 路径
+        """
+        self.index_file = index_file
+        self._lock = threading.RLock()
+        # 事务期间在内存中累积修改，最外层结束时一次写盘
+        self._tx_index: Optional[Dict] = None
+        self._tx_depth = 0
+        # 事务中是否有修改（没有修改时提交不写盘）
+        self._tx_dirty = False
+
+        # 反向索引 task_id -> record_id，及其对应的索引文件版本（mtime, size）
+        self._task_index: Optional[Dict[str, str]] = None
+        self._task_index_token: Optional[Tuple[int, int]] = None
+
+        # 全文检索倒排表（只在内存中，启动后首次搜索时重建）
+        # term -> {record_id: (标题词频, 正文词频)}，以及每条记录包含的词项（用于删除）
+        self._postings: Optional[Dict[str, Dict[str, Tuple[int, int]]]] = None
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._search_token: Optional[Tuple[int, int]] = None
+
+        if not os.path.exists(self.index_file):
+            self._save_index({"records": []})
+
+    def _load_index(self) -> Dict:
+        """加载索引文件"""
+        if self._tx_index is not None:
+            return self._tx_index
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {"records": []}
+
+    def _save_index(self, index: Dict) -> None:
+        """保存索引文件（先写临时文件再替换，避免读到写了一半的文件）"""
+        if self._tx_index is not None:
+            return
+        # 写入前文件已被其他进程修改时，内存中的派生索引不再可信
+        previous = file_token(self.index_file)
+        if previous != self._task_index_token:
+            self._task_index = None
+        if previous != self._search_token:
+            self._postings = None
+
+        tmp_path = f"{self.index_file}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_file)
+
+        # 自身写入不影响仍然有效的派生索引
+        token = file_token(self.index_file)
+        if self._task_index is not None:
+            self._task_index_token = token
+        if self._postings is not None:
+            self._search_token = token
+
+    def get_version(self) -> Tuple:
+        return (file_token(self.index_file),)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self._lock:
+            if self._tx_depth == 0:
+                self._tx_index = self._load_index()
+                self._tx_dirty = False
+            self._tx_depth += 1
+            try:
+                yield
+            except BaseException:
+                self._tx_depth -= 1
+                if self._tx_depth == 0:
+                    self._tx_index = None
+                raise
+            else:
+                self._tx_depth -= 1
+                if self._tx_depth == 0:
+                    index, self._tx_index = self._tx_index, None
+                    if self._tx_dirty:
+                        self._save_index(index)
+
+    def _adjust_stats(self, index: Dict, entry: Dict[str, Any], sign: int) -> None:
+        """把一条索引条目的贡献加入（sign=1）或移出（sign=-1）统计计数器"""
+        stats = index.setdefault("stats", {})
+        bucket = stats.setdefault(entry.get("status") or "draft", dict.fromkeys(STAT_FIELDS, 0))
+        for stat, value in _stat_values(entry).items():
+            bucket[stat] = bucket.get(stat, 0) + sign * value
+
+    def insert(self, entry: Dict[str, Any]) -> None:
+        with self.transaction():
+            index = self._load_index()
+            index["records"].insert(0, dict(entry))
+            self._adjust_stats(index, entry, 1)
+            self._tx_dirty = True
+            # 新记录排在最前，直接成为该任务的最新关联记录
+            if self._task_index is not None and entry.get("task_id"):
+                self._task_index[entry["task_id"]] = entry["id"]
+
+    def update(self, record_id: str, fields: Dict[str, Any]) -> bool:
+        with self.transaction():
+            index = self._load_index()
+            for idx_record in index["records"]:
+                if idx_record["id"] == record_id:
+                    if "task_id" in fields and fields["task_id"] != idx_record.get("task_id"):
+                        self._task_index = None
+                    self._adjust_stats(index, idx_record, -1)
+                    idx_record.update(fields)
+                    self._adjust_stats(index, idx_record, 1)
+                    self._tx_dirty = True
+                    return True
+        return False
+
+    def delete(self, record_id: str) -> bool:
+        with self.transaction():
+            index = self._load_index()
+            records = []
+            for idx_record in index["records"]:
+                if idx_record["id"] == record_id:
+                    self._adjust_stats(index, idx_record, -1)
+                else:
+                    records.append(idx_record)
+            found = len(records) != len(index["records"])
+            if found:
+                index["records"] = records
+                self._task_index = None
+                self._tx_dirty = True
+            self._remove_search_terms(record_id)
+        return found
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for idx_record in self._load_index().get("records", []):
+                if idx_record["id"] == record_id:
+                    return dict(idx_record)
+        return None
+
+    def query(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(r) for r in self._load_index().get("records", [])]
+
+    def find_by_task_id(self, task_id: str) -> Optional[str]:
+        with self._lock:
+            token = file_token(self.index_file)
+            if self._task_index is None or (self._tx_index is None and token != self._task_index_token):
+                # 首次使用、任务关联变化或文件被其他进程修改时重建
+                task_index: Dict[str, str] = {}
+                for record in self._load_index().get("records", []):
+                    if record.get("task_id"):
+                        task_index.setdefault(record["task_id"], record["id"])
+                self._task_index = task_index
+                self._task_index_token = token
+            return self._task_index.get(task_id)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            stats = self._load_index().get("stats", {})
+            return {status: dict(bucket) for status, bucket in stats.items() if bucket.get("records")}
+
+    def stats_ready(self) -> bool:
+        with self._lock:
+            return self._load_index().get("stats_ready", False)
+
+    def rebuild_stats(self) -> None:
+        with self.transaction():
+            index = self._load_index()
+            index["stats"] = {}
+            for idx_record in index["records"]:
+                self._adjust_stats(index, idx_record, 1)
+            index["stats_ready"] = True
+            self._tx_dirty = True
+
+    def search_index_ready(self) -> bool:
+        with self._lock:
+            # 事务中的修改在提交时才写盘，文件版本仍可用于判断
+            return self._postings is not None and file_token(self.index_file) == self._search_token
+
+    def reset_search_index(self) -> None:
+        with self._lock:
+            self._postings = {}
+            self._doc_terms = {}
+            self._search_token = None
+
+    def mark_search_index_ready(self) -> None:
+        with self._lock:
+            self._search_token = file_token(self.index_file)
+
+    def _remove_search_terms(self, record_id: str) -> None:
+        """从倒排表中移除一条记录"""
+        if self._postings is None:
+            return
+        for term in self._doc_terms.pop(record_id, []):
+            plist = self._postings.get(term)
+            if plist is not None:
+                plist.pop(record_id, None)
+                if not plist:
+                    del self._postings[term]
+
+    def set_search_terms(self, record_id: str, terms: Dict[str, Tuple[int, int]]) -> None:
+        with self._lock:
+            if self._postings is None:
+                # 尚未建立，首次搜索时整体重建
+                return
+            self._remove_search_terms(record_id)
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[record_id] = tf
+            self._doc_terms[record_id] = list(terms)
+
+    def get_postings(self, term: str) -> Dict[str, Tuple[int, int]]:
+        with self._lock:
+            return dict((self._postings or {}).get(term, {}))
+
+
+class SqliteHistoryStore(HistoryStore):
+    """基于 SQLite（WAL 模式）的索引存储"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            title TEXT NOT NULL DEFAULT '',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            status TEXT NOT NULL,
+            thumbnail TEXT,
+            page_count INTEGER NOT NULL DEFAULT 0,
+            task_id TEXT,
+            image_count INTEGER NOT NULL DEFAULT 0,
+            disk_bytes INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_records_status ON records (status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_records_created_at ON records (created_at);
+        CREATE INDEX IF NOT EXISTS idx_records_updated_at ON records (updated_at);
+        CREATE INDEX IF NOT EXISTS idx_records_task_id ON records (task_id);
+        CREATE TABLE IF NOT EXISTS search_terms (
+            term TEXT NOT NULL,
+            record_id TEXT NOT NULL,
+            title_tf INTEGER NOT NULL,
+            content_tf INTEGER NOT NULL,
+            PRIMARY KEY (term, record_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_search_terms_record_id ON search_terms (record_id);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS stats (
+            status TEXT PRIMARY KEY,
+            records INTEGER NOT NULL DEFAULT 0,
+            pages INTEGER NOT NULL DEFAULT 0,
+            images INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    # 旧版本数据库中缺少的列：列名 -> 定义
+    ADDED_COLUMNS = {
+        "image_count": "INTEGER NOT NULL DEFAULT 0",
+        "disk_bytes": "INTEGER NOT NULL DEFAULT 0",
+    }
+
+    # 倒排表格式版本，变化时重建
+    SEARCH_INDEX_VERSION = "1"
+
+    # 新记录排在最前；创建时间相同时按插入顺序倒序
+    ORDER_BY = "ORDER BY created_at DESC, seq DESC"
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        # 每个线程使用独立连接；WAL 模式下读写互不阻塞
+        self._local = threading.local()
+        # executescript 会自行提交，不放在事务中执行
+        conn = self._get_connection()
+        conn.executescript(self.SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(records)")}
+        for column, definition in self.ADDED_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f"ALTER TABLE records ADD COLUMN {column} {definition}")
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._get_connection()
+        if self._local.depth > 0:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        # IMMEDIATE：开始时即获取写锁，避免并发写入者在提交时才发现冲突
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth = 0
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            self._local.depth = 0
+            conn.execute("COMMIT")
+
+    def get_version(self) -> Tuple:
+        # WAL 模式下提交先写入 -wal 文件，检查点时才写回主文件
+        return (file_token(self.db_path), file_token(f"{self.db_path}-wal"))
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        """数据库行转换为索引条目"""
+        return {field: row[field] for field in INDEX_FIELDS}
+
+    @staticmethod
+    def _adjust_stats(conn: sqlite3.Connection, entry: Dict[str, Any], sign: int) -> None:
+        """把一条索引条目的贡献加入（sign=1）或移出（sign=-1）统计计数器（调用方已开启事务）"""
+        values = _stat_values(entry)
+        conn.execute(
+            "INSERT INTO stats (status, records, pages, images, bytes) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (status) DO UPDATE SET records = records + excluded.records, "
+            "pages = pages + excluded.pages, images = images + excluded.images, bytes = bytes + excluded.bytes",
+            (entry.get("status") or "draft", *(sign * values[stat] for stat in STAT_FIELDS))
+        )
+
+    def insert(self, entry: Dict[str, Any]) -> None:
+        with self.transaction() as conn:
+            old = conn.execute("SELECT * FROM records WHERE id = ?", (entry["id"],)).fetchone()
+            if old is not None:
+                self._adjust_stats(conn, self._to_dict(old), -1)
+            row = {
+                "id": entry["id"],
+                "title": entry.get("title") or "",
+                "created_at": entry["created_at"],
+                "updated_at": entry.get("updated_at") or entry["created_at"],
+                "status": entry.get("status") or "draft",
+                "thumbnail": entry.get("thumbnail"),
+                "page_count": entry.get("page_count") or 0,
+                "task_id": entry.get("task_id"),
+                "image_count": entry.get("image_count") or 0,
+                "disk_bytes": entry.get("disk_bytes") or 0,
+            }
+            conn.execute(
+                f"INSERT OR REPLACE INTO records ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                tuple(row.values())
+            )
+            self._adjust_stats(conn, row, 1)
+
+    def update(self, record_id: str, fields: Dict[str, Any]) -> bool:
+        fields = {k: v for k, v in fields.items() if k in INDEX_FIELDS and k != "id"}
+        with self.transaction() as conn:
+            row = conn.execute("SELECT * FROM records WHERE id = ?", (record_id,)).fetchone()
+            if row is None or not fields:
+                return row is not None
+            old = self._to_dict(row)
+            assignments = ", ".join(f"{field} = ?" for field in fields)
+            conn.execute(
+                f"UPDATE records SET {assignments} WHERE id = ?",
+                (*fields.values(), record_id)
+            )
+            self._adjust_stats(conn, old, -1)
+            self._adjust_stats(conn, dict(old, **fields), 1)
+            return True
+
+    def delete(self, record_id: str) -> bool:
+        with self.transaction() as conn:
+            row = conn.execute("SELECT * FROM records WHERE id = ?", (record_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM records WHERE id = ?", (record_id,))
+            conn.execute("DELETE FROM search_terms WHERE record_id = ?", (record_id,))
+            self._adjust_stats(conn, self._to_dict(row), -1)
+            return True
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        row = self._get_connection().execute(
+            "SELECT * FROM records WHERE id = ?", (record_id,)
+        ).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def query(self) -> List[Dict[str, Any]]:
+        rows = self._get_connection().execute(f"SELECT * FROM records {self.ORDER_BY}")
+        return [self._to_dict(row) for row in rows]
+
+    def find_by_task_id(self, task_id: str) -> Optional[str]:
+        # task_id 列有索引，查找为 O(log n)
+        row = self._get_connection().execute(
+            f"SELECT id FROM records WHERE task_id = ? {self.ORDER_BY} LIMIT 1", (task_id,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        rows = self._get_connection().execute("SELECT * FROM stats WHERE records > 0")
+        return {row["status"]: {stat: row[stat] for stat in STAT_FIELDS} for row in rows}
+
+    def stats_ready(self) -> bool:
+        row = self._get_connection().execute("SELECT value FROM meta WHERE key = 'stats'").fetchone()
+        return row is not None
+
+    def rebuild_stats(self) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM stats")
+            conn.execute(
+                "INSERT INTO stats (status, records, pages, images, bytes) "
+                "SELECT status, COUNT(*), SUM(page_count), SUM(image_count), SUM(disk_bytes) "
+                "FROM records GROUP BY status"
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stats', '1')")
+
+    def search_index_ready(self) -> bool:
+        row = self._get_connection().execute(
+            "SELECT value FROM meta WHERE key = 'search_index'"
+        ).fetchone()
+        return row is not None and row[0] == self.SEARCH_INDEX_VERSION
+
+    def reset_search_index(self) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM search_terms")
+            conn.execute("DELETE FROM meta WHERE key = 'search_index'")
+
+    def mark_search_index_ready(self) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('search_index', ?)",
+                (self.SEARCH_INDEX_VERSION,)
+            )
+
+    def set_search_terms(self, record_id: str, terms: Dict[str, Tuple[int, int]]) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM search_terms WHERE record_id = ?", (record_id,))
+            conn.executemany(
+                "INSERT INTO search_terms (term, record_id, title_tf, content_tf) VALUES (?, ?, ?, ?)",
+                [(term, record_id, title_tf, content_tf) for term, (title_tf, content_tf) in terms.items()]
+            )
+
+    def get_postings(self, term: str) -> Dict[str, Tuple[int, int]]:
+        rows = self._get_connection().execute(
+            "SELECT record_id, title_tf, content_tf FROM search_terms WHERE term = ?", (term,)
+        )
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def migrate_json_index(index_file: str, store: HistoryStore) -> int:
+    """
+    把 index.json 中的索引条目一次性迁移到新的存储后端
+
+    迁移在一个事务中完成，成功后 index.json 重命名为 index.json.migrated 作为备份，
+    之后不会再次迁移。目标存储中已存在的条目会被跳过，
+    因此在后端之间来回切换（json 后端会恢复 .migrated 文件）不会产生重复条目。
+
+    Args:
+        index_file: index.json 路径
+        store: 目标存储
+
+    Returns:
+        int: 迁移的条目数
+    """
+    if not os.path.exists(index_file):
+        return 0
+
+    with open(index_file, "r", encoding="utf-8") as f:
+        records = json.load(f).get("records", [])
+
+    with store.transaction():
+        # index.json 中新记录在前，倒序插入以保持原有顺序
+        for entry in reversed(records):
+            if not entry.get("id") or not entry.get("created_at"):
+                continue
+            if store.get(entry["id"]) is not None:
+                continue
+            store.insert(entry)
+
+    os.replace(index_file, f"{index_file}.migrated")
+    logger.info(f"历史记录索引已迁移到新的存储后端: {len(records)} 条")
+    return len(records)
+
+
+def create_history_store(history_dir: str, backend: str) -> HistoryStore:
+    """
+    创建历史记录索引存储
+
+    Args:
+        history_dir: 历史记录目录
+        backend: 存储后端（sqlite / json）
+
+    Returns:
+        HistoryStore: 存储实例
+    """
+    index_file = os.path.join(history_dir, "index.json")
+
+    if backend == "json":
+        # 之前用过 SQLite 后端时 index.json 已被迁移为备份，恢复它而不是从空索引开始
+        migrated_file = f"{index_file}.migrated"
+        if not os.path.exists(index_file) and os.path.exists(migrated_file):
+            os.replace(migrated_file, index_file)
+            logger.warning(
+                "已从 index.json.migrated 恢复 JSON 索引；"
+                "使用 SQLite 后端期间新建或修改的记录不在其中，可通过扫描任务目录补全图片信息"
+            )
+        return JsonHistoryStore(index_file)
+
+    if backend != "sqlite":
+        raise ValueError(
+            f"不支持的历史记录存储后端: {backend}\n"
+            "解决方案：将 Config.HISTORY_STORE_BACKEND 设置为 sqlite 或 json"
+        )
+
+    store = SqliteHistoryStore(os.path.join(history_dir, "index.sqlite3"))
+    if os.path.exists(index_file):
+        migrate_json_index(index_file, store)
+    return store
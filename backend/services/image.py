@@ -4,20 +4,27 @@ import os
 import uuid
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, Any, Generator, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Dict, Any, Generator, Iterable, Iterator, List, Optional, Tuple
 from backend.config import Config
 from backend.generators.factory import ImageGeneratorFactory
-from backend.utils.image_compressor import compress_image
+from backend.services.generation_cache import GenerationCache, get_generation_cache
+from backend.services.image_writer import get_image_writer
+from backend.services.scheduler import get_image_scheduler
+from backend.services.task_context import TaskContext
+from backend.services.task_state import get_task_state_store
+from backend.utils.image_compressor import PreparedImage, compress_image, prepare_image
 
 logger = logging.getLogger(__name__)
 
+TASK_CANCELLED_ERROR = "任务已取消"
+
 
 class ImageService:
     """图片生成服务类"""
 
     # 并发配置
-    MAX_CONCURRENT = 15  # 最大并发数
+    MAX_CONCURRENT = Config.IMAGE_PROVIDER_MAX_CONCURRENT  # 单个服务商默认最大并发数
     AUTO_RETRY_COUNT = 1  # 不自动重试，超时后让用户手动重试
 
     def __init__(self, provider_name: str = None):
@@ -48,6 +55,9 @@ class ImageService:
         # 检查是否启用短 prompt 模式
         self.use_short_prompt = provider_config.get('short_prompt', False)
 
+        # 生成缓存（可选）：相同提示词和参数直接复用已生成的图片
+        self.cache = get_generation_cache() if provider_config.get('enable_cache', False) else None
+
         # 加载提示词模板
         self.prompt_template = self._load_prompt_template()
         self.prompt_template_short = self._load_prompt_template(short=True)
@@ -59,11 +69,24 @@ class ImageService:
         )
         os.makedirs(self.history_root_dir, exist_ok=True)
 
-        # 当前任务的输出目录（每个任务一个子文件夹）
-        self.current_task_dir = None
-
-        # 存储任务状态（用于重试）
-        self._task_states: Dict[str, Dict] = {}
+        # 图片写盘器（原图落盘后即返回，缩略图后台生成）
+        self.writer = get_image_writer()
+
+        # 任务状态（用于重试），进程级共享，超限时写入任务目录
+        self.task_states = get_task_state_store()
+
+        # 所有生成调用都提交到进程级共享调度器，按服务商自适应限制在途请求数
+        # 高并发模式从最大窗口起步、遇到限流再收缩；未开启时整个进程内逐张生成，
+        # 除非显式配置了 max_concurrent（此时从 1 起步逐步探测到该上限）
+        high_concurrency = provider_config.get('high_concurrency', False)
+        max_concurrent = provider_config.get('max_concurrent', self.MAX_CONCURRENT if high_concurrency else 1)
+        self.scheduler = get_image_scheduler()
+        self.scheduler.configure_provider(
+            provider_name,
+            max_limit=max_concurrent,
+            min_limit=provider_config.get('min_concurrent', 1),
+            initial=provider_config.get('initial_concurrent', max_concurrent if high_concurrency else 1)
+        )
 
         logger.info(f"ImageService 初始化完成: provider={provider_name}, type={provider_type}")
 
@@ -81,59 +104,118 @@ class ImageService:
         with open(prompt_path, "r", encoding="utf-8") as f:
             return f.read()
 
-    def _save_image(self, image_data: bytes, filename: str, task_dir: str = None) -> str:
+    def _save_image(self, image_data: bytes, filename: str, ctx: TaskContext) -> str:
         """
-        保存图片到本地，同时生成缩略图
+        保存图片到任务目录，缩略图（50KB左右）在后台生成
+
+        原图落盘后即返回，调用方可以立即发送 complete 事件；
+        需要等待缩略图时使用 self.writer.flush(ctx.task_dir)。
 
         Args:
             image_data: 图片二进制数据
             filename: 文件名
-            task_dir: 任务目录（如果为None则使用当前任务目录）
+            ctx: 任务上下文（决定写入哪个任务目录）
 
         Returns:
             保存的文件路径
         """
-        if task_dir is None:
-            task_dir = self.current_task_dir
+        return self.writer.save(ctx.task_dir, filename, image_data)
 
-        if task_dir is None:
-            raise ValueError("任务目录未设置")
+    def _call_generator(
+        self,
+        prompt: str,
+        reference_image: Optional[PreparedImage] = None,
+        user_images: Optional[List[PreparedImage]] = None
+    ) -> bytes:
+        """
+        按服务商类型调用生成器
+
+        Args:
+            prompt: 渲染后的提示词
+            reference_image: 预处理好的参考图片（封面图）
+            user_images: 预处理好的用户参考图片列表
+
+        Returns:
+            图片二进制数据
+        """
+        if self.provider_config.get('type') == 'google_genai':
+            logger.debug(f"  使用 Google GenAI 生成器")
+            return self.generator.generate_image(
+                prompt=prompt,
+                aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
+                temperature=self.provider_config.get('temperature', 1.0),
+                model=self.provider_config.get('model', 'gemini-3-pro-image-preview'),
+                reference_image=reference_image,
+            )
+        elif self.provider_config.get('type') == 'image_api':
+            logger.debug(f"  使用 Image API 生成器")
+            # Image API 支持多张参考图片
+            # 组合参考图片：用户上传的图片 + 封面图
+            reference_images = []
+            if user_images:
+                reference_images.extend(user_images)
+            if reference_image:
+                reference_images.append(reference_image)
+
+            return self.generator.generate_image(
+                prompt=prompt,
+                aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
+                temperature=self.provider_config.get('temperature', 1.0),
+                model=self.provider_config.get('model', 'nano-banana-2'),
+                reference_images=reference_images if reference_images else None,
+            )
+        else:
+            logger.debug(f"  使用 OpenAI 兼容生成器")
+            return self.generator.generate_image(
+                prompt=prompt,
+                size=self.provider_config.get('default_size', '1024x1024'),
+                model=self.provider_config.get('model'),
+                quality=self.provider_config.get('quality', 'standard'),
+            )
 
-        # 保存原图
-        filepath = os.path.join(task_dir, filename)
-        with open(filepath, "wb") as f:
-            f.write(image_data)
+    def _get_cache_key(
+        self,
+        prompt: str,
+        reference_image: Optional[PreparedImage] = None,
+        user_images: Optional[List[PreparedImage]] = None
+    ) -> str:
+        """
+        计算生成缓存键（覆盖所有影响生成结果的参数）
 
-        # 生成缩略图（50KB左右）
-        thumbnail_data = compress_image(image_data, max_size_kb=50)
-        thumbnail_filename = f"thumb_{filename}"
-        thumbnail_path = os.path.join(task_dir, thumbnail_filename)
-        with open(thumbnail_path, "wb") as f:
-            f.write(thumbnail_data)
+        Args:
+            prompt: 渲染后的提示词
+            reference_image: 预处理好的参考图片（封面图）
+            user_images: 预处理好的用户参考图片列表
 
-        return filepath
+        Returns:
+            str: 缓存键
+        """
+        return GenerationCache.make_key(
+            prompt=prompt,
+            provider_type=self.provider_config.get('type', self.provider_name),
+            model=self.provider_config.get('model'),
+            aspect_ratio=self.provider_config.get('default_aspect_ratio'),
+            size=self.provider_config.get('default_size'),
+            image_size=self.provider_config.get('image_size'),
+            quality=self.provider_config.get('quality'),
+            endpoint_type=self.provider_config.get('endpoint_type'),
+            reference=reference_image.digest if reference_image else None,
+            user_images=[img.digest for img in user_images] if user_images else []
+        )
 
     def _generate_single_image(
         self,
         page: Dict,
-        task_id: str,
-        reference_image: Optional[bytes] = None,
-        retry_count: int = 0,
-        full_outline: str = "",
-        user_images: Optional[List[bytes]] = None,
-        user_topic: str = ""
+        ctx: TaskContext,
+        use_cache: bool = True
     ) -> Tuple[int, bool, Optional[str], Optional[str]]:
         """
-        生成单张图片（带自动重试）
+        生成单张图片
 
         Args:
             page: 页面数据
-            task_id: 任务ID
-            reference_image: 参考图片（封面图）
-            retry_count: 当前重试次数
-            full_outline: 完整的大纲文本
-            user_images: 用户上传的参考图片列表
-            user_topic: 用户原始输入
+            ctx: 任务上下文（输出目录、大纲、用户输入、预处理好的参考图）
+            use_cache: 是否读取生成缓存（为 False 时仍会用新结果刷新缓存）
 
         Returns:
             (index, success, filename, error_message)
@@ -141,6 +223,8 @@ class ImageService:
         index = page["index"]
         page_type = page["type"]
         page_content = page["content"]
+        reference_image = ctx.cover_reference
+        user_images = ctx.user_images
 
         try:
             logger.debug(f"生成图片 [{index}]: type={page_type}")
@@ -158,65 +242,111 @@ class ImageService:
                 prompt = self.prompt_template.format(
                     page_content=page_content,
                     page_type=page_type,
-                    full_outline=full_outline,
-                    user_topic=user_topic if user_topic else "未提供"
-                )
-
-            # 调用生成器生成图片
-            if self.provider_config.get('type') == 'google_genai':
-                logger.debug(f"  使用 Google GenAI 生成器")
-                image_data = self.generator.generate_image(
-                    prompt=prompt,
-                    aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
-                    temperature=self.provider_config.get('temperature', 1.0),
-                    model=self.provider_config.get('model', 'gemini-3-pro-image-preview'),
-                    reference_image=reference_image,
-                )
-            elif self.provider_config.get('type') == 'image_api':
-                logger.debug(f"  使用 Image API 生成器")
-                # Image API 支持多张参考图片
-                # 组合参考图片：用户上传的图片 + 封面图
-                reference_images = []
-                if user_images:
-                    reference_images.extend(user_images)
-                if reference_image:
-                    reference_images.append(reference_image)
-
-                image_data = self.generator.generate_image(
-                    prompt=prompt,
-                    aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
-                    temperature=self.provider_config.get('temperature', 1.0),
-                    model=self.provider_config.get('model', 'nano-banana-2'),
-                    reference_images=reference_images if reference_images else None,
-                )
-            else:
-                logger.debug(f"  使用 OpenAI 兼容生成器")
-                image_data = self.generator.generate_image(
-                    prompt=prompt,
-                    size=self.provider_config.get('default_size', '1024x1024'),
-                    model=self.provider_config.get('model'),
-                    quality=self.provider_config.get('quality', 'standard'),
+                    full_outline=ctx.full_outline,
+                    user_topic=ctx.user_topic if ctx.user_topic else "未提供"
                 )
 
-            # 保存图片（使用当前任务目录）
             filename = f"{index}.png"
-            self._save_image(image_data, filename, self.current_task_dir)
+
+            # 任务已取消：排队中的页面不再读缓存或调用服务商，也不再写入任务目录
+            if ctx.cancelled:
+                return (index, False, None, TASK_CANCELLED_ERROR)
+
+            # 命中生成缓存时直接写入任务目录，不再调用服务商
+            cache_key = None
+            if self.cache is not None:
+                cache_key = self._get_cache_key(prompt, reference_image, user_images)
+                if use_cache:
+                    cached_data = self.cache.get(cache_key)
+                    if cached_data is not None:
+                        self._save_image(cached_data, filename, ctx)
+                        logger.info(f"✅ 图片 [{index}] 命中生成缓存: {filename}")
+                        ctx.record_result(True)
+                        return (index, True, filename, None)
+
+            # 调用生成器生成图片，并把结果反馈给调度器以调整并发窗口
+            started_at = time.monotonic()
+            try:
+                image_data = self._call_generator(prompt, reference_image, user_images)
+            except Exception as e:
+                self.scheduler.record_result(self.provider_name, started_at, error=e)
+                raise
+            self.scheduler.record_result(self.provider_name, started_at)
+
+            if cache_key is not None:
+                try:
+                    self.cache.put(cache_key, image_data)
+                except OSError as e:
+                    logger.warning(f"写入生成缓存失败: {e}")
+
+            # 调用期间任务被取消：结果已进入缓存（如启用），不再写入任务目录
+            if ctx.cancelled:
+                return (index, False, None, TASK_CANCELLED_ERROR)
+
+            # 保存图片（写入本任务的目录）
+            self._save_image(image_data, filename, ctx)
             logger.info(f"✅ 图片 [{index}] 生成成功: {filename}")
 
+            ctx.record_result(True)
             return (index, True, filename, None)
 
         except Exception as e:
             error_msg = str(e)
             logger.error(f"❌ 图片 [{index}] 生成失败: {error_msg[:200]}")
+            ctx.record_result(False)
             return (index, False, None, error_msg)
 
+    CANCEL_POLL_INTERVAL = 0.5  # 等待生成结果时检查取消信号的间隔（秒）
+
+    def _iter_completed(self, futures: Iterable[Future], ctx: TaskContext) -> Iterator[Future]:
+        """
+        按完成顺序产出调度器返回的 future
+
+        任务被取消后撤回仍在排队的调用并停止等待；已在途的调用无法中断，
+        其结果不会写入任务目录。
+
+        Args:
+            futures: 已提交到调度器的 future
+            ctx: 任务上下文
+
+        Yields:
+            已完成的 future
+        """
+        pending = set(futures)
+        while pending:
+            if ctx.cancelled:
+                for future in pending:
+                    future.cancel()
+                return
+            done, pending = wait(pending, timeout=self.CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            yield from done
+
+    def _wait_result(self, future: Future, ctx: TaskContext) -> Optional[Tuple]:
+        """等待单个生成结果，任务被取消时返回 None"""
+        for done in self._iter_completed([future], ctx):
+            return done.result()
+        return None
+
+    def _cancelled_event(self, ctx: TaskContext) -> Dict[str, Any]:
+        """标记任务已取消，并构造取消事件"""
+        self.task_states.mark_cancelled(ctx.task_id)
+        logger.info(f"⏹️  任务已取消: {ctx.task_id}（已完成 {ctx.completed} 张）")
+        return {
+            "event": "cancelled",
+            "data": {
+                "task_id": ctx.task_id,
+                "message": "任务已取消，未开始的页面不再生成"
+            }
+        }
+
     def generate_images(
         self,
         pages: list,
         task_id: str = None,
         full_outline: str = "",
         user_images: Optional[List[bytes]] = None,
-        user_topic: str = ""
+        user_topic: str = "",
+        cancel_event: Optional[threading.Event] = None
     ) -> Generator[Dict[str, Any], None, None]:
         """
         生成图片（生成器，支持 SSE 流式返回）
@@ -228,6 +358,7 @@ class ImageService:
             full_outline: 完整的大纲文本（用于保持风格一致）
             user_images: 用户上传的参考图片列表（可选）
             user_topic: 用户原始输入（用于保持意图一致）
+            cancel_event: 取消信号，设置后不再提交剩余页面
 
         Yields:
             进度事件字典
@@ -238,30 +369,37 @@ class ImageService:
         logger.info(f"开始图片生成任务: task_id={task_id}, pages={len(pages)}")
 
         # 创建任务专属目录
-        self.current_task_dir = os.path.join(self.history_root_dir, task_id)
-        os.makedirs(self.current_task_dir, exist_ok=True)
-        logger.debug(f"任务目录: {self.current_task_dir}")
+        task_dir = os.path.join(self.history_root_dir, task_id)
+        os.makedirs(task_dir, exist_ok=True)
+        logger.debug(f"任务目录: {task_dir}")
 
         total = len(pages)
         generated_images = []
         failed_pages = []
-        cover_image_data = None
 
-        # 压缩用户上传的参考图到200KB以内（减少内存和传输开销）
-        compressed_user_images = None
+        # 压缩并编码用户上传的参考图（200KB以内），整个任务只处理一次
+        prepared_user_images = None
         if user_images:
-            compressed_user_images = [compress_image(img, max_size_kb=200) for img in user_images]
+            prepared_user_images = [prepare_image(img, max_size_kb=200) for img in user_images]
+
+        # 本任务的执行上下文，随每次生成调用传递
+        ctx = TaskContext(
+            task_id,
+            task_dir,
+            full_outline=full_outline,
+            user_topic=user_topic,
+            user_images=prepared_user_images,
+            cancel_event=cancel_event
+        )
 
         # 初始化任务状态
-        self._task_states[task_id] = {
-            "pages": pages,
-            "generated": {},
-            "failed": {},
-            "cover_image": None,
-            "full_outline": full_outline,
-            "user_images": compressed_user_images,
-            "user_topic": user_topic
-        }
+        self.task_states.create(
+            task_id,
+            pages,
+            full_outline=full_outline,
+            user_topic=user_topic,
+            user_images=[img.data for img in prepared_user_images] if prepared_user_images else None
+        )
 
         # ==================== 第一阶段：生成封面 ====================
         cover_page = None
@@ -293,36 +431,37 @@ class ImageService:
             }
 
             # 生成封面（使用用户上传的图片作为参考）
-            index, success, filename, error = self._generate_single_image(
-                cover_page, task_id, reference_image=None, full_outline=full_outline,
-                user_images=compressed_user_images, user_topic=user_topic
-            )
+            result = self._wait_result(self.scheduler.submit(
+                self.provider_name,
+                self._generate_single_image,
+                cover_page, ctx
+            ), ctx)
+            index, success, filename, error = result or (cover_page["index"], False, None, TASK_CANCELLED_ERROR)
 
             if success:
                 generated_images.append(filename)
-                self._task_states[task_id]["generated"][index] = filename
+                self.task_states.mark_generated(task_id, index, filename)
 
-                # 读取封面图片作为参考，并立即压缩到200KB以内
-                cover_path = os.path.join(self.current_task_dir, filename)
+                # 读取封面图片作为参考，压缩到200KB以内并编码一次，供所有内容页复用
+                cover_path = os.path.join(task_dir, filename)
                 with open(cover_path, "rb") as f:
-                    cover_image_data = f.read()
+                    ctx.cover_reference = prepare_image(f.read(), max_size_kb=200)
 
-                # 压缩封面图（减少内存占用和后续传输开销）
-                cover_image_data = compress_image(cover_image_data, max_size_kb=200)
-                self._task_states[task_id]["cover_image"] = cover_image_data
+                # 任务状态中只保存压缩后的数据（减少内存占用）
+                self.task_states.set_cover(task_id, ctx.cover_reference.data)
 
                 yield {
                     "event": "complete",
                     "data": {
                         "index": index,
                         "status": "done",
-                        "image_url": f"/api/images/{task_id}/{filename}",
+                        "image_url": ctx.get_image_url(filename),
                         "phase": "cover"
                     }
                 }
-            else:
+            elif not ctx.cancelled:
                 failed_pages.append(cover_page)
-                self._task_states[task_id]["failed"][index] = error
+                self.task_states.mark_failed(task_id, index, error)
 
                 yield {
                     "event": "error",
@@ -336,7 +475,7 @@ class ImageService:
                 }
 
         # ==================== 第二阶段：生成其他页面 ====================
-        if other_pages:
+        if other_pages and not ctx.cancelled:
             # 检查是否启用高并发模式
             high_concurrency = self.provider_config.get('high_concurrency', False)
 
@@ -353,85 +492,81 @@ class ImageService:
                     }
                 }
 
-                # 使用线程池并发生成
-                with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT) as executor:
-                    # 提交所有任务
-                    future_to_page = {
-                        executor.submit(
-                            self._generate_single_image,
-                            page,
-                            task_id,
-                            cover_image_data,  # 使用封面作为参考
-                            0,  # retry_count
-                            full_outline,  # 传入完整大纲
-                            compressed_user_images,  # 用户上传的参考图片（已压缩）
-                            user_topic  # 用户原始输入
-                        ): page
-                        for page in other_pages
-                    }
+                # 提交所有任务到共享调度器（在途数由调度器按服务商统一限制）
+                future_to_page = {
+                    self.scheduler.submit(
+                        self.provider_name,
+                        self._generate_single_image,
+                        page,
+                        ctx  # 封面参考图、大纲、用户输入都在上下文中
+                    ): page
+                    for page in other_pages
+                }
 
-                    # 发送每个页面的进度
-                    for page in other_pages:
-                        yield {
-                            "event": "progress",
-                            "data": {
-                                "index": page["index"],
-                                "status": "generating",
-                                "current": len(generated_images) + 1,
-                                "total": total,
-                                "phase": "content"
-                            }
+                # 发送每个页面的进度
+                for page in other_pages:
+                    yield {
+                        "event": "progress",
+                        "data": {
+                            "index": page["index"],
+                            "status": "generating",
+                            "current": len(generated_images) + 1,
+                            "total": total,
+                            "phase": "content"
                         }
+                    }
 
-                    # 收集结果
-                    for future in as_completed(future_to_page):
-                        page = future_to_page[future]
-                        try:
-                            index, success, filename, error = future.result()
-
-                            if success:
-                                generated_images.append(filename)
-                                self._task_states[task_id]["generated"][index] = filename
-
-                                yield {
-                                    "event": "complete",
-                                    "data": {
-                                        "index": index,
-                                        "status": "done",
-                                        "image_url": f"/api/images/{task_id}/{filename}",
-                                        "phase": "content"
-                                    }
-                                }
-                            else:
-                                failed_pages.append(page)
-                                self._task_states[task_id]["failed"][index] = error
-
-                                yield {
-                                    "event": "error",
-                                    "data": {
-                                        "index": index,
-                                        "status": "error",
-                                        "message": error,
-                                        "retryable": True,
-                                        "phase": "content"
-                                    }
-                                }
+                # 收集结果（任务取消后撤回排队中的页面）
+                for future in self._iter_completed(future_to_page, ctx):
+                    page = future_to_page[future]
+                    try:
+                        index, success, filename, error = future.result()
 
-                        except Exception as e:
+                        if ctx.cancelled and not success:
+                            continue
+                        elif success:
+                            generated_images.append(filename)
+                            self.task_states.mark_generated(task_id, index, filename)
+
+                            yield {
+                                "event": "complete",
+                                "data": {
+                                    "index": index,
+                                    "status": "done",
+                                    "image_url": ctx.get_image_url(filename),
+                                    "phase": "content"
+                                }
+                            }
+                        else:
                             failed_pages.append(page)
-                            error_msg = str(e)
-                            self._task_states[task_id]["failed"][page["index"]] = error_msg
+                            self.task_states.mark_failed(task_id, index, error)
 
                             yield {
                                 "event": "error",
                                 "data": {
-                                    "index": page["index"],
+                                    "index": index,
                                     "status": "error",
-                                    "message": error_msg,
+                                    "message": error,
                                     "retryable": True,
                                     "phase": "content"
                                 }
                             }
+
+                    except Exception as e:
+                        failed_pages.append(page)
+                        error_msg = str(e)
+                        self.task_states.mark_failed(task_id, page["index"], error_msg)
+
+                        yield {
+                            "event": "error",
+                            "data": {
+                                "index": page["index"],
+                                "status": "error",
+                                "message": error_msg,
+                                "retryable": True,
+                                "phase": "content"
+                            }
+                        }
             else:
                 # 顺序模式：逐个生成
                 yield {
@@ -446,6 +581,9 @@ class ImageService:
                 }
 
                 for page in other_pages:
+                    if ctx.cancelled:
+                        break
+
                     # 发送生成进度
                     yield {
                         "event": "progress",
@@ -458,33 +596,35 @@ class ImageService:
                         }
                     }
 
-                    # 生成单张图片
-                    index, success, filename, error = self._generate_single_image(
+                    # 生成单张图片（同样经过调度器排队）
+                    result = self._wait_result(self.scheduler.submit(
+                        self.provider_name,
+                        self._generate_single_image,
                         page,
-                        task_id,
-                        cover_image_data,
-                        0,
-                        full_outline,
-                        compressed_user_images,
-                        user_topic
-                    )
-
-                    if success:
+                        ctx
+                    ), ctx)
+                    if result is None:
+                        break
+                    index, success, filename, error = result
+
+                    if ctx.cancelled and not success:
+                        break
+                    elif success:
                         generated_images.append(filename)
-                        self._task_states[task_id]["generated"][index] = filename
+                        self.task_states.mark_generated(task_id, index, filename)
 
                         yield {
                             "event": "complete",
                             "data": {
                                 "index": index,
                                 "status": "done",
-                                "image_url": f"/api/images/{task_id}/{filename}",
+                                "image_url": ctx.get_image_url(filename),
                                 "phase": "content"
                             }
                         }
                     else:
                         failed_pages.append(page)
-                        self._task_states[task_id]["failed"][index] = error
+                        self.task_states.mark_failed(task_id, index, error)
 
                         yield {
                             "event": "error",
@@ -498,10 +638,17 @@ class ImageService:
                         }
 
         # ==================== 完成 ====================
+        if ctx.cancelled:
+            yield self._cancelled_event(ctx)
+
+        # 写盘屏障：确保所有缩略图已写入后再通知完成
+        self.writer.flush(task_dir)
+
         yield {
             "event": "finish",
             "data": {
-                "success": len(failed_pages) == 0,
+                "success": len(failed_pages) == 0 and not ctx.cancelled,
+                "cancelled": ctx.cancelled,
                 "task_id": task_id,
                 "images": generated_images,
                 "total": total,
@@ -511,36 +658,37 @@ class ImageService:
             }
         }
 
-    def retry_single_image(
+    def _build_retry_context(
         self,
         task_id: str,
-        page: Dict,
         use_reference: bool = True,
         full_outline: str = "",
         user_topic: str = ""
-    ) -> Dict[str, Any]:
+    ) -> TaskContext:
         """
-        重试生成单张图片
+        为重试/重新生成构建任务上下文
+
+        优先使用任务状态中保存的大纲、用户输入和参考图；
+        任务状态中没有封面图时，从任务目录中的 0.png 重新加载。
 
         Args:
             task_id: 任务ID
-            page: 页面数据
             use_reference: 是否使用封面作为参考
-            full_outline: 完整大纲文本（从前端传入）
-            user_topic: 用户原始输入（从前端传入）
+            full_outline: 完整大纲文本（为空时使用任务状态中的）
+            user_topic: 用户原始输入（为空时使用任务状态中的）
 
         Returns:
-            生成结果
+            TaskContext: 参考图已预处理好的任务上下文
         """
-        self.current_task_dir = os.path.join(self.history_root_dir, task_id)
-        os.makedirs(self.current_task_dir, exist_ok=True)
+        task_dir = os.path.join(self.history_root_dir, task_id)
+        os.makedirs(task_dir, exist_ok=True)
 
         reference_image = None
         user_images = None
 
         # 首先尝试从任务状态中获取上下文
-        if task_id in self._task_states:
-            task_state = self._task_states[task_id]
+        task_state = self.task_states.get(task_id)
+        if task_state is not None:
             if use_reference:
                 reference_image = task_state.get("cover_image")
             # 如果没有传入上下文，则使用任务状态中的
@@ -552,33 +700,66 @@ class ImageService:
 
         # 如果任务状态中没有封面图，尝试从文件系统加载
         if use_reference and reference_image is None:
-            cover_path = os.path.join(self.current_task_dir, "0.png")
+            cover_path = os.path.join(task_dir, "0.png")
             if os.path.exists(cover_path):
                 with open(cover_path, "rb") as f:
                     cover_data = f.read()
                 # 压缩封面图到 200KB
                 reference_image = compress_image(cover_data, max_size_kb=200)
 
-        index, success, filename, error = self._generate_single_image(
-            page,
+        # 编码参考图（任务状态中的数据已压缩，这里只做一次编码）
+        return TaskContext(
             task_id,
-            reference_image,
-            0,
-            full_outline,
-            user_images,
-            user_topic
+            task_dir,
+            full_outline=full_outline,
+            user_topic=user_topic,
+            user_images=[prepare_image(img) for img in user_images] if user_images else None,
+            cover_reference=prepare_image(reference_image) if reference_image else None
         )
 
+    def retry_single_image(
+        self,
+        task_id: str,
+        page: Dict,
+        use_reference: bool = True,
+        full_outline: str = "",
+        user_topic: str = "",
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        重试生成单张图片
+
+        Args:
+            task_id: 任务ID
+            page: 页面数据
+            use_reference: 是否使用封面作为参考
+            full_outline: 完整大纲文本（从前端传入）
+            user_topic: 用户原始输入（从前端传入）
+            use_cache: 是否读取生成缓存
+
+        Returns:
+            生成结果
+        """
+        ctx = self._build_retry_context(task_id, use_reference, full_outline, user_topic)
+
+        index, success, filename, error = self.scheduler.submit(
+            self.provider_name,
+            self._generate_single_image,
+            page,
+            ctx,
+            use_cache
+        ).result()
+
         if success:
-            if task_id in self._task_states:
-                self._task_states[task_id]["generated"][index] = filename
-                if index in self._task_states[task_id]["failed"]:
-                    del self._task_states[task_id]["failed"][index]
+            self.task_states.mark_generated(task_id, index, filename)
+
+            # 返回新 URL 之前等该页缩略图写完，否则前端会拿到磁盘上的旧缩略图
+            self.writer.wait_for(os.path.join(ctx.task_dir, f"thumb_{filename}"))
 
             return {
                 "success": True,
                 "index": index,
-                "image_url": f"/api/images/{task_id}/{filename}"
+                "image_url": ctx.get_image_url(filename)
             }
         else:
             return {
@@ -591,7 +772,8 @@ class ImageService:
     def retry_failed_images(
         self,
         task_id: str,
-        pages: List[Dict]
+        pages: List[Dict],
+        cancel_event: Optional[threading.Event] = None
     ) -> Generator[Dict[str, Any], None, None]:
         """
         批量重试失败的图片
@@ -599,14 +781,15 @@ class ImageService:
         Args:
             task_id: 任务ID
             pages: 需要重试的页面列表
+            cancel_event: 取消信号，设置后不再提交剩余页面
 
         Yields:
             进度事件
         """
-        # 获取参考图
-        reference_image = None
-        if task_id in self._task_states:
-            reference_image = self._task_states[task_id].get("cover_image")
+        # 整批重试共用一个上下文（参考图只预处理一次）
+        ctx = self._build_retry_context(task_id)
+        if cancel_event is not None:
+            ctx.cancel_event = cancel_event
 
         total = len(pages)
         success_count = 0
@@ -620,73 +803,71 @@ class ImageService:
             }
         }
 
-        # 并发重试
-        # 从任务状态中获取完整大纲
-        full_outline = ""
-        if task_id in self._task_states:
-            full_outline = self._task_states[task_id].get("full_outline", "")
-
-        with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT) as executor:
-            future_to_page = {
-                executor.submit(
-                    self._generate_single_image,
-                    page,
-                    task_id,
-                    reference_image,
-                    0,  # retry_count
-                    full_outline  # 传入完整大纲
-                ): page
-                for page in pages
-            }
+        # 并发重试（经共享调度器排队）
+        future_to_page = {
+            self.scheduler.submit(
+                self.provider_name,
+                self._generate_single_image,
+                page,
+                ctx
+            ): page
+            for page in pages
+        }
 
-            for future in as_completed(future_to_page):
-                page = future_to_page[future]
-                try:
-                    index, success, filename, error = future.result()
+        for future in self._iter_completed(future_to_page, ctx):
+            page = future_to_page[future]
+            try:
+                index, success, filename, error = future.result()
 
-                    if success:
-                        success_count += 1
-                        if task_id in self._task_states:
-                            self._task_states[task_id]["generated"][index] = filename
-                            if index in self._task_states[task_id]["failed"]:
-                                del self._task_states[task_id]["failed"][index]
+                if ctx.cancelled and not success:
+                    continue
+                elif success:
+                    success_count += 1
+                    self.task_states.mark_generated(task_id, index, filename)
 
-                        yield {
-                            "event": "complete",
-                            "data": {
-                                "index": index,
-                                "status": "done",
-                                "image_url": f"/api/images/{task_id}/{filename}"
-                            }
-                        }
-                    else:
-                        failed_count += 1
-                        yield {
-                            "event": "error",
-                            "data": {
-                                "index": index,
-                                "status": "error",
-                                "message": error,
-                                "retryable": True
-                            }
+                    yield {
+                        "event": "complete",
+                        "data": {
+                            "index": index,
+                            "status": "done",
+                            "image_url": ctx.get_image_url(filename)
                         }
-
-                except Exception as e:
+                    }
+                else:
                     failed_count += 1
                     yield {
                         "event": "error",
                         "data": {
-                            "index": page["index"],
+                            "index": index,
                             "status": "error",
-                            "message": str(e),
+                            "message": error,
                             "retryable": True
                         }
                     }
 
+            except Exception as e:
+                failed_count += 1
+                yield {
+                    "event": "error",
+                    "data": {
+                        "index": page["index"],
+                        "status": "error",
+                        "message": str(e),
+                        "retryable": True
+                    }
+                }
+
+        if ctx.cancelled:
+            yield self._cancelled_event(ctx)
+
+        # 写盘屏障：确保所有缩略图已写入后再通知完成
+        self.writer.flush(ctx.task_dir)
+
         yield {
             "event": "retry_finish",
             "data": {
-                "success": failed_count == 0,
+                "success": failed_count == 0 and not ctx.cancelled,
+                "cancelled": ctx.cancelled,
                 "total": total,
                 "completed": success_count,
                 "failed": failed_count
@@ -699,7 +880,8 @@ class ImageService:
         page: Dict,
         use_reference: bool = True,
         full_outline: str = "",
-        user_topic: str = ""
+        user_topic: str = "",
+        bypass_cache: bool = False
     ) -> Dict[str, Any]:
         """
         重新生成图片（用户手动触发，即使成功的也可以重新生成）
@@ -710,6 +892,7 @@ class ImageService:
             use_reference: 是否使用封面作为参考
             full_outline: 完整大纲文本
             user_topic: 用户原始输入
+            bypass_cache: 是否跳过生成缓存，强制调用服务商
 
         Returns:
             生成结果
@@ -717,7 +900,8 @@ class ImageService:
         return self.retry_single_image(
             task_id, page, use_reference,
             full_outline=full_outline,
-            user_topic=user_topic
+            user_topic=user_topic,
+            use_cache=not bypass_cache
         )
 
     def get_image_path(self, task_id: str, filename: str) -> str:
@@ -735,13 +919,12 @@ class ImageService:
         return os.path.join(task_dir, filename)
 
     def get_task_state(self, task_id: str) -> Optional[Dict]:
-        """获取任务状态"""
-        return self._task_states.get(task_id)
+        """获取任务状态（已移出内存的任务会从任务目录恢复）"""
+        return self.task_states.get(task_id)
 
     def cleanup_task(self, task_id: str):
-        """清理任务状态（释放内存）"""
-        if task_id in self._task_states:
-            del self._task_states[task_id]
+        """清理任务状态（释放内存并删除落盘文件）"""
+        self.task_states.discard(task_id)
 
 
 # 全局服务实例
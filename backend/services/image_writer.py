@@ -0,0 +1,233 @@
+"""
+图片持久化
+
+把生成结果写盘从生成关键路径上移开：
+- 原图在调用线程（调度器工作线程）中持久化写入（临时文件 + fsync + 原子替换）
+- 缩略图压缩（PIL）和写入交给后台写盘线程池，不阻塞 complete 事件
+- 待写缩略图数量有上限，超过时调用方等待，避免内存无限堆积
+- 提供按任务目录的 flush 屏障，以及等待单个缩略图写完的接口
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional, Set
+
+from backend.config import Config
+from backend.utils.image_compressor import compress_image
+
+logger = logging.getLogger(__name__)
+
+
+def write_file_durable(path: str, data: bytes) -> None:
+    """
+    持久化写入文件：先写临时文件并 fsync，再原子替换目标文件
+
+    读取方不会看到写了一半的文件。
+
+    Args:
+        path: 目标路径
+        data: 文件内容
+    """
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        # 写入失败（如磁盘已满）时不留下临时文件
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ImageWriter:
+    """后台图片写盘器"""
+
+    THUMBNAIL_SIZE_KB = 50  # 缩略图目标大小
+
+    def __init__(self, max_workers: int, max_pending: int, blob_store=None):
+        """
+        初始化写盘器
+
+        Args:
+            max_workers: 缩略图写盘线程数
+            max_pending: 最多允许排队的待写缩略图数
+            blob_store: 内容寻址存储（BlobStore），为空时直接写入任务目录
+        """
+        self.blob_store = blob_store
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="image-writer"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+
+        # 缩略图路径 -> Future，任务目录 -> 该目录下待写缩略图路径
+        self._pending: Dict[str, Future] = {}
+        self._pending_by_dir: Dict[str, Set[str]] = {}
+
+        self.originals_written = 0
+        self.thumbnails_written = 0
+        self.thumbnail_failures = 0
+
+    def save(self, task_dir: str, filename: str, image_data: bytes) -> str:
+        """
+        保存图片：等待原图落盘后返回，缩略图在后台生成
+
+        Args:
+            task_dir: 任务目录
+            filename: 文件名
+            image_data: 图片二进制数据
+
+        Returns:
+            str: 原图路径
+        """
+        filepath = os.path.join(task_dir, filename)
+        thumbnail_path = os.path.join(task_dir, f"thumb_{filename}")
+
+        self._slots.acquire()
+        thumbnail_future: Future = Future()
+        with self._lock:
+            # 同一页面被重新生成时，旧的缩略图任务结果会被新任务覆盖
+            self._pending[thumbnail_path] = thumbnail_future
+            self._pending_by_dir.setdefault(task_dir, set()).add(thumbnail_path)
+
+        try:
+            self._write(filepath, image_data)
+        except BaseException:
+            self._finish_thumbnail(task_dir, thumbnail_path, thumbnail_future)
+            thumbnail_future.cancel()
+            raise
+
+        with self._lock:
+            self.originals_written += 1
+
+        self._executor.submit(
+            self._write_thumbnail, task_dir, thumbnail_path, image_data, thumbnail_future
+        )
+        return filepath
+
+    def _write(self, path: str, data: bytes) -> None:
+        """写入任务目录（启用 blob 存储时相同内容只保存一份）"""
+        if self.blob_store is not None:
+            self.blob_store.save(path, data)
+        else:
+            write_file_durable(path, data)
+
+    def _write_thumbnail(
+        self,
+        task_dir: str,
+        thumbnail_path: str,
+        image_data: bytes,
+        future: Future
+    ) -> None:
+        """生成并写入缩略图（在写盘线程中执行）"""
+        if not future.set_running_or_notify_cancel():
+            self._finish_thumbnail(task_dir, thumbnail_path, future)
+            return
+        try:
+            thumbnail_data = compress_image(image_data, max_size_kb=self.THUMBNAIL_SIZE_KB)
+            # 该页面已被重新生成时，不再用旧图覆盖新的缩略图
+            with self._lock:
+                superseded = self._pending.get(thumbnail_path) is not future
+            if not superseded:
+                self._write(thumbnail_path, thumbnail_data)
+        except Exception as e:
+            logger.error(f"缩略图写入失败: {thumbnail_path}, {e}")
+            with self._lock:
+                self.thumbnail_failures += 1
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self.thumbnails_written += 1
+            future.set_result(thumbnail_path)
+        finally:
+            self._finish_thumbnail(task_dir, thumbnail_path, future)
+
+    def _finish_thumbnail(self, task_dir: str, thumbnail_path: str, future: Future) -> None:
+        """缩略图任务结束：移出待写列表并释放名额"""
+        with self._lock:
+            if self._pending.get(thumbnail_path) is future:
+                del self._pending[thumbnail_path]
+                paths = self._pending_by_dir.get(task_dir)
+                if paths is not None:
+                    paths.discard(thumbnail_path)
+                    if not paths:
+                        del self._pending_by_dir[task_dir]
+        self._slots.release()
+
+    def wait_for(self, path: str, timeout: Optional[float] = None) -> bool:
+        """
+        等待某个缩略图写完
+
+        Args:
+            path: 缩略图路径
+            timeout: 最长等待秒数
+
+        Returns:
+            bool: 是否有该文件的待写任务（没有则立即返回 False）
+        """
+        with self._lock:
+            future = self._pending.get(path)
+        if future is None:
+            return False
+        wait([future], timeout=timeout)
+        return True
+
+    def is_pending(self, path: str) -> bool:
+        """某个缩略图是否仍有待写任务（磁盘上的文件可能是旧版本）"""
+        with self._lock:
+            return path in self._pending
+
+    def flush(self, task_dir: str, timeout: Optional[float] = None) -> None:
+        """
+        写盘屏障：等待任务目录下所有缩略图写完
+
+        Args:
+            task_dir: 任务目录
+            timeout: 最长等待秒数
+        """
+        with self._lock:
+            futures = [self._pending[p] for p in self._pending_by_dir.get(task_dir, ())]
+        if futures:
+            wait(futures, timeout=timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写盘统计信息"""
+        with self._lock:
+            stats: Dict[str, Any] = {
+                "pending_thumbnails": len(self._pending),
+                "originals_written": self.originals_written,
+                "thumbnails_written": self.thumbnails_written,
+                "thumbnail_failures": self.thumbnail_failures,
+            }
+        if self.blob_store is not None:
+            stats["blobs"] = self.blob_store.get_stats()
+        return stats
+
+
+_writer_instance = None
+_writer_lock = threading.Lock()
+
+
+def get_image_writer() -> ImageWriter:
+    """获取全局图片写盘器实例"""
+    global _writer_instance
+    if _writer_instance is None:
+        with _writer_lock:
+            if _writer_instance is None:
+                # blob_store 依赖本模块的 write_file_durable，在这里导入避免循环导入
+                from backend.services.blob_store import get_blob_store
+                _writer_instance = ImageWriter(
+                    max_workers=Config.IMAGE_WRITER_WORKERS,
+                    max_pending=Config.IMAGE_WRITER_MAX_PENDING,
+                    blob_store=get_blob_store()
+                )
+    return _writer_instance
@@ -0,0 +1,328 @@
+"""
+后台生成任务队列
+
+图片生成不再在 Flask 响应生成器里执行，而是作为后台任务提交：
+- 每个任务有独立的 job_id，在后台线程中消费生成器产出的进度事件
+- 事件写入每个任务的环形缓冲区，并分配递增序号（SSE 的 id 字段）
+- 客户端断线后可以携带 Last-Event-ID 重新订阅，补发错过的事件
+- 所有订阅者断开且超过宽限期仍未重连时取消任务，不再为没人看的页面付费
+- 结束的任务保留一段时间后清理
+"""
+
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """一个后台生成任务及其事件缓冲区"""
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_FINISHED = "finished"
+    STATUS_FAILED = "failed"
+    STATUS_CANCELLED = "cancelled"
+
+    def __init__(
+        self,
+        job_id: str,
+        kind: str,
+        task_id: Optional[str],
+        buffer_size: int,
+        disconnect_grace_seconds: float
+    ):
+        """
+        Args:
+            job_id: 任务队列中的 ID
+            kind: 任务类型（generate / retry_failed）
+            task_id: 关联的图片生成任务 ID
+            buffer_size: 环形缓冲区最多保留的事件数
+            disconnect_grace_seconds: 最后一个订阅者断开后，等待重连多久再取消任务
+        """
+        self.job_id = job_id
+        self.kind = kind
+        self.task_id = task_id
+        self.status = self.STATUS_QUEUED
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.disconnect_grace_seconds = disconnect_grace_seconds
+
+        # 取消信号，传给生成器（ImageService.generate_images 的 cancel_event）
+        self.cancel_event = threading.Event()
+        self._subscribers = 0
+        self._abandon_timer: Optional[threading.Timer] = None
+
+        self._cond = threading.Condition()
+        # (序号, 事件类型, 事件数据)，序号从 1 开始连续递增
+        self._events: "deque[Tuple[int, str, Dict[str, Any]]]" = deque(maxlen=buffer_size)
+        self._last_seq = 0
+
+    @property
+    def done(self) -> bool:
+        """任务是否已结束"""
+        return self.status in (self.STATUS_FINISHED, self.STATUS_FAILED, self.STATUS_CANCELLED)
+
+    def cancel(self) -> bool:
+        """
+        取消任务（未开始的页面不再生成）
+
+        Returns:
+            bool: 任务此前是否仍在运行
+        """
+        with self._cond:
+            if self.done:
+                return False
+            self.cancel_event.set()
+            return True
+
+    def subscribe(self) -> None:
+        """登记一个事件订阅者（SSE 连接）"""
+        with self._cond:
+            self._subscribers += 1
+            if self._abandon_timer is not None:
+                self._abandon_timer.cancel()
+                self._abandon_timer = None
+
+    def unsubscribe(self) -> None:
+        """订阅者断开；没有订阅者时开始宽限期计时，超时仍无人重连则取消任务"""
+        with self._cond:
+            self._subscribers -= 1
+            if self._subscribers > 0 or self.done:
+                return
+            self._abandon_timer = threading.Timer(self.disconnect_grace_seconds, self._on_abandoned)
+            self._abandon_timer.daemon = True
+            self._abandon_timer.start()
+
+    def _on_abandoned(self) -> None:
+        """宽限期结束"""
+        with self._cond:
+            if self._subscribers > 0 or self.done:
+                return
+            self._abandon_timer = None
+        logger.info(f"客户端已断开，取消后台任务: job={self.job_id}, task={self.task_id}")
+        self.cancel()
+
+    def publish(self, event: str, data: Dict[str, Any]) -> int:
+        """
+        追加一个事件并唤醒订阅者
+
+        Args:
+            event: 事件类型
+            data: 事件数据
+
+        Returns:
+            int: 事件序号
+        """
+        with self._cond:
+            self._last_seq += 1
+            self._events.append((self._last_seq, event, data))
+            self._cond.notify_all()
+            return self._last_seq
+
+    def set_status(self, status: str, error: Optional[str] = None) -> None:
+        """更新任务状态并唤醒订阅者"""
+        with self._cond:
+            self.status = status
+            if error is not None:
+                self.error = error
+            if self.done:
+                self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def events_after(
+        self,
+        last_seq: int,
+        timeout: Optional[float] = None
+    ) -> Tuple[List[Tuple[int, str, Dict[str, Any]]], int, bool]:
+        """
+        获取某个序号之后的事件，没有新事件时最多等待 timeout 秒
+
+        Args:
+            last_seq: 客户端已收到的最后一个事件序号（0 表示从头开始）
+            timeout: 最长等待秒数
+
+        Returns:
+            (事件列表, 缓冲区中最早的序号, 任务是否已结束)
+        """
+        with self._cond:
+            if self._last_seq <= last_seq and not self.done:
+                self._cond.wait(timeout)
+            first_seq = self._events[0][0] if self._events else self._last_seq + 1
+            events = [item for item in self._events if item[0] > last_seq]
+            return events, first_seq, self.done
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务概要（不含事件）"""
+        with self._cond:
+            return {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "task_id": self.task_id,
+                "status": self.status,
+                "error": self.error,
+                "subscribers": self._subscribers,
+                "last_event_id": self._last_seq,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class JobManager:
+    """后台任务队列"""
+
+    def __init__(
+        self,
+        max_workers: int,
+        buffer_size: int,
+        retention_seconds: float,
+        disconnect_grace_seconds: float
+    ):
+        """
+        初始化任务队列
+
+        Args:
+            max_workers: 同时运行的任务数（单张图片的并发由图片调度器控制）
+            buffer_size: 每个任务保留的事件数
+            retention_seconds: 结束的任务保留多久（供断线重连补发事件）
+            disconnect_grace_seconds: 订阅者全部断开后等待重连的时间，超时取消任务
+        """
+        self.buffer_size = buffer_size
+        self.retention_seconds = retention_seconds
+        self.disconnect_grace_seconds = disconnect_grace_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+
+        self.submitted = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def submit(
+        self,
+        kind: str,
+        task_id: Optional[str],
+        events_fn: Callable[..., Iterable[Dict[str, Any]]],
+        *args,
+        **kwargs
+    ) -> Job:
+        """
+        提交后台任务
+
+        Args:
+            kind: 任务类型
+            task_id: 关联的图片生成任务 ID
+            events_fn: 返回进度事件迭代器的函数（如 ImageService.generate_images），
+                需要接受 cancel_event 关键字参数
+            *args, **kwargs: 传给 events_fn 的参数
+
+        Returns:
+            Job: 新建的任务
+        """
+        self._cleanup()
+        job = Job(uuid.uuid4().hex, kind, task_id, self.buffer_size, self.disconnect_grace_seconds)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self.submitted += 1
+        self._executor.submit(self._run, job, events_fn, args, kwargs)
+        logger.info(f"📋 后台任务已提交: job={job.job_id}, kind={kind}, task={task_id}")
+        return job
+
+    def _run(self, job: Job, events_fn, args, kwargs) -> None:
+        """在后台线程中消费事件，写入任务的环形缓冲区"""
+        if job.cancel_event.is_set():
+            # 排队期间已被取消，不再启动
+            with self._lock:
+                self.cancelled += 1
+            job.publish("cancelled", {"task_id": job.task_id, "message": "任务已取消"})
+            job.set_status(Job.STATUS_CANCELLED)
+            return
+
+        job.set_status(Job.STATUS_RUNNING)
+        try:
+            for event in events_fn(*args, cancel_event=job.cancel_event, **kwargs):
+                job.publish(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"后台任务执行失败: job={job.job_id}, {e}")
+            with self._lock:
+                self.failed += 1
+            job.publish("job_failed", {"message": str(e)})
+            job.set_status(Job.STATUS_FAILED, error=str(e))
+        else:
+            if job.cancel_event.is_set():
+                with self._lock:
+                    self.cancelled += 1
+                job.set_status(Job.STATUS_CANCELLED)
+            else:
+                job.set_status(Job.STATUS_FINISHED)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """获取任务，不存在或已清理时返回 None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel_task(self, task_id: str) -> int:
+        """
+        取消某个图片生成任务的所有运行中的后台任务
+
+        Args:
+            task_id: 图片生成任务 ID
+
+        Returns:
+            int: 被取消的后台任务数
+        """
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.task_id == task_id]
+        return sum(1 for job in jobs if job.cancel())
+
+    def _cleanup(self) -> None:
+        """清理已结束且超过保留时间的任务"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.done and job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取任务队列统计信息"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            stats = {
+                "jobs": len(jobs),
+                "submitted": self.submitted,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+            }
+        for status in (Job.STATUS_QUEUED, Job.STATUS_RUNNING):
+            stats[status] = sum(1 for job in jobs if job.status == status)
+        return stats
+
+
+_manager_instance = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """获取全局后台任务队列实例"""
+    global _manager_instance
+    if _manager_instance is None:
+        with _manager_lock:
+            if _manager_instance is None:
+                _manager_instance = JobManager(
+                    max_workers=Config.JOB_MAX_WORKERS,
+                    buffer_size=Config.JOB_EVENT_BUFFER_SIZE,
+                    retention_seconds=Config.JOB_RETENTION_SECONDS,
+                    disconnect_grace_seconds=Config.JOB_DISCONNECT_GRACE_SECONDS
+                )
+    return _manager_instance
@@ -0,0 +1,382 @@
+"""
+图片生成调度器
+
+进程级共享的图片生成调度器：所有 /api/generate、批量重试、单张重试和
+重新生成请求都提交到同一个调度器，由它统一控制对服务商的在途请求数。
+
+- 全局上限：整个进程同时在途的生成调用数不超过 max_workers
+- 服务商上限：每个服务商的并发窗口由 AIMD 算法自适应调整，
+  请求健康时逐步放大，遇到 429 / RESOURCE_EXHAUSTED / 503 时成倍收缩
+- 超出上限的调用在服务商队列中排队，按提交顺序执行
+"""
+
+import re
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# 表示服务商限流（429）或过载（503）的 HTTP 状态码
+OVERLOAD_STATUS_CODES = (429, 503)
+
+# 没有状态码属性时，从错误信息中识别限流/过载：
+# 状态码只在“状态码:”“status=”“HTTP”之后或行首（google-genai 的 "429 RESOURCE_EXHAUSTED"）出现时才算，
+# 避免图片尺寸、请求 ID 等内容中恰好包含 503 时误判
+OVERLOAD_ERROR_PATTERN = re.compile(
+    r"(?:状态码|status(?:[ _]?code)?|http)\s*[:=：]?\s*(?:429|503)\b"
+    r"|^\s*(?:429|503)\b"
+    r"|\bresource_exhausted\b|\brate[ _-]?limit|速率限制|\boverloaded\b",
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+def _get_status_code(error: BaseException) -> Optional[int]:
+    """
+    从异常中取 HTTP 状态码（google-genai 的 APIError.code、requests 的 HTTPError.response）
+
+    Returns:
+        Optional[int]: 状态码，异常不携带状态码时返回 None
+    """
+    for attr in ("code", "status_code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(error, "response", None), "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_overload_error(error: Exception) -> bool:
+    """
+    判断错误是否表示服务商过载（需要降低并发）
+
+    优先使用异常携带的 HTTP 状态码，没有时再匹配错误信息。
+
+    Args:
+        error: 生成器抛出的异常
+
+    Returns:
+        bool: 是否为限流/过载错误
+    """
+    status_code = _get_status_code(error)
+    if status_code is not None:
+        return status_code in OVERLOAD_STATUS_CODES
+    return OVERLOAD_ERROR_PATTERN.search(str(error)) is not None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 并发窗口
+
+    - 加性增：每成功完成一个窗口的调用，窗口 +1（延迟恶化时暂停增长）
+    - 乘性减：遇到过载错误时窗口乘以 decrease_factor；
+      在上次收缩之前发出的调用再报告过载不会重复收缩
+    """
+
+    LATENCY_ALPHA = 0.2  # 延迟 EWMA 平滑系数
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 15,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0
+    ):
+        """
+        初始化并发窗口
+
+        Args:
+            initial: 初始窗口
+            min_limit: 最小窗口
+            max_limit: 最大窗口
+            decrease_factor: 过载时的收缩系数
+            latency_tolerance: 延迟超过基线的倍数后停止增长
+        """
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.window = float(min(max(initial, self.min_limit), self.max_limit))
+
+        self.latency_ewma: Optional[float] = None
+        self.latency_baseline: Optional[float] = None
+        self.last_decrease_at = 0.0
+        self.successes = 0
+        self.overloads = 0
+
+    @property
+    def limit(self) -> int:
+        """当前允许的在途调用数"""
+        return max(self.min_limit, int(self.window))
+
+    def set_bounds(self, min_limit: int, max_limit: int) -> None:
+        """更新窗口上下限（保留已学习到的窗口）"""
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.window = min(max(self.window, self.min_limit), self.max_limit)
+
+    def on_success(self, latency: float) -> None:
+        """记录一次成功调用"""
+        self.successes += 1
+
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += self.LATENCY_ALPHA * (latency - self.latency_ewma)
+        if self.latency_baseline is None or self.latency_ewma < self.latency_baseline:
+            self.latency_baseline = self.latency_ewma
+
+        # 延迟明显恶化说明服务商已接近容量，不再放大窗口
+        if self.latency_ewma > self.latency_baseline * self.latency_tolerance:
+            return
+
+        self.window = min(self.max_limit, self.window + 1.0 / self.window)
+
+    def on_overload(self, started_at: float) -> None:
+        """
+        记录一次过载错误
+
+        Args:
+            started_at: 该调用的开始时间（time.monotonic()）
+        """
+        self.overloads += 1
+        if started_at < self.last_decrease_at:
+            return
+        self.window = max(float(self.min_limit), self.window * self.decrease_factor)
+        self.last_decrease_at = time.monotonic()
+        logger.warning(f"服务商过载，并发窗口收缩至 {self.limit}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取窗口状态"""
+        return {
+            "limit": self.limit,
+            "window": round(self.window, 2),
+            "min": self.min_limit,
+            "max": self.max_limit,
+            "latency_ewma": round(self.latency_ewma, 2) if self.latency_ewma is not None else None,
+            "latency_baseline": round(self.latency_baseline, 2) if self.latency_baseline is not None else None,
+            "successes": self.successes,
+            "overloads": self.overloads,
+        }
+
+
+class ImageScheduler:
+    """带全局上限和服务商自适应并发窗口的生成调度器"""
+
+    def __init__(self, max_workers: int, default_provider_limit: int):
+        """
+        初始化调度器
+
+        Args:
+            max_workers: 全局最大在途调用数（工作线程数）
+            default_provider_limit: 未单独配置的服务商的最大并发窗口
+        """
+        self.max_workers = max_workers
+        self.default_provider_limit = default_provider_limit
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="image-gen"
+        )
+        self._lock = threading.Lock()
+
+        # 各服务商的排队任务、并发窗口和在途数
+        self._queues: Dict[str, Deque[Tuple[Future, Callable, tuple, dict]]] = {}
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._total_in_flight = 0
+
+        # 轮询起点，避免某个服务商长期占满全局名额
+        self._next_provider = 0
+
+    def configure_provider(
+        self,
+        provider: str,
+        max_limit: int,
+        min_limit: int = 1,
+        initial: Optional[int] = None
+    ) -> None:
+        """
+        配置服务商的并发窗口
+
+        重复配置（如 reset_image_service() 后）只更新上下限，保留已学习到的窗口。
+
+        Args:
+            provider: 服务商名称
+            max_limit: 最大并发窗口
+            min_limit: 最小并发窗口
+            initial: 初始窗口（默认为 max_limit）
+        """
+        with self._lock:
+            limiter = self._limiters.get(provider)
+            if limiter is None:
+                self._limiters[provider] = AdaptiveLimiter(
+                    initial=max_limit if initial is None else initial,
+                    min_limit=min_limit,
+                    max_limit=max_limit
+                )
+            else:
+                limiter.set_bounds(min_limit, max_limit)
+        self._dispatch()
+
+    def _get_limiter(self, provider: str) -> AdaptiveLimiter:
+        """获取服务商的并发窗口（需持有锁），未配置时使用默认上限"""
+        limiter = self._limiters.get(provider)
+        if limiter is None:
+            limiter = AdaptiveLimiter(
+                initial=self.default_provider_limit,
+                max_limit=self.default_provider_limit
+            )
+            self._limiters[provider] = limiter
+        return limiter
+
+    def get_provider_limit(self, provider: str) -> int:
+        """获取服务商当前的并发窗口"""
+        with self._lock:
+            return self._get_limiter(provider).limit
+
+    def record_result(
+        self,
+        provider: str,
+        started_at: float,
+        error: Optional[Exception] = None
+    ) -> None:
+        """
+        反馈一次服务商调用的结果，用于调整并发窗口
+
+        Args:
+            provider: 服务商名称
+            started_at: 调用开始时间（time.monotonic()）
+            error: 调用失败时的异常；过载类错误会收缩窗口，其他错误不影响窗口
+        """
+        with self._lock:
+            limiter = self._get_limiter(provider)
+            if error is None:
+                limiter.on_success(time.monotonic() - started_at)
+            elif is_overload_error(error):
+                limiter.on_overload(started_at)
+        # 窗口变大后可能有排队任务可以执行
+        self._dispatch()
+
+    def submit(self, provider: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        提交一次生成调用
+
+        Args:
+            provider: 服务商名称（并发上限按此分组）
+            fn: 要执行的函数
+            *args, **kwargs: 函数参数
+
+        Returns:
+            Future: 调用结果；排队中的 Future 可以被 cancel()
+        """
+        future: Future = Future()
+        with self._lock:
+            self._queues.setdefault(provider, deque()).append((future, fn, args, kwargs))
+        self._dispatch()
+        return future
+
+    def _dispatch(self) -> None:
+        """在名额允许的范围内，把排队中的调用交给工作线程"""
+        ready: List[Tuple[str, Tuple[Future, Callable, tuple, dict]]] = []
+
+        with self._lock:
+            providers = list(self._queues.keys())
+            progressed = True
+            while self._total_in_flight < self.max_workers and progressed:
+                progressed = False
+                for offset in range(len(providers)):
+                    if self._total_in_flight >= self.max_workers:
+                        break
+
+                    provider = providers[(self._next_provider + offset) % len(providers)]
+                    queue = self._queues[provider]
+                    limit = self._get_limiter(provider).limit
+
+                    # 丢弃已被取消的排队调用
+                    while queue and queue[0][0].cancelled():
+                        queue.popleft()
+
+                    if not queue or self._in_flight.get(provider, 0) >= limit:
+                        continue
+
+                    item = queue.popleft()
+                    self._in_flight[provider] = self._in_flight.get(provider, 0) + 1
+                    self._total_in_flight += 1
+                    ready.append((provider, item))
+                    progressed = True
+
+                if providers:
+                    self._next_provider = (self._next_provider + 1) % len(providers)
+
+            # 清理空队列
+            for provider in providers:
+                if not self._queues[provider] and not self._in_flight.get(provider):
+                    del self._queues[provider]
+
+        for provider, item in ready:
+            self._executor.submit(self._run, provider, *item)
+
+    def _run(self, provider: str, future: Future, fn: Callable, args: tuple, kwargs: dict) -> None:
+        """在工作线程中执行调用，结束后释放名额并继续调度"""
+        try:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        finally:
+            with self._lock:
+                self._in_flight[provider] -= 1
+                self._total_in_flight -= 1
+            self._dispatch()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取调度器运行状态
+
+        Returns:
+            Dict: 全局在途数以及各服务商的并发窗口、在途数、排队数
+        """
+        with self._lock:
+            providers = set(self._limiters) | set(self._queues) | set(self._in_flight)
+            return {
+                "max_workers": self.max_workers,
+                "in_flight": self._total_in_flight,
+                "providers": {
+                    name: {
+                        **self._get_limiter(name).get_stats(),
+                        "in_flight": self._in_flight.get(name, 0),
+                        "queued": len(self._queues.get(name, ())),
+                    }
+                    for name in sorted(providers)
+                }
+            }
+
+
+# 全局调度器实例（不随 reset_image_service() 重建，保证上限跨配置更新依然有效）
+_scheduler_instance = None
+_scheduler_lock = threading.Lock()
+
+
+def get_image_scheduler() -> ImageScheduler:
+    """获取全局图片生成调度器实例"""
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        with _scheduler_lock:
+            if _scheduler_instance is None:
+                _scheduler_instance = ImageScheduler(
+                    max_workers=Config.IMAGE_SCHEDULER_MAX_WORKERS,
+                    default_provider_limit=Config.IMAGE_PROVIDER_MAX_CONCURRENT
+                )
+    return _scheduler_instance
@@ -0,0 +1,360 @@
+"""
+历史记录存储管理
+
+后台线程定期检查 history/ 的磁盘占用：
+- 孤立任务目录（没有关联历史记录）超过宽限期后移入 .trash 删除
+- 总占用超过配额时，按最近查看时间从旧到新清理原图，保留缩略图，
+  并在历史记录中记录被清理的原图（storage.evicted_originals），/api/images 据此返回缩略图
+- 回收不再被任何任务目录引用的图片 blob（.blobs）
+- 汇总原图、缩略图、记录文件和内部目录（.cache 等）的占用，供运维查看；
+  多个任务共享的图片（同一 blob 的硬链接）只计算一次
+
+最近查看时间由 /api/images 更新，定期写入 history/.storage_state.json。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from backend.config import Config
+from backend.services.blob_store import BlobStore
+from backend.services.history import HistoryService, RecordStatus, get_history_service
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def _dir_size(path: str) -> int:
+    """目录（递归）中文件占用的字节数"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class StorageManager:
+    """history/ 目录的配额和清理管理"""
+
+    STATE_FILENAME = ".storage_state.json"
+
+    def __init__(
+        self,
+        history_service: HistoryService,
+        quota_bytes: int,
+        orphan_grace_seconds: float,
+        interval_seconds: float,
+        evict_target_ratio: float
+    ):
+        """
+        初始化存储管理
+
+        Args:
+            history_service: 历史记录服务
+            quota_bytes: history/ 的总占用上限（0 表示不限制，不清理原图）
+            orphan_grace_seconds: 孤立任务目录最后修改后保留多久再删除
+            interval_seconds: 后台检查间隔
+            evict_target_ratio: 超过配额时清理到配额的多少比例以下
+        """
+        self.history = history_service
+        self.root_dir = history_service.history_dir
+        self.quota_bytes = quota_bytes
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.interval_seconds = interval_seconds
+        self.evict_target_ratio = evict_target_ratio
+
+        self._lock = threading.Lock()
+        # 同一时间只运行一次检查
+        self._run_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # task_id -> 最近查看时间
+        self._last_viewed: Dict[str, float] = self._load_state()
+        self._dirty = False
+
+        self._usage: Dict[str, Any] = {}
+        self.runs = 0
+        self.orphans_removed = 0
+        self.originals_evicted = 0
+        self.evicted_bytes = 0
+        self.last_run_at: Optional[float] = None
+        self.last_run_seconds: Optional[float] = None
+
+    # ==================== 对外接口 ====================
+
+    def start(self) -> None:
+        """启动后台检查线程（重复调用无效）"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="storage-manager", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台检查线程"""
+        self._stop.set()
+
+    def touch(self, task_id: str) -> None:
+        """记录任务图片被查看（用于 LRU 清理）"""
+        with self._lock:
+            self._last_viewed[task_id] = time.time()
+            self._dirty = True
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        执行一次检查：统计占用、清理孤立目录、超过配额时清理原图
+
+        Returns:
+            Dict: 本次检查后的统计信息
+        """
+        with self._run_lock:
+            started = time.time()
+            blob_freed = self.history.blobs.collect_garbage()
+            if blob_freed:
+                logger.info(f"🧹 回收未引用的图片 blob: {blob_freed} 字节")
+            tasks = self._measure_tasks()
+
+            orphans = self._collect_orphans(tasks)
+            tasks = [task for task in tasks if task["task_id"] not in orphans]
+
+            used = self._measure_other() + sum(task["bytes"] for task in tasks)
+            if self.quota_bytes and used > self.quota_bytes:
+                used -= self._evict(tasks, used)
+
+            self._save_state({task["task_id"] for task in tasks})
+
+            with self._lock:
+                self.runs += 1
+                self.last_run_at = started
+                self.last_run_seconds = round(time.time() - started, 3)
+                self._usage = {
+                    "used_bytes": used,
+                    "originals_bytes": sum(task["originals_bytes"] for task in tasks),
+                    "thumbnails_bytes": sum(task["thumbnails_bytes"] for task in tasks),
+                    "task_dirs": len(tasks),
+                }
+        return self.get_stats()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取磁盘占用和清理统计"""
+        with self._lock:
+            stats = {
+                "quota_bytes": self.quota_bytes,
+                "orphan_grace_seconds": self.orphan_grace_seconds,
+                "interval_seconds": self.interval_seconds,
+                "runs": self.runs,
+                "last_run_at": self.last_run_at,
+                "last_run_seconds": self.last_run_seconds,
+                "orphans_removed": self.orphans_removed,
+                "originals_evicted": self.originals_evicted,
+                "evicted_bytes": self.evicted_bytes,
+                **self._usage,
+            }
+        stats["trash"] = self.history.reaper.get_stats()
+        stats["blobs"] = self.history.blobs.get_stats()
+        stats["exports"] = self.history.exports.get_stats()
+        return stats
+
+    # ==================== 检查 ====================
+
+    def _loop(self) -> None:
+        """后台循环：启动后立即检查一次，之后按间隔检查"""
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"存储检查失败: {e}")
+            if self._stop.wait(self.interval_seconds):
+                return
+
+    def _measure_tasks(self) -> List[Dict[str, Any]]:
+        """
+        统计每个任务目录的原图、缩略图和其他文件占用
+
+        硬链接到同一 blob 的文件只在第一次出现时计入，统计的是实际磁盘占用。
+        """
+        tasks = []
+        seen_inodes = set()
+        with os.scandir(self.root_dir) as entries:
+            task_entries = [e for e in entries if not e.name.startswith('.') and e.is_dir()]
+
+        for entry in task_entries:
+            task = {
+                "task_id": entry.name,
+                "path": entry.path,
+                "originals": [],
+                "thumbnails": set(),
+                "originals_bytes": 0,
+                "thumbnails_bytes": 0,
+                "bytes": 0,
+            }
+            try:
+                task["mtime"] = entry.stat().st_mtime
+                with os.scandir(entry.path) as files:
+                    for f in files:
+                        if not f.is_file(follow_symlinks=False):
+                            continue
+                        stat = f.stat(follow_symlinks=False)
+                        inode = (stat.st_dev, stat.st_ino)
+                        size = stat.st_size if inode not in seen_inodes else 0
+                        seen_inodes.add(inode)
+                        task["bytes"] += size
+                        if not f.name.endswith(IMAGE_EXTENSIONS):
+                            continue
+                        if f.name.startswith('thumb_'):
+                            task["thumbnails"].add(f.name)
+                            task["thumbnails_bytes"] += size
+                        else:
+                            task["originals"].append((f.name, size))
+                            task["originals_bytes"] += size
+            except OSError:
+                # 目录在统计期间被删除
+                continue
+            tasks.append(task)
+        return tasks
+
+    def _measure_other(self) -> int:
+        """记录文件、索引以及 .cache 等内部目录的占用（.blobs 已通过任务目录中的硬链接计入）"""
+        total = 0
+        with os.scandir(self.root_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                    elif entry.is_dir() and entry.name.startswith('.') and entry.name != BlobStore.BLOB_DIRNAME:
+                        total += _dir_size(entry.path)
+                except OSError:
+                    pass
+        return total
+
+    def _collect_orphans(self, tasks: List[Dict[str, Any]]) -> set:
+        """删除超过宽限期的孤立任务目录，返回被删除的 task_id"""
+        removed = set()
+        cutoff = time.time() - self.orphan_grace_seconds
+        for task in tasks:
+            if task["mtime"] > cutoff or self.history.store.find_by_task_id(task["task_id"]):
+                continue
+            try:
+                blob_names = list(self.history.blobs.read_manifest(task["path"]).values())
+                if self.history.reaper.schedule(
+                    task["path"], on_removed=lambda names=blob_names: self.history.blobs.release(names)
+                ):
+                    removed.add(task["task_id"])
+                    logger.info(f"🧹 清理孤立任务目录: {task['task_id']}")
+            except Exception as e:
+                logger.warning(f"清理孤立任务目录失败: {task['task_id']}, {e}")
+
+        with self._lock:
+            self.orphans_removed += len(removed)
+        return removed
+
+    def _evict(self, tasks: List[Dict[str, Any]], used: int) -> int:
+        """
+        按最近查看时间从旧到新清理原图（保留缩略图），直到占用降到目标以下
+
+        Returns:
+            int: 释放的字节数
+        """
+        target = int(self.quota_bytes * self.evict_target_ratio)
+        with self._lock:
+            last_viewed = dict(self._last_viewed)
+        tasks = sorted(tasks, key=lambda t: last_viewed.get(t["task_id"], t["mtime"]))
+
+        freed = 0
+        for task in tasks:
+            if used - freed <= target:
+                break
+            record_id = self.history.store.find_by_task_id(task["task_id"])
+            if not record_id:
+                continue
+            entry = self.history.store.get(record_id) or {}
+            if entry.get("status") == RecordStatus.GENERATING:
+                continue
+
+            evicted = []
+            task_freed = 0
+            for filename, _ in task["originals"]:
+                # 没有缩略图的原图不清理，否则页面将无图可显示
+                if f"thumb_{filename}" not in task["thumbnails"]:
+                    continue
+                try:
+                    # 内容仍被其他任务（如复制的记录）引用时不释放空间
+                    size = self.history.blobs.unlink(os.path.join(task["path"], filename))
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.warning(f"清理原图失败: {task['task_id']}/{filename}, {e}")
+                    continue
+                evicted.append(filename)
+                task_freed += size
+
+            freed += task_freed
+            task["bytes"] -= task_freed
+            task["originals_bytes"] -= task_freed
+
+            if evicted:
+                self.history.mark_originals_evicted(record_id, evicted)
+                with self._lock:
+                    self.originals_evicted += len(evicted)
+                    self.evicted_bytes += task_freed
+                logger.info(f"🧹 存储超过配额，清理原图: {task['task_id']} ({len(evicted)} 张)")
+        return freed
+
+    # ==================== 状态持久化 ====================
+
+    def _get_state_path(self) -> str:
+        """最近查看时间的保存路径"""
+        return os.path.join(self.root_dir, self.STATE_FILENAME)
+
+    def _load_state(self) -> Dict[str, float]:
+        """读取最近查看时间"""
+        try:
+            with open(self._get_state_path(), "r", encoding="utf-8") as f:
+                return {k: float(v) for k, v in json.load(f).get("last_viewed", {}).items()}
+        except Exception:
+            return {}
+
+    def _save_state(self, task_ids: set) -> None:
+        """保存最近查看时间（只保留仍存在的任务目录）"""
+        with self._lock:
+            stale = set(self._last_viewed) - task_ids
+            if not self._dirty and not stale:
+                return
+            for task_id in stale:
+                del self._last_viewed[task_id]
+            state = {"last_viewed": dict(self._last_viewed)}
+            self._dirty = False
+
+        path = self._get_state_path()
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+
+_manager_instance = None
+_manager_lock = threading.Lock()
+
+
+def get_storage_manager() -> StorageManager:
+    """获取全局存储管理实例"""
+    global _manager_instance
+    if _manager_instance is None:
+        with _manager_lock:
+            if _manager_instance is None:
+                _manager_instance = StorageManager(
+                    get_history_service(),
+                    quota_bytes=Config.STORAGE_QUOTA_MB * 1024 * 1024,
+                    orphan_grace_seconds=Config.STORAGE_ORPHAN_GRACE_SECONDS,
+                    interval_seconds=Config.STORAGE_CHECK_INTERVAL_SECONDS,
+                    evict_target_ratio=Config.STORAGE_EVICT_TARGET_RATIO
+                )
+    return _manager_instance
@@ -0,0 +1,82 @@
+"""
+图片生成任务上下文
+
+ImageService 是进程级单例，多个任务会同时在共享调度器上运行。
+每个任务的输出目录、提示词输入、预处理好的参考图以及进度计数
+都放在独立的 TaskContext 中，显式传给每一次生成调用，
+避免任务之间通过服务实例上的共享字段互相干扰。
+"""
+
+import os
+import threading
+from typing import List, Optional
+
+from backend.services.blob_store import get_blob_store
+from backend.utils.image_compressor import PreparedImage
+
+
+class TaskContext:
+    """单个生成任务的执行上下文"""
+
+    def __init__(
+        self,
+        task_id: str,
+        task_dir: str,
+        full_outline: str = "",
+        user_topic: str = "",
+        user_images: Optional[List[PreparedImage]] = None,
+        cover_reference: Optional[PreparedImage] = None,
+        cancel_event: Optional[threading.Event] = None
+    ):
+        """
+        Args:
+            task_id: 任务 ID
+            task_dir: 任务输出目录
+            full_outline: 完整大纲文本
+            user_topic: 用户原始输入
+            user_images: 预处理好的用户参考图片列表
+            cover_reference: 预处理好的封面参考图（封面生成成功后设置）
+            cancel_event: 取消信号（由后台任务或取消接口设置）
+        """
+        self.task_id = task_id
+        self.task_dir = task_dir
+        self.full_outline = full_outline
+        self.user_topic = user_topic
+        self.user_images = user_images
+        self.cover_reference = cover_reference
+        self.cancel_event = cancel_event or threading.Event()
+
+        # 进度计数（生成线程并发更新）
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def cancelled(self) -> bool:
+        """任务是否已被取消"""
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """取消任务：尚未开始的页面不再调用服务商"""
+        self.cancel_event.set()
+
+    def record_result(self, success: bool) -> None:
+        """记录一张图片的生成结果"""
+        with self._lock:
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def get_image_url(self, filename: str) -> str:
+        """
+        获取本任务图片的访问 URL
+
+        URL 带有图片的内容版本号（?v=），浏览器可以长期缓存；
+        重新生成后版本号变化，URL 也随之变化。
+        """
+        url = f"/api/images/{self.task_id}/{filename}"
+        try:
+            return f"{url}?v={get_blob_store().get_version(os.path.join(self.task_dir, filename))}"
+        except OSError:
+            return url
@@ -0,0 +1,370 @@
+"""
+图片生成任务状态存储
+
+保存每个任务的页面、大纲、压缩后的封面/用户参考图以及生成进度，
+供重试、重新生成和 /api/task/<task_id> 使用。
+
+内存中的条目受数量和字节数上限约束，并按 TTL/LRU 淘汰。
+被淘汰的条目会写入任务目录下的紧凑文件（.task_state），
+再次访问时从该文件恢复，无需从 0.png 重新压缩封面。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.config import Config
+from backend.services.image_writer import write_file_durable
+
+logger = logging.getLogger(__name__)
+
+
+class TaskStateStore:
+    """大小受限、可落盘的任务状态存储"""
+
+    SPILL_FILENAME = ".task_state"
+
+    def __init__(self, root_dir: str, max_entries: int, max_bytes: int, ttl_seconds: float):
+        """
+        初始化任务状态存储
+
+        Args:
+            root_dir: 历史记录根目录（每个任务一个子目录）
+            max_entries: 内存中最多保留的任务数
+            max_bytes: 内存中任务状态的总大小上限（估算值，字节）
+            ttl_seconds: 任务状态多久未访问后移出内存
+        """
+        self.root_dir = root_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        # task_id -> (state, 估算大小, 最近访问时间)，按最近访问从旧到新排列
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int, float]]" = OrderedDict()
+        # 正在写盘的条目，写完之前仍可直接读取
+        self._spilling: Dict[str, Dict[str, Any]] = {}
+        self._total_bytes = 0
+
+        self.spills = 0
+        self.spill_failures = 0
+        self.reloads = 0
+        self.evictions_ttl = 0
+        self.evictions_lru = 0
+
+    # ==================== 对外接口 ====================
+
+    def create(
+        self,
+        task_id: str,
+        pages: List[Dict],
+        full_outline: str = "",
+        user_topic: str = "",
+        user_images: Optional[List[bytes]] = None
+    ) -> None:
+        """
+        创建（或覆盖）任务状态
+
+        Args:
+            task_id: 任务ID
+            pages: 页面列表
+            full_outline: 完整大纲文本
+            user_topic: 用户原始输入
+            user_images: 压缩后的用户参考图片
+        """
+        state = {
+            "pages": pages,
+            "generated": {},
+            "failed": {},
+            "cover_image": None,
+            "full_outline": full_outline,
+            "user_images": user_images,
+            "user_topic": user_topic,
+            "cancelled": False
+        }
+        with self._lock:
+            self._spilling.pop(task_id, None)
+            self._put_locked(task_id, state)
+            evicted = self._evict_locked()
+        self._spill_all(evicted)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取任务状态（内存中没有时从任务目录恢复）
+
+        返回的是快照：generated/failed 为副本，调用方不应修改。
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            Optional[Dict]: 任务状态，不存在时返回 None
+        """
+        state = self._load(task_id)
+        if state is None:
+            return None
+        with self._lock:
+            return dict(state, generated=dict(state["generated"]), failed=dict(state["failed"]))
+
+    def set_cover(self, task_id: str, cover_image: bytes) -> None:
+        """记录压缩后的封面图（供内容页和重试作为参考）"""
+        self._update(task_id, lambda state: state.__setitem__("cover_image", cover_image))
+
+    def mark_generated(self, task_id: str, index: int, filename: str) -> None:
+        """记录某页生成成功（同时清除该页的失败记录）"""
+        def apply(state):
+            state["generated"][index] = filename
+            state["failed"].pop(index, None)
+        self._update(task_id, apply)
+
+    def mark_failed(self, task_id: str, index: int, error: str) -> None:
+        """记录某页生成失败"""
+        self._update(task_id, lambda state: state["failed"].__setitem__(index, error))
+
+    def mark_cancelled(self, task_id: str) -> None:
+        """记录任务已被取消"""
+        self._update(task_id, lambda state: state.__setitem__("cancelled", True))
+
+    def discard(self, task_id: str) -> None:
+        """删除任务状态（内存和落盘文件）"""
+        with self._lock:
+            entry = self._entries.pop(task_id, None)
+            if entry is not None:
+                self._total_bytes -= entry[1]
+            self._spilling.pop(task_id, None)
+        try:
+            os.remove(self._get_spill_path(task_id))
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取任务状态存储的内存占用统计"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "spills": self.spills,
+                "spill_failures": self.spill_failures,
+                "reloads": self.reloads,
+                "evictions_ttl": self.evictions_ttl,
+                "evictions_lru": self.evictions_lru,
+            }
+
+    # ==================== 内存管理 ====================
+
+    @staticmethod
+    def _estimate_size(state: Dict[str, Any]) -> int:
+        """估算任务状态占用的内存（以二进制数据和文本长度为主）"""
+        size = len(state.get("cover_image") or b"")
+        size += sum(len(img) for img in state.get("user_images") or [])
+        size += len(state.get("full_outline") or "") + len(state.get("user_topic") or "")
+        size += sum(len(page.get("content", "")) for page in state.get("pages") or [])
+        size += sum(len(str(v)) for v in state["generated"].values())
+        size += sum(len(str(v)) for v in state["failed"].values())
+        return size
+
+    def _put_locked(self, task_id: str, state: Dict[str, Any]) -> None:
+        """放入内存并更新大小统计（调用方持有锁）"""
+        old = self._entries.pop(task_id, None)
+        if old is not None:
+            self._total_bytes -= old[1]
+        size = self._estimate_size(state)
+        self._entries[task_id] = (state, size, time.monotonic())
+        self._total_bytes += size
+
+    def _evict_locked(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        淘汰过期和超限的条目（调用方持有锁）
+
+        最近访问的条目总会保留，即使它本身超过字节上限。
+
+        Returns:
+            被淘汰的 (task_id, state) 列表，由调用方在锁外写盘
+        """
+        evicted = []
+        now = time.monotonic()
+
+        while len(self._entries) > 1:
+            task_id, (state, size, last_access) = next(iter(self._entries.items()))
+            if now - last_access > self.ttl_seconds:
+                self.evictions_ttl += 1
+            elif len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                self.evictions_lru += 1
+            else:
+                break
+            del self._entries[task_id]
+            self._total_bytes -= size
+            self._spilling[task_id] = state
+            evicted.append((task_id, state))
+
+        return evicted
+
+    def _load(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """取出任务状态并刷新访问时间，必要时从落盘文件恢复"""
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is not None:
+                self._entries[task_id] = (entry[0], entry[1], time.monotonic())
+                self._entries.move_to_end(task_id)
+                evicted = self._evict_locked()
+                state = entry[0]
+            else:
+                state = self._spilling.get(task_id)
+                evicted = []
+        self._spill_all(evicted)
+        if state is not None:
+            return state
+
+        state = self._read_spill(task_id)
+        if state is None:
+            return None
+
+        with self._lock:
+            # 读文件期间可能已被其他线程恢复或重新创建
+            entry = self._entries.get(task_id)
+            if entry is not None:
+                return entry[0]
+            self._put_locked(task_id, state)
+            self.reloads += 1
+            evicted = self._evict_locked()
+        self._spill_all(evicted)
+        logger.debug(f"任务状态已从磁盘恢复: {task_id}")
+        return state
+
+    def _update(self, task_id: str, apply) -> None:
+        """修改任务状态并重新计算大小（任务状态不存在时忽略）"""
+        state = self._load(task_id)
+        if state is None:
+            return
+        with self._lock:
+            apply(state)
+            # 修改期间该条目可能恰好被淘汰：重新放回内存，下次淘汰时写入最新内容
+            self._spilling.pop(task_id, None)
+            self._put_locked(task_id, state)
+            evicted = self._evict_locked()
+        self._spill_all(evicted)
+
+    # ==================== 落盘 ====================
+
+    def _get_spill_path(self, task_id: str) -> str:
+        """获取任务状态落盘文件路径"""
+        return os.path.join(self.root_dir, task_id, self.SPILL_FILENAME)
+
+    def _spill_all(self, evicted: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """把被淘汰的条目写入各自的任务目录"""
+        for task_id, state in evicted:
+            try:
+                if self._write_spill(task_id, state):
+                    with self._lock:
+                        self.spills += 1
+            except Exception as e:
+                logger.warning(f"任务状态写盘失败: {task_id}, {e}")
+                with self._lock:
+                    self.spill_failures += 1
+            finally:
+                with self._lock:
+                    if self._spilling.get(task_id) is state:
+                        del self._spilling[task_id]
+
+    def _write_spill(self, task_id: str, state: Dict[str, Any]) -> bool:
+        """
+        写入紧凑格式的任务状态文件
+
+        格式：第一行为紧凑 JSON（文本字段及二进制段长度），之后依次是封面和用户参考图的原始字节。
+
+        Returns:
+            bool: 是否写入（任务目录已被删除时不写入，状态直接丢弃）
+        """
+        task_dir = os.path.join(self.root_dir, task_id)
+        if not os.path.isdir(task_dir):
+            return False
+
+        with self._lock:
+            cover = state.get("cover_image")
+            user_images = list(state.get("user_images") or [])
+            header = {
+                "pages": state.get("pages", []),
+                "generated": dict(state["generated"]),
+                "failed": dict(state["failed"]),
+                "full_outline": state.get("full_outline", ""),
+                "user_topic": state.get("user_topic", ""),
+                "cancelled": state.get("cancelled", False),
+                "cover_size": len(cover) if cover is not None else None,
+                "user_image_sizes": [len(img) for img in user_images] if state.get("user_images") else None,
+            }
+
+        chunks = [json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), b"\n"]
+        if cover is not None:
+            chunks.append(cover)
+        chunks.extend(user_images)
+        write_file_durable(self._get_spill_path(task_id), b"".join(chunks))
+        return True
+
+    def _read_spill(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """读取任务状态文件，不存在或损坏时返回 None"""
+        path = self._get_spill_path(task_id)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            header_bytes, _, body = data.partition(b"\n")
+            header = json.loads(header_bytes.decode('utf-8'))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"任务状态文件损坏，已忽略: {path}, {e}")
+            return None
+
+        offset = 0
+        cover = None
+        if header.get("cover_size") is not None:
+            cover = body[offset:offset + header["cover_size"]]
+            offset += header["cover_size"]
+
+        user_images = None
+        if header.get("user_image_sizes") is not None:
+            user_images = []
+            for size in header["user_image_sizes"]:
+                user_images.append(body[offset:offset + size])
+                offset += size
+
+        # JSON 对象的键是字符串，恢复为页面索引
+        return {
+            "pages": header.get("pages", []),
+            "generated": {int(k): v for k, v in header.get("generated", {}).items()},
+            "failed": {int(k): v for k, v in header.get("failed", {}).items()},
+            "cover_image": cover,
+            "full_outline": header.get("full_outline", ""),
+            "user_images": user_images,
+            "user_topic": header.get("user_topic", ""),
+            "cancelled": header.get("cancelled", False)
+        }
+
+
+_store_instance = None
+_store_lock = threading.Lock()
+
+
+def get_task_state_store() -> TaskStateStore:
+    """获取全局任务状态存储实例（不随图片服务重置而丢失）"""
+    global _store_instance
+    if _store_instance is None:
+        with _store_lock:
+            if _store_instance is None:
+                root_dir = os.path.join(
+                    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                    "history"
+                )
+                _store_instance = TaskStateStore(
+                    root_dir,
+                    max_entries=Config.TASK_STATE_MAX_ENTRIES,
+                    max_bytes=Config.TASK_STATE_MAX_MB * 1024 * 1024,
+                    ttl_seconds=Config.TASK_STATE_TTL_SECONDS
+                )
+    return _store_instance
@@ -0,0 +1,168 @@
+"""
+共享 HTTP 连接池
+
+所有服务商客户端（文本生成、图片生成、图片下载）共用按源站（scheme://host:port）
+划分的 requests.Session，连接保持 keep-alive，避免每一页都重新进行 TCP + TLS 握手。
+
+- 每个源站的连接池大小与图片调度器的全局并发上限一致
+- 连接/读取超时可以按服务商配置（connect_timeout / read_timeout）
+- 进程级单例，不随 reset_image_service() 重建
+"""
+
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class HttpSessionPool:
+    """按源站复用的 HTTP 会话池"""
+
+    def __init__(self, pool_maxsize: int, connect_timeout: float, read_timeout: float):
+        """
+        初始化会话池
+
+        Args:
+            pool_maxsize: 每个源站保持的最大连接数
+            connect_timeout: 默认连接超时（秒）
+            read_timeout: 默认读取超时（秒）
+        """
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, requests.Session] = {}
+
+        self.session_hits = 0
+        self.session_misses = 0
+
+    @staticmethod
+    def _get_origin(url: str) -> str:
+        """提取 URL 的源站（scheme://netloc）作为会话键"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def get_session(self, url: str) -> requests.Session:
+        """
+        获取某个 URL 所属源站的共享会话（不存在时创建）
+
+        Args:
+            url: 请求地址或服务商 base_url
+
+        Returns:
+            requests.Session: 共享会话
+        """
+        origin = self._get_origin(url)
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is not None:
+                self.session_hits += 1
+                return session
+
+            self.session_misses += 1
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=self.pool_maxsize,
+                max_retries=0
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._sessions[origin] = session
+
+        logger.debug(f"创建 HTTP 会话: {origin} (pool_maxsize={self.pool_maxsize})")
+        return session
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        **kwargs: Any
+    ) -> requests.Response:
+        """
+        通过共享会话发送请求
+
+        Args:
+            method: HTTP 方法
+            url: 请求地址
+            connect_timeout: 连接超时（秒），为空时使用默认值
+            read_timeout: 读取超时（秒），为空时使用默认值
+            **kwargs: 传给 requests 的其他参数（headers、json 等）
+
+        Returns:
+            requests.Response: 响应
+        """
+        timeout: Tuple[float, float] = (
+            connect_timeout or self.connect_timeout,
+            read_timeout or self.read_timeout
+        )
+        return self.get_session(url).request(method, url, timeout=timeout, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        """发送 POST 请求（参数同 request）"""
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        """发送 GET 请求（参数同 request）"""
+        return self.request("GET", url, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取连接池统计信息
+
+        requests 表示该源站发出的请求数，connections 表示新建的连接数，
+        两者之差即复用已有连接（keep-alive 命中）的次数。
+        """
+        with self._lock:
+            sessions = dict(self._sessions)
+            stats: Dict[str, Any] = {
+                "pool_maxsize": self.pool_maxsize,
+                "connect_timeout": self.connect_timeout,
+                "read_timeout": self.read_timeout,
+                "session_hits": self.session_hits,
+                "session_misses": self.session_misses,
+            }
+
+        origins = {}
+        for origin, session in sessions.items():
+            adapter = session.get_adapter(origin + "/")
+            requests_count = 0
+            connections = 0
+            for pool in list(adapter.poolmanager.pools.values()):
+                requests_count += getattr(pool, "num_requests", 0)
+                connections += getattr(pool, "num_connections", 0)
+            origins[origin] = {
+                "requests": requests_count,
+                "connections": connections,
+                "reused": max(requests_count - connections, 0),
+            }
+        stats["origins"] = origins
+        return stats
+
+
+_pool_instance = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool() -> HttpSessionPool:
+    """获取全局 HTTP 会话池实例"""
+    global _pool_instance
+    if _pool_instance is None:
+        with _pool_lock:
+            if _pool_instance is None:
+                _pool_instance = HttpSessionPool(
+                    pool_maxsize=Config.IMAGE_SCHEDULER_MAX_WORKERS,
+                    connect_timeout=Config.HTTP_CONNECT_TIMEOUT,
+                    read_timeout=Config.HTTP_READ_TIMEOUT
+                )
+    return _pool_instance
@@ -1,7 +1,9 @@
 """图片压缩工具"""
 import io
+import base64
+import hashlib
 from PIL import Image
-from typing import Optional
+from typing import Optional, Union
 
 
 def compress_image(
@@ -103,3 +105,57 @@ def compress_images(images: list[bytes], max_size_kb: int = 200) -> list[bytes]:
         压缩后的图片数据列表
     """
     return [compress_image(img, max_size_kb) for img in images]
+
+
+class PreparedImage:
+    """
+    预处理好的参考图片
+
+    同一张参考图（如封面）会被一个任务的所有页面复用，
+    在任务开始时压缩、编码一次，生成器直接使用这里的结果。
+    """
+
+    def __init__(self, data: bytes, mime_type: str = "image/png"):
+        """
+        Args:
+            data: 已压缩的图片数据
+            mime_type: data URI 中使用的 MIME 类型
+        """
+        self.data = data
+        self.mime_type = mime_type
+        self.base64 = base64.b64encode(data).decode('utf-8')
+        self.data_uri = f"data:{mime_type};base64,{self.base64}"
+        self.digest = hashlib.sha256(data).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def prepare_image(image_data: bytes, max_size_kb: int = 200) -> PreparedImage:
+    """
+    压缩并编码参考图片（每个任务只需调用一次）
+
+    Args:
+        image_data: 原始图片数据
+        max_size_kb: 最大文件大小（KB）
+
+    Returns:
+        PreparedImage: 包含压缩数据、base64 字符串和 data URI
+    """
+    return PreparedImage(compress_image(image_data, max_size_kb=max_size_kb))
+
+
+def as_prepared_image(image: Union[bytes, PreparedImage], max_size_kb: int = 200) -> PreparedImage:
+    """
+    将参考图片统一转换为 PreparedImage（已预处理的直接返回）
+
+    Args:
+        image: 图片数据或已预处理的图片
+        max_size_kb: 最大文件大小（KB）
+
+    Returns:
+        PreparedImage
+    """
+    if isinstance(image, PreparedImage):
+        return image
+    return prepare_image(image, max_size_kb=max_size_kb)
@@ -2,10 +2,10 @@
 import time
 import random
 import base64
-import requests
 from functools import wraps
 from typing import List, Optional, Union
-from .image_compressor import compress_image
+from .http_pool import get_http_pool
+from .image_compressor import PreparedImage, compress_image
 
 
 def retry_on_429(max_retries=3, base_delay=2):
@@ -40,7 +40,14 @@ def retry_on_429(max_retries=3, base_delay=2):
 class TextChatClient:
     """Text API 客户端封装类"""
 
-    def __init__(self, api_key: str = None, base_url: str = None, endpoint_type: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        endpoint_type: str = None,
+        connect_timeout: float = None,
+        read_timeout: float = None
+    ):
         self.api_key = api_key
         if not self.api_key:
             raise ValueError(
@@ -57,6 +64,10 @@ class TextChatClient:
             endpoint = '/' + endpoint
         self.chat_endpoint = f"{self.base_url}{endpoint}"
 
+        # HTTP 超时（秒），未配置时使用共享连接池的默认值
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
     def _encode_image_to_base64(self, image_data: bytes) -> str:
         """将图片数据编码为 base64"""
         return base64.b64encode(image_data).decode('utf-8')
@@ -71,7 +82,7 @@ class TextChatClient:
 
         Args:
             text: 文本内容
-            images: 图片列表，可以是 bytes（图片数据）或 str（URL）
+            images: 图片列表，可以是 bytes（图片数据）、PreparedImage（已预处理）或 str（URL）
 
         Returns:
             如果没有图片，返回纯文本；有图片则返回多模态内容列表
@@ -82,7 +93,10 @@ class TextChatClient:
         content = [{"type": "text", "text": text}]
 
         for img in images:
-            if isinstance(img, bytes):
+            if isinstance(img, PreparedImage):
+                # 已预处理的图片直接复用 data URL
+                image_url = img.data_uri
+            elif isinstance(img, bytes):
                 # 压缩图片到 200KB 以内
                 compressed_img = compress_image(img, max_size_kb=200)
                 # 图片数据，转为 base64 data URL
@@ -154,11 +168,12 @@ class TextChatClient:
             "Authorization": f"Bearer {self.api_key}"
         }
 
-        response = requests.post(
+        response = get_http_pool().post(
             self.chat_endpoint,
             json=payload,
             headers=headers,
-            timeout=300  # 5分钟超时
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout  # 默认5分钟超时
         )
 
         if response.status_code != 200:
@@ -259,6 +274,7 @@ def get_text_chat_client(provider_config: dict):
             - api_key: API密钥
             - base_url: API基础URL（可选）
             - endpoint_type: 自定义端点路径（可选）
+            - connect_timeout / read_timeout: HTTP 超时秒数（可选）
 
     Returns:
         GenAIClient 或 TextChatClient
@@ -272,4 +288,10 @@ def get_text_chat_client(provider_config: dict):
         from .genai_client import GenAIClient
         return GenAIClient(api_key=api_key, base_url=base_url)
     else:
-        return TextChatClient(api_key=api_key, base_url=base_url, endpoint_type=endpoint_type)
+        return TextChatClient(
+            api_key=api_key,
+            base_url=base_url,
+            endpoint_type=endpoint_type,
+            connect_timeout=provider_config.get('connect_timeout'),
+            read_timeout=provider_config.get('read_timeout')
+        )
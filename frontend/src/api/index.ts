@@ -545,35 +545,46 @@ export async function deleteHistory(recordId: string): Promise<{
 /**
  * 搜索历史记录
  *
- * 根据关键词搜索历史记录标题
+ * 根据关键词全文搜索历史记录标题和大纲内容（按相关度排序，分页返回）
  *
  * @param keyword - 搜索关键词
+ * @param page - 页码（从 1 开始）
+ * @param pageSize - 每页数量
  *
- * @returns Promise 包含匹配的历史记录列表
+ * @returns Promise 包含当前页的匹配记录和分页信息
  */
-export async function searchHistory(keyword: string): Promise<{
+export async function searchHistory(
+  keyword: string,
+  page: number = 1,
+  pageSize: number = 20
+): Promise<{
   success: boolean
   records: HistoryRecord[]
+  total: number
+  page: number
+  page_size: number
+  total_pages: number
   error?: string
 }> {
+  const empty = { records: [], total: 0, page: 1, page_size: pageSize, total_pages: 0 }
   try {
     const response = await axios.get(`${API_BASE_URL}/history/search`, {
-      params: { keyword },
+      params: { keyword, page, page_size: pageSize },
       timeout: 10000 // 10秒超时
     })
     return response.data
   } catch (error: any) {
     if (axios.isAxiosError(error)) {
       if (error.code === 'ECONNABORTED') {
-        return { success: false, records: [], error: '请求超时，请检查网络连接' }
+        return { success: false, ...empty, error: '请求超时，请检查网络连接' }
       }
       if (!error.response) {
-        return { success: false, records: [], error: '网络连接失败，请检查网络设置' }
+        return { success: false, ...empty, error: '网络连接失败，请检查网络设置' }
       }
       const errorMessage = error.response?.data?.error || error.message || '搜索历史记录失败'
-      return { success: false, records: [], error: errorMessage }
+      return { success: false, ...empty, error: errorMessage }
     }
-    return { success: false, records: [], error: '未知错误，请稍后重试' }
+    return { success: false, ...empty, error: '未知错误，请稍后重试' }
   }
 }
 
@@ -329,9 +329,8 @@ export const useGeneratorStore = defineStore('generator', {
     updateImage(index: number, newUrl: string) {
       const image = this.images.find(img => img.index === index)
       if (image) {
-        // 添加时间戳避免缓存
-        const timestamp = Date.now()
-        image.url = `${newUrl}?t=${timestamp}`
+        // 后端返回的 URL 带有内容版本号（v），重新生成后 URL 随之变化，不会命中旧缓存
+        image.url = newUrl
         image.status = 'done'
         delete image.error
       }
@@ -15,8 +15,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 def app():
     """创建测试用 Flask 应用"""
     from backend.app import create_app
-    app = create_app()
-    app.config['TESTING'] = True
+    app = create_app({'TESTING': True})
     return app
 
 
@@ -0,0 +1,84 @@
+"""
+自适应并发窗口测试：AIMD 收缩与恢复、过载错误识别
+"""
+import time
+
+from backend.services.scheduler import AdaptiveLimiter, is_overload_error
+
+
+class StatusError(Exception):
+    """携带 HTTP 状态码的异常（模拟 google-genai 的 APIError）"""
+
+    def __init__(self, code: int):
+        super().__init__(f"error {code}")
+        self.code = code
+
+
+class TestAdaptiveLimiter:
+    """并发窗口的收缩与恢复"""
+
+    def test_overload_shrinks_window(self):
+        limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=16)
+        limiter.on_overload(time.monotonic())
+        assert limiter.limit == 4
+
+    def test_overload_respects_min_limit(self):
+        limiter = AdaptiveLimiter(initial=2, min_limit=2, max_limit=16)
+        limiter.on_overload(time.monotonic())
+        assert limiter.limit == 2
+
+    def test_calls_started_before_decrease_do_not_shrink_again(self):
+        limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=16)
+        started_at = time.monotonic()
+        limiter.on_overload(started_at)
+        # 同一批在途调用陆续报告过载，只收缩一次
+        limiter.on_overload(started_at)
+        limiter.on_overload(started_at)
+        assert limiter.limit == 4
+        assert limiter.overloads == 3
+
+    def test_successes_recover_window(self):
+        limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=8)
+        limiter.on_overload(time.monotonic())
+        assert limiter.limit == 4
+
+        for _ in range(100):
+            limiter.on_success(1.0)
+        assert limiter.limit == 8
+
+    def test_window_does_not_exceed_max_limit(self):
+        limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=3)
+        for _ in range(100):
+            limiter.on_success(1.0)
+        assert limiter.limit == 3
+
+    def test_latency_degradation_pauses_growth(self):
+        limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=16, latency_tolerance=2.0)
+        limiter.on_success(1.0)
+        window = limiter.window
+        # 延迟远超基线，窗口不再增长
+        for _ in range(20):
+            limiter.on_success(50.0)
+        assert limiter.window == window
+
+
+class TestIsOverloadError:
+    """过载错误识别"""
+
+    def test_status_code_attribute(self):
+        assert is_overload_error(StatusError(429))
+        assert is_overload_error(StatusError(503))
+        assert not is_overload_error(StatusError(400))
+
+    def test_message_patterns(self):
+        assert is_overload_error(Exception("429 RESOURCE_EXHAUSTED. quota exceeded"))
+        assert is_overload_error(Exception("503 UNAVAILABLE."))
+        assert is_overload_error(Exception("OpenAI Images API 请求失败 (状态码: 503)\n错误详情: busy"))
+        assert is_overload_error(Exception("⏳ API 配额或速率限制"))
+        assert is_overload_error(Exception("The model is overloaded"))
+
+    def test_bare_numbers_and_words_are_not_overload(self):
+        assert not is_overload_error(Exception("Image size 1503x2000 is invalid"))
+        assert not is_overload_error(Exception("request id 5035 failed"))
+        assert not is_overload_error(Exception("model unavailable in this region"))
+        assert not is_overload_error(Exception("下载图片失败: HTTP 404"))
@@ -0,0 +1,98 @@
+"""
+内容寻址图片存储测试：去重、引用释放和回收
+"""
+import os
+
+import pytest
+
+from backend.services.blob_store import BlobStore
+
+
+@pytest.fixture
+def blobs(temp_history_dir):
+    """临时目录中的 blob 存储（带两个任务目录）"""
+    for task_id in ("task_a", "task_b"):
+        os.makedirs(os.path.join(temp_history_dir, task_id))
+    return BlobStore(temp_history_dir)
+
+
+def _blob_files(store: BlobStore):
+    return [
+        name
+        for _, _, files in os.walk(store.blob_dir)
+        for name in files
+        if not name.startswith('.')
+    ]
+
+
+def test_same_content_is_stored_once(blobs, temp_history_dir):
+    path_a = os.path.join(temp_history_dir, "task_a", "0.png")
+    path_b = os.path.join(temp_history_dir, "task_b", "0.png")
+
+    blob_name = blobs.save(path_a, b"same image")
+    assert blobs.save(path_b, b"same image") == blob_name
+
+    assert os.path.samefile(path_a, path_b)
+    assert os.stat(path_a).st_nlink == 3  # blob + 两个任务目录中的链接
+    assert len(_blob_files(blobs)) == 1
+    assert blobs.get_stats()["dedup_hits"] == 1
+    assert blobs.read_manifest(os.path.join(temp_history_dir, "task_a")) == {"0.png": blob_name}
+
+
+def test_unlink_releases_blob_after_last_reference(blobs, temp_history_dir):
+    path_a = os.path.join(temp_history_dir, "task_a", "0.png")
+    path_b = os.path.join(temp_history_dir, "task_b", "0.png")
+    blobs.save(path_a, b"shared")
+    blobs.save(path_b, b"shared")
+
+    # 另一个任务仍在引用，不释放空间
+    assert blobs.unlink(path_a) == 0
+    assert len(_blob_files(blobs)) == 1
+    assert blobs.read_manifest(os.path.join(temp_history_dir, "task_a")) == {}
+
+    assert blobs.unlink(path_b) == len(b"shared")
+    assert _blob_files(blobs) == []
+
+
+def test_overwrite_changes_version_and_gc_collects_old_blob(blobs, temp_history_dir):
+    path = os.path.join(temp_history_dir, "task_a", "0.png")
+    blobs.save(path, b"first")
+    first_version = blobs.get_version(path)
+
+    blobs.save(path, b"second")
+    assert blobs.get_version(path) != first_version
+    assert len(_blob_files(blobs)) == 2
+
+    # 旧内容不再被任何任务目录引用
+    assert blobs.collect_garbage() == len(b"first")
+    assert len(_blob_files(blobs)) == 1
+    with open(path, "rb") as f:
+        assert f.read() == b"second"
+
+
+def test_copy_dir_links_files_and_release(blobs, temp_history_dir):
+    src_dir = os.path.join(temp_history_dir, "task_a")
+    dst_dir = os.path.join(temp_history_dir, "task_copy")
+    blob_name = blobs.save(os.path.join(src_dir, "0.png"), b"page")
+
+    assert blobs.copy_dir(src_dir, dst_dir) == ["0.png"]
+    assert os.path.samefile(os.path.join(src_dir, "0.png"), os.path.join(dst_dir, "0.png"))
+    assert blobs.read_manifest(dst_dir) == {"0.png": blob_name}
+
+    # 删除两个任务目录后，release 回收 blob
+    for task_dir in (src_dir, dst_dir):
+        os.remove(os.path.join(task_dir, "0.png"))
+    assert blobs.release([blob_name]) == len(b"page")
+    assert _blob_files(blobs) == []
+
+
+def test_manifest_locks_do_not_grow_with_tasks(blobs, temp_history_dir):
+    for i in range(200):
+        task_dir = os.path.join(temp_history_dir, f"task_{i}")
+        os.makedirs(task_dir)
+        blobs.save(os.path.join(task_dir, "0.png"), b"page %d" % i)
+
+    assert len(blobs._dir_locks) == BlobStore.MANIFEST_LOCK_STRIPES
+    # 同一目录总是映射到同一把锁
+    path = os.path.join(temp_history_dir, "task_a")
+    assert blobs._get_dir_lock(path) is blobs._get_dir_lock(path + os.sep)
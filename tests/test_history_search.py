@@ -0,0 +1,58 @@
+"""
+历史记录全文检索测试：切词与排序
+"""
+import pytest
+
+from backend.services import history_search
+from backend.services.history_store import create_history_store
+
+
+def test_query_terms_bigrams_and_unigrams():
+    assert history_search.query_terms("穿搭") == ["穿搭"]
+    assert history_search.query_terms("秋") == ["秋"]
+    assert history_search.query_terms("iPhone") == ["ip", "ph", "ho", "on", "ne"]
+    # 重复词项只保留一次
+    assert history_search.query_terms("abab") == ["ab", "ba"]
+
+
+def test_single_ascii_characters_become_literals():
+    assert history_search.query_terms("5") == []
+    assert history_search.literal_terms("5") == ["5"]
+    assert history_search.literal_terms("iPhone 5 a") == ["5", "a"]
+    assert history_search.literal_terms("穿搭 ab") == []
+
+
+def test_match_titles_requires_all_literals():
+    titles = [("r1", "iPhone 5 评测"), ("r2", "iPhone X"), ("r3", "5 个小技巧 a")]
+    scores = history_search.match_titles(titles, ["5"])
+    assert set(scores) == {"r1", "r3"}
+    assert set(history_search.match_titles(titles, ["5", "a"])) == {"r3"}
+
+
+@pytest.fixture
+def store(temp_history_dir):
+    """写入了三条记录检索词项的 SQLite 索引存储"""
+    store = create_history_store(temp_history_dir, "sqlite")
+    documents = {
+        "r_title": ("秋季穿搭指南", ["基础款搭配"]),
+        "r_content": ("每日分享", ["秋季穿搭的三个要点", "秋季穿搭小技巧"]),
+        "r_other": ("夏日防晒", ["防晒霜怎么选"]),
+    }
+    for record_id, (title, pages) in documents.items():
+        outline = {"pages": [{"content": content} for content in pages]}
+        store.set_search_terms(record_id, history_search.extract_terms(title, outline))
+    return store
+
+
+def test_rank_requires_all_terms(store):
+    scores = history_search.rank(store, history_search.query_terms("秋季穿搭"), total_docs=3)
+    assert set(scores) == {"r_title", "r_content"}
+
+    assert history_search.rank(store, history_search.query_terms("秋季防晒"), total_docs=3) == {}
+    assert history_search.rank(store, [], total_docs=3) == {}
+
+
+def test_rank_prefers_title_hits(store):
+    scores = history_search.rank(store, history_search.query_terms("穿搭"), total_docs=3)
+    # 标题命中的权重高于正文，即使正文出现了两次
+    assert scores["r_title"] > scores["r_content"] > 0
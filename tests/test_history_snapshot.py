@@ -0,0 +1,74 @@
+"""
+历史记录索引快照测试：页码分页与游标分页
+"""
+import pytest
+
+from backend.services.history_snapshot import HistoryIndexSnapshot
+
+
+@pytest.fixture
+def snapshot():
+    """10 条记录，每 3 条共用同一个创建时间（测试同时间条目的顺序）"""
+    records = [
+        {
+            "id": f"rec_{i:02d}",
+            "created_at": f"2025-01-01T00:00:0{i // 3}",
+            "updated_at": f"2025-02-01T00:00:{i:02d}",
+            "status": "completed" if i % 2 else "draft",
+        }
+        for i in range(10)
+    ]
+    # 输入顺序不影响快照顺序
+    return HistoryIndexSnapshot(list(reversed(records[::2])) + records[1::2], generation=0, token=())
+
+
+def _walk(snapshot, sort, status=None, limit=3):
+    """按游标逐页读取全部条目"""
+    ids, after, pages = [], None, 0
+    while True:
+        page, after = snapshot.page_after(sort, after, status, limit=limit)
+        ids.extend(r["id"] for r in page)
+        pages += 1
+        if after is None:
+            return ids, pages
+
+
+def test_cursor_desc_matches_offset_pages(snapshot):
+    ids, pages = _walk(snapshot, "created_at_desc")
+    assert ids == [r["id"] for r in snapshot.page()]
+    assert ids == [r["id"] for r in snapshot.page_sorted("created_at_desc", limit=100)]
+    assert pages == 4
+    assert len(set(ids)) == 10
+
+
+def test_cursor_asc_is_reverse_of_desc(snapshot):
+    desc, _ = _walk(snapshot, "created_at_desc")
+    asc, _ = _walk(snapshot, "created_at_asc")
+    assert asc == list(reversed(desc))
+    assert asc == [r["id"] for r in snapshot.page_sorted("created_at_asc", limit=100)]
+
+
+def test_same_created_at_ties_break_by_id(snapshot):
+    ids = [r["id"] for r in snapshot.page()]
+    assert ids[:4] == ["rec_09", "rec_08", "rec_07", "rec_06"]
+
+
+def test_cursor_with_status_filter(snapshot):
+    ids, _ = _walk(snapshot, "updated_at_desc", status="completed", limit=2)
+    assert ids == ["rec_09", "rec_07", "rec_05", "rec_03", "rec_01"]
+    assert snapshot.count("completed") == 5
+
+
+def test_offset_pages_follow_cursor_order(snapshot):
+    desc, _ = _walk(snapshot, "created_at_desc")
+    pages = [
+        r["id"]
+        for offset in range(0, 10, 4)
+        for r in snapshot.page_sorted("created_at_desc", offset=offset, limit=4)
+    ]
+    assert pages == desc
+
+
+def test_fields_projection(snapshot):
+    page, _ = snapshot.page_after("created_at_desc", limit=1, fields=["id", "status"])
+    assert page == [{"id": "rec_09", "status": "completed"}]
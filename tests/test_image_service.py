@@ -0,0 +1,39 @@
+"""
+图片生成服务测试：服务商并发窗口配置
+"""
+import pytest
+
+from backend.services import image as image_module
+from backend.services.scheduler import ImageScheduler
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    """按给定服务商配置创建 ImageService（生成器和调度器为测试替身）"""
+    scheduler = ImageScheduler(max_workers=30, default_provider_limit=15)
+    monkeypatch.setattr(image_module, "get_image_scheduler", lambda: scheduler)
+    monkeypatch.setattr(image_module.ImageGeneratorFactory, "create", staticmethod(lambda *args: object()))
+
+    def make(provider_config):
+        monkeypatch.setattr(image_module.Config, "get_image_provider_config", lambda name: dict(provider_config))
+        image_module.ImageService("test_provider")
+        return scheduler.get_stats()["providers"]["test_provider"]
+
+    return make
+
+
+def test_low_concurrency_provider_stays_serial(make_service):
+    stats = make_service({"type": "image_api", "high_concurrency": False})
+    assert stats["limit"] == 1
+    assert stats["max"] == 1
+
+
+def test_high_concurrency_provider_starts_at_max(make_service):
+    stats = make_service({"type": "image_api", "high_concurrency": True})
+    assert stats["limit"] == stats["max"] == image_module.ImageService.MAX_CONCURRENT
+
+
+def test_explicit_max_concurrent_without_high_concurrency(make_service):
+    stats = make_service({"type": "image_api", "high_concurrency": False, "max_concurrent": 4})
+    assert stats["limit"] == 1
+    assert stats["max"] == 4
@@ -0,0 +1,99 @@
+"""
+图片生成调度器测试：全局上限、服务商上限和排队
+"""
+import threading
+
+import pytest
+
+from backend.services.scheduler import ImageScheduler
+
+
+class ConcurrencyProbe:
+    """记录同时在执行的调用数，调用阻塞到 release() 为止"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gate = threading.Event()
+        self.running = 0
+        self.peak = 0
+        self.order = []
+
+    def call(self, name):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.order.append(name)
+        self._gate.wait(timeout=5)
+        with self._lock:
+            self.running -= 1
+        return name
+
+    def release(self):
+        self._gate.set()
+
+
+@pytest.fixture
+def probe():
+    probe = ConcurrencyProbe()
+    yield probe
+    probe.release()
+
+
+def test_global_limit_is_shared_across_providers(probe):
+    scheduler = ImageScheduler(max_workers=3, default_provider_limit=10)
+    futures = [scheduler.submit(f"provider_{i % 2}", probe.call, i) for i in range(8)]
+
+    stats = scheduler.get_stats()
+    assert stats["in_flight"] == 3
+    assert sum(p["queued"] for p in stats["providers"].values()) == 5
+
+    probe.release()
+    assert sorted(f.result(timeout=5) for f in futures) == list(range(8))
+    assert probe.peak == 3
+
+
+def test_provider_limit_caps_in_flight_calls(probe):
+    scheduler = ImageScheduler(max_workers=10, default_provider_limit=10)
+    scheduler.configure_provider("slow", max_limit=2)
+    futures = [scheduler.submit("slow", probe.call, i) for i in range(5)]
+
+    assert scheduler.get_stats()["providers"]["slow"]["in_flight"] == 2
+    assert scheduler.get_stats()["providers"]["slow"]["queued"] == 3
+
+    probe.release()
+    for future in futures:
+        future.result(timeout=5)
+    assert probe.peak == 2
+
+
+def test_queued_calls_run_in_submit_order():
+    scheduler = ImageScheduler(max_workers=10, default_provider_limit=10)
+    scheduler.configure_provider("serial", max_limit=1)
+    order = []
+    futures = [scheduler.submit("serial", order.append, i) for i in range(5)]
+
+    for future in futures:
+        future.result(timeout=5)
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_cancelled_queued_call_is_not_run(probe):
+    scheduler = ImageScheduler(max_workers=1, default_provider_limit=1)
+    running = scheduler.submit("p", probe.call, "running")
+    queued = scheduler.submit("p", probe.call, "queued")
+
+    assert queued.cancel()
+    probe.release()
+    assert running.result(timeout=5) == "running"
+    assert probe.order == ["running"]
+
+
+def test_exceptions_are_set_on_future():
+    scheduler = ImageScheduler(max_workers=1, default_provider_limit=1)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    future = scheduler.submit("p", fail)
+    with pytest.raises(RuntimeError, match="boom"):
+        future.result(timeout=5)
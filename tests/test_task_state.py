@@ -0,0 +1,73 @@
+"""
+任务状态存储测试：淘汰落盘与恢复
+"""
+import os
+
+import pytest
+
+from backend.services.task_state import TaskStateStore
+
+
+@pytest.fixture
+def store(temp_history_dir):
+    """内存中最多保留 1 个任务的状态存储"""
+    return TaskStateStore(temp_history_dir, max_entries=1, max_bytes=10 * 1024 * 1024, ttl_seconds=3600)
+
+
+def _make_task_dir(root: str, task_id: str) -> str:
+    task_dir = os.path.join(root, task_id)
+    os.makedirs(task_dir)
+    return task_dir
+
+
+def test_evicted_state_is_spilled_and_reloaded(store, temp_history_dir, sample_pages):
+    """被淘汰的任务写入任务目录，再次访问时完整恢复"""
+    _make_task_dir(temp_history_dir, "task_a")
+    _make_task_dir(temp_history_dir, "task_b")
+
+    store.create("task_a", sample_pages, full_outline="大纲", user_topic="主题", user_images=[b"img1", b"img22"])
+    store.set_cover("task_a", b"cover-bytes")
+    store.mark_generated("task_a", 0, "0.png")
+    store.mark_failed("task_a", 2, "超时")
+
+    # 创建第二个任务时 task_a 超出数量上限，被写入磁盘
+    store.create("task_b", sample_pages)
+    assert os.path.exists(os.path.join(temp_history_dir, "task_a", TaskStateStore.SPILL_FILENAME))
+    assert store.get_stats()["spills"] == 1
+
+    state = store.get("task_a")
+    assert state["pages"] == sample_pages
+    assert state["generated"] == {0: "0.png"}
+    assert state["failed"] == {2: "超时"}
+    assert state["cover_image"] == b"cover-bytes"
+    assert state["user_images"] == [b"img1", b"img22"]
+    assert state["full_outline"] == "大纲"
+    assert state["user_topic"] == "主题"
+    assert store.get_stats()["reloads"] == 1
+
+
+def test_spill_without_task_dir_is_not_counted(store, sample_pages):
+    """任务目录不存在时不写盘，也不计入 spills"""
+    store.create("task_missing", sample_pages)
+    store.create("task_other", sample_pages)
+
+    stats = store.get_stats()
+    assert stats["spills"] == 0
+    assert stats["spill_failures"] == 0
+    assert store.get("task_missing") is None
+
+
+def test_discard_removes_memory_and_spill_file(store, temp_history_dir, sample_pages):
+    """discard 同时删除内存条目和落盘文件"""
+    _make_task_dir(temp_history_dir, "task_a")
+    _make_task_dir(temp_history_dir, "task_b")
+    store.create("task_a", sample_pages)
+    store.create("task_b", sample_pages)
+
+    store.discard("task_a")
+    store.discard("task_b")
+
+    assert not os.path.exists(os.path.join(temp_history_dir, "task_a", TaskStateStore.SPILL_FILENAME))
+    assert store.get("task_a") is None
+    assert store.get("task_b") is None
+    assert store.get_stats()["entries"] == 0
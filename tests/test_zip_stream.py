@@ -0,0 +1,48 @@
+"""
+流式 ZIP 打包测试
+"""
+import io
+import os
+import zipfile
+
+from backend.utils.zip_stream import iter_zip
+
+
+def _write(path: str, data: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_iter_zip_output_opens_with_zipfile(temp_history_dir):
+    large = os.urandom(300 * 1024)
+    entries = [
+        (_write(os.path.join(temp_history_dir, "0.png"), b"\x89PNG first page"), "page_1.png"),
+        (_write(os.path.join(temp_history_dir, "1.png"), large), "page_2.png"),
+    ]
+
+    # 小块读取，确保大文件被分成多个数据块产出
+    chunks = list(iter_zip(entries, chunk_size=64 * 1024))
+    assert len(chunks) > 2
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["page_1.png", "page_2.png"]
+        assert zf.read("page_1.png") == b"\x89PNG first page"
+        assert zf.read("page_2.png") == large
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+
+
+def test_iter_zip_skips_missing_files(temp_history_dir):
+    entries = [
+        (os.path.join(temp_history_dir, "missing.png"), "page_1.png"),
+        (_write(os.path.join(temp_history_dir, "1.png"), b"data"), "page_2.png"),
+    ]
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(iter_zip(entries)))) as zf:
+        assert zf.namelist() == ["page_2.png"]
+
+
+def test_iter_zip_empty_archive():
+    with zipfile.ZipFile(io.BytesIO(b"".join(iter_zip([])))) as zf:
+        assert zf.namelist() == []